@@ -0,0 +1,106 @@
+"""
+Compare the time taken by many small batches of uploads, each made with its
+own call to :func:`s3peat.sync_to_s3`, and each submitted as a job to one
+:class:`s3peat.S3Daemon`.
+
+Uploads go to the same local stub of the S3 API as ``upload_body.py``,
+running in a separate process. The stub answers straight away, so what's
+left is each batch's overhead: starting threads, creating sessions and
+connecting.
+
+.. code-block:: bash
+
+    python benchmarks/job_overhead.py --jobs 50 --files 10
+    python benchmarks/job_overhead.py --jobs 50 --files 10 --concurrency 8
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import s3peat  # noqa: E402
+from upload_body import StubBucket  # noqa: E402
+
+
+def sync_each(bucket, directories, concurrency):
+    """Upload each batch with a call to sync_to_s3."""
+    for directory in directories:
+        failures = s3peat.sync_to_s3(
+            directory, "bench", bucket, concurrency=concurrency, handle_signals=False
+        )
+        if failures:
+            raise RuntimeError("Failed uploading {}".format(failures))
+
+
+def daemon_jobs(bucket, directories, concurrency):
+    """Upload each batch as a job for a daemon that's already running."""
+    daemon = s3peat.S3Daemon(bucket, concurrency=concurrency)
+    daemon.start()
+    # Let the threads connect, as they would have long before in a daemon
+    daemon.submit(directories[0], "bench").wait()
+
+    start = time.perf_counter()
+    for directory in directories:
+        job = daemon.submit(directory, "bench")
+        job.wait()
+        if job.failed:
+            raise RuntimeError("Failed uploading {}".format(job.failed))
+    elapsed = time.perf_counter() - start
+    daemon.stop()
+    return elapsed
+
+
+def measure(name, func, bucket, directories, concurrency):
+    start = time.perf_counter()
+    elapsed = func(bucket, directories, concurrency)
+    elapsed = elapsed or time.perf_counter() - start
+
+    print(
+        "{:<8} {:>4} jobs {:>8.2f}s {:>8.1f}ms/job".format(
+            name, len(directories), elapsed, elapsed / len(directories) * 1000
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--jobs", type=int, default=50, help="number of batches")
+    parser.add_argument("--files", type=int, default=10, help="files per batch")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8935)
+    args = parser.parse_args()
+
+    stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), "upload_body.py")
+    server = subprocess.Popen(
+        [sys.executable, stub, "--serve", "--port", str(args.port)]
+    )
+    try:
+        time.sleep(0.5)
+        bucket = StubBucket("http://127.0.0.1:{}".format(args.port))
+        with tempfile.TemporaryDirectory() as root:
+            directories = []
+            for i in range(args.jobs):
+                directory = os.path.join(root, "job{}".format(i))
+                os.mkdir(directory)
+                for j in range(args.files):
+                    with open(
+                        os.path.join(directory, "file{}.txt".format(j)), "wb"
+                    ) as f:
+                        f.write(os.urandom(1024))
+                directories.append(directory)
+
+            measure("sync", sync_each, bucket, directories, args.concurrency)
+            measure("daemon", daemon_jobs, bucket, directories, args.concurrency)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
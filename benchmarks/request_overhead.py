@@ -0,0 +1,98 @@
+"""
+Compare the CPU used per request uploading small files through boto3's
+resource objects, the way s3peat used to, and through the low-level client
+with :class:`s3peat.S3Queue`.
+
+Uploads go to the same local stub of the S3 API as ``upload_body.py``,
+running in a separate process, so only the client side CPU time is measured.
+With files this small, that's almost all request overhead.
+
+.. code-block:: bash
+
+    python benchmarks/request_overhead.py --files 2000
+    python benchmarks/request_overhead.py --files 2000 --size 16
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import s3peat  # noqa: E402
+from upload_body import StubBucket  # noqa: E402
+
+KiB = 1024
+
+
+def upload_resource(bucket, filenames):
+    """Upload the way s3peat used to, then set the ACL in a second request."""
+    resource = bucket.get_new()
+    for filename in filenames:
+        key = "bench/" + os.path.basename(filename)
+        with open(filename, "rb") as f:
+            resource.put_object(Key=key, Body=f.read())
+        resource.Object(key).Acl().put(ACL="public-read")
+
+
+def upload_client(bucket, filenames):
+    """Upload with :class:`s3peat.S3Queue`, through the low-level client."""
+    queue = s3peat.S3Queue(
+        "bench", list(filenames), bucket, os.path.dirname(filenames[0])
+    )
+    queue.run()
+    if queue.failed:
+        raise RuntimeError("Failed uploading {}".format(queue.failed))
+
+
+def measure(name, func, bucket, filenames):
+    # Connect once first, so we're not measuring loading the models
+    func(bucket, filenames[:1])
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    func(bucket, filenames)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    print(
+        "{:<8} {:>6} files {:>8.2f}s wall {:>8.2f}s CPU {:>8.0f}us CPU/file".format(
+            name, len(filenames), wall, cpu, cpu / len(filenames) * 10**6
+        )
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=1, help="KiB per file")
+    parser.add_argument("--files", type=int, default=1000, help="number of files")
+    parser.add_argument("--port", type=int, default=8935)
+    args = parser.parse_args()
+
+    stub = os.path.join(os.path.dirname(os.path.abspath(__file__)), "upload_body.py")
+    server = subprocess.Popen(
+        [sys.executable, stub, "--serve", "--port", str(args.port)]
+    )
+    try:
+        time.sleep(0.5)
+        bucket = StubBucket("http://127.0.0.1:{}".format(args.port))
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = []
+            block = os.urandom(args.size * KiB)
+            for i in range(args.files):
+                filename = os.path.join(directory, "file{}.bin".format(i))
+                with open(filename, "wb") as f:
+                    f.write(block)
+                filenames.append(filename)
+
+            measure("resource", upload_resource, bucket, filenames)
+            measure("client", upload_client, bucket, filenames)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
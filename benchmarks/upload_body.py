@@ -0,0 +1,191 @@
+"""
+Compare the CPU used per GiB uploaded by the old ``put_object(Body=f)`` path
+and the memory mapped :class:`s3peat.MemoryBody` path.
+
+Uploads go to a local stub of the S3 API running in a separate process, which
+throws the data away, so only the client side CPU time is measured.
+
+.. code-block:: bash
+
+    python benchmarks/upload_body.py --size 1024 --files 2
+    python benchmarks/upload_body.py --size 1024 --checksum md5
+
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import botocore.config
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import s3peat  # noqa: E402
+
+MiB = 1024 * 1024
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Accept and discard S3 requests, answering just enough to succeed."""
+
+    protocol_version = "HTTP/1.1"
+
+    def _discard(self):
+        if self.headers.get("Transfer-Encoding") == "chunked":
+            while True:
+                size = int(self.rfile.readline().split(b";")[0], 16)
+                self._read(size + 2)
+                if not size:
+                    # Trailers, up to a blank line
+                    while self.rfile.readline() not in (b"\r\n", b""):
+                        pass
+                    return
+        self._read(int(self.headers.get("Content-Length") or 0))
+
+    def _read(self, size):
+        while size > 0:
+            size -= len(self.rfile.read(min(size, MiB)))
+
+    def _reply(self, body=b""):
+        self.send_response(200)
+        self.send_header("ETag", '"d41d8cd98f00b204e9800998ecf8427e"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_HEAD(self):
+        self._reply()
+
+    def do_PUT(self):
+        self._discard()
+        self._reply()
+
+    def do_POST(self):
+        self._discard()
+        if "uploads" in self.path.split("?", 1)[-1].split("&"):
+            self._reply(
+                b"<InitiateMultipartUploadResult><UploadId>stub</UploadId>"
+                b"</InitiateMultipartUploadResult>"
+            )
+        else:
+            self._reply(b"<CompleteMultipartUploadResult/>")
+
+    def log_message(self, *args):
+        pass
+
+
+class StubBucket(s3peat.S3Bucket):
+    """A :class:`s3peat.S3Bucket` talking to the stub server."""
+
+    def __init__(self, endpoint):
+        super(StubBucket, self).__init__("bench", "key", "secret")
+        self.endpoint = endpoint
+
+    def get_new(self):
+        s3 = boto3.resource(
+            "s3",
+            endpoint_url=self.endpoint,
+            region_name="us-east-1",
+            aws_access_key_id=self.key,
+            aws_secret_access_key=self.secret,
+            config=botocore.config.Config(s3={"addressing_style": "path"}),
+        )
+        return s3.Bucket(self.name)
+
+
+def upload_file_body(bucket, filenames, checksum):
+    """Upload the way s3peat used to, from the open file or a read buffer."""
+    resource = bucket.get_new()
+    for filename in filenames:
+        key = "bench/" + os.path.basename(filename)
+        with open(filename, "rb") as f:
+            if checksum:
+                data = f.read()
+                digest = s3peat.compute_checksum(checksum, data)
+                params = s3peat._checksum_params(checksum, digest)
+                resource.put_object(Key=key, Body=data, **params)
+            else:
+                resource.put_object(Key=key, Body=f)
+
+
+def upload_mapped(bucket, filenames, checksum):
+    """Upload with :class:`s3peat.S3Queue`, from memory mapped files."""
+    queue = s3peat.S3Queue(
+        "bench",
+        list(filenames),
+        bucket,
+        os.path.dirname(filenames[0]),
+        checksum=checksum,
+    )
+    queue.run()
+    if queue.failed:
+        raise RuntimeError("Failed uploading {}".format(queue.failed))
+
+
+def measure(name, func, bucket, filenames, checksum):
+    size = sum(os.path.getsize(f) for f in filenames)
+    # Warm the page cache, so we're not measuring the disk
+    for filename in filenames:
+        with open(filename, "rb") as f:
+            while f.read(16 * MiB):
+                pass
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    func(bucket, filenames, checksum)
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+    gib = size / (1024.0 * MiB)
+    print(
+        "{:<8} {:>8.2f} GiB {:>8.2f}s wall {:>8.2f}s CPU {:>8.2f}s CPU/GiB".format(
+            name, gib, wall, cpu, cpu / gib
+        )
+    )
+
+
+def serve(port):
+    ThreadingHTTPServer(("127.0.0.1", port), StubHandler).serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--size", type=int, default=1024, help="MiB per file")
+    parser.add_argument("--files", type=int, default=1, help="number of files")
+    parser.add_argument("--checksum", choices=s3peat.CHECKSUMS)
+    parser.add_argument("--port", type=int, default=8934)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port)
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, __file__, "--serve", "--port", str(args.port)]
+    )
+    try:
+        time.sleep(0.5)
+        bucket = StubBucket("http://127.0.0.1:{}".format(args.port))
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = []
+            block = os.urandom(MiB)
+            for i in range(args.files):
+                filename = os.path.join(directory, "file{}.bin".format(i))
+                with open(filename, "wb") as f:
+                    for _ in range(args.size):
+                        f.write(block)
+                filenames.append(filename)
+
+            measure("file", upload_file_body, bucket, filenames, args.checksum)
+            measure("mmap", upload_mapped, bucket, filenames, args.checksum)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -25,17 +25,26 @@ s3peat - Fast uploading directories to S3
 
 from __future__ import print_function
 
+import base64
+import hashlib
 import logging
+import mmap
 import os
 import posixpath
 import signal
+import string
 import sys
 import time
 from builtins import object, range, str
-from threading import Thread
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from queue import Queue
+from threading import Condition, Thread
 
-import boto3
-import botocore.exceptions
+from s3peat.filelist import FileList, PairList
+from s3peat.hedge import LatencyTracker, run_hedged
+from s3peat.schedule import SPREAD_SIZE, PrefixQueue, is_throttle, top_prefix
+from s3peat.snapshot import TreeSnapshot
 
 
 class S3Bucket(object):
@@ -49,26 +58,44 @@ class S3Bucket(object):
     :param key: AWS key
     :param secret: AWS secret
     :param public: Whether uploads should be public (default: ``True``)
+    :param region: AWS region the bucket is in (optional)
     :type name: str
     :type aws_key: str
     :type aws_secret: str
+    :type region: str
 
     """
 
-    def __init__(self, name, key, secret, public=True):
+    def __init__(self, name, key, secret, public=True, region=None):
         self.name = name
         self.key = key
         self.secret = secret
         self.public = public
+        self.region = region
 
-    def get_new(self):
+    def get_new(self, config=None):
         """
         Return a new S3 bucket resource with its own connection.
 
+        :param config: Client configuration, such as timeouts (optional)
+        :type config: :class:`botocore.config.Config`
+
         """
+        # boto3 is slow to import, so we leave it until we need a connection
+        import boto3
+        import botocore.exceptions
+
+        kwargs = {}
+        if config is not None:
+            kwargs["config"] = config
+        if self.region is not None:
+            kwargs["region_name"] = self.region
         try:
             s3 = boto3.resource(
-                "s3", aws_access_key_id=self.key, aws_secret_access_key=self.secret
+                "s3",
+                aws_access_key_id=self.key,
+                aws_secret_access_key=self.secret,
+                **kwargs,
             )
             bucket = s3.Bucket(self.name)
             # Check if bucket exists and we have access
@@ -88,6 +115,235 @@ class S3Bucket(object):
         return self.name
 
 
+# Checksums which can be sent with uploads, see compute_checksum
+CHECKSUMS = ("md5", "crc32c")
+
+
+def compute_checksum(algorithm, data):
+    """
+    Return the `algorithm` checksum of `data` as bytes.
+
+    ``"md5"`` uses :mod:`hashlib`, and ``"crc32c"`` needs the `crc32c
+    <https://pypi.org/project/crc32c/>`_ package. Both release the GIL while
+    hashing large buffers, so they don't hold up other upload threads.
+
+    :param algorithm: One of :data:`CHECKSUMS`
+    :param data: Bytes to checksum
+    :type algorithm: str
+    :type data: bytes
+
+    """
+    if algorithm == "md5":
+        return hashlib.md5(data).digest()
+    if algorithm == "crc32c":
+        return _crc32c()(data).to_bytes(4, "big")
+    raise ValueError("Unknown checksum {!r}".format(algorithm))
+
+
+def _crc32c():
+    """Return the crc32c function, or raise :class:`ValueError`."""
+    try:
+        import crc32c
+    except ImportError:
+        raise ValueError("crc32c checksums need the crc32c package installed.")
+    return crc32c.crc32c
+
+
+def _checksum_params(algorithm, digest):
+    """Return the ``put_object`` parameters sending `digest`."""
+    value = base64.b64encode(digest).decode("ascii")
+    if algorithm == "md5":
+        return {"ContentMD5": value}
+    return {"ChecksumCRC32C": value}
+
+
+class ByteBudget(object):
+    """
+    A limit on the number of bytes held in memory across all upload threads.
+
+    Threads call :meth:`acquire` before reading file contents into memory,
+    which blocks while that would take the total over `limit`, and
+    :meth:`release` once the memory is done with.
+
+    A single request bigger than `limit` is allowed once nothing else is
+    held, so huge files still get uploaded, one at a time.
+
+    :param limit: Most bytes to hold at once
+    :type limit: int
+
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = Condition()
+
+    def acquire(self, size):
+        """Wait until `size` bytes fit in the budget, then take them."""
+        with self._cond:
+            while self.used and self.used + size > self.limit:
+                self._cond.wait()
+            self.used += size
+
+    def release(self, size):
+        """Return `size` bytes to the budget."""
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+    def resize(self, size, new_size):
+        """
+        Change `size` bytes already taken to `new_size`, without waiting.
+
+        This is for when a file turns out to be a different size than it was
+        when the budget was taken, and can take the total over the limit.
+
+        """
+        with self._cond:
+            self.used += new_size - size
+            self._cond.notify_all()
+
+
+def _fadvise(f, advice, length=0):
+    """
+    Give the kernel `advice`, the name of a ``POSIX_FADV_*`` constant, about
+    how we'll read the open file `f`.
+
+    """
+    advice = getattr(os, advice, None)
+    if advice is None or not hasattr(os, "posix_fadvise"):
+        return
+    try:
+        os.posix_fadvise(f.fileno(), 0, length, advice)
+    except OSError:
+        # It's only advice, some filesystems won't take it
+        pass
+
+
+# Files bigger than this are uploaded in parts
+MULTIPART_THRESHOLD = 64 * 1024 * 1024
+
+# Size of uploaded parts, raised as needed to stay within MAX_PARTS
+PART_SIZE = 16 * 1024 * 1024
+
+# S3 won't take more parts than this in one upload
+MAX_PARTS = 10000
+
+# Files bigger than this are memory mapped, smaller ones are quicker to read
+MAP_SIZE = 8 * 1024 * 1024
+
+
+class MemoryBody(object):
+    """
+    A read-only file-like object over a buffer, for use as an upload body.
+
+    Reads return :class:`memoryview` slices of the buffer rather than copies,
+    and seeking back to the start when botocore retries a request is free.
+    botocore won't take a :class:`memoryview` as a body directly, so this
+    wraps one.
+
+    :param data: A bytes-like object, such as a :class:`memoryview` of an
+                 :class:`mmap.mmap`
+    :type data: bytes
+
+    """
+
+    def __init__(self, data):
+        self._view = memoryview(data)
+        self._pos = 0
+
+    def read(self, size=-1):
+        start = self._pos
+        end = len(self._view)
+        if size is not None and size >= 0:
+            end = min(start + size, end)
+        self._pos = max(end, start)
+        return self._view[start : self._pos]
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += len(self._view)
+        if offset < 0:
+            raise ValueError("Negative seek position {}".format(offset))
+        self._pos = offset
+        return self._pos
+
+    def tell(self):
+        return self._pos
+
+    def seekable(self):
+        return True
+
+    def readable(self):
+        return True
+
+    def __len__(self):
+        return len(self._view)
+
+
+@contextmanager
+def _mapped(filename, read_size=0):
+    """
+    Yield a read-only :class:`memoryview` of the contents of `filename`.
+
+    Regular files are memory mapped, so their contents are read straight from
+    the page cache as they're used. Empty files give an empty view, and
+    anything that can't be mapped, like a pipe, is read into memory instead.
+    Files of up to `read_size` bytes are read into memory in one go, which
+    is quicker than mapping and unmapping them.
+
+    """
+    with open(filename, "rb") as f:
+        if read_size and os.fstat(f.fileno()).st_size <= read_size:
+            yield memoryview(f.read())
+            return
+        try:
+            mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and special files can't be mapped
+            mapping = None
+        if mapping is None:
+            yield memoryview(f.read())
+            return
+
+    view = memoryview(mapping)
+    try:
+        yield view
+    finally:
+        view.release()
+        try:
+            mapping.close()
+        except BufferError:
+            # Something still has a slice, it'll be unmapped once that's gone
+            pass
+
+
+# Fields available to key templates, see S3Queue
+KEY_TEMPLATE_FIELDS = ("prefix", "path", "dirname", "basename", "hash", "mtime")
+
+
+def _template_fields(template):
+    """
+    Return the set of field names used by the key `template`, or raise
+    :class:`ValueError` if it uses any we don't have.
+
+    """
+    if not template:
+        return set()
+    fields = set()
+    for text, field, spec, conversion in string.Formatter().parse(template):
+        if field is None:
+            continue
+        # Allow attribute access like {mtime.year}
+        name = field.split(".")[0].split("[")[0]
+        if name not in KEY_TEMPLATE_FIELDS:
+            raise ValueError("Unknown key template field {!r}".format(field))
+        fields.add(name)
+    return fields
+
+
 class S3Queue(Thread):
     """
     Take a list of `filenames` and upload them to S3 with leading key `prefix`.
@@ -120,11 +376,100 @@ class S3Queue(Thread):
     The iterable object `filenames` shouldn't be modified or referenced by
     other threads, as that would not be thread-safe.
 
+    `filenames` may also be a :class:`~s3peat.filelist.FileList`, which holds
+    huge numbers of filenames in much less memory than a list.
+
+    If `filenames` is a :class:`queue.Queue` instead of a list, this thread
+    will keep taking filenames from it until it gets ``None``, which allows
+    several queues to share one stream of filenames. If it's a
+    :class:`~s3peat.schedule.PrefixQueue`, files that S3 throttles are put
+    back on it to try again once their prefix has backed off.
+
+    Files are memory mapped and uploaded as :class:`MemoryBody` views of the
+    mapping, so botocore sends them straight from the page cache without
+    copying them. Files bigger than the `multipart_threshold` keyword argument
+    (default: 64 MiB) are uploaded as a multipart upload, in parts of
+    `part_size` bytes (default: 16 MiB), each a slice of the same mapping.
+    Requests go straight to the low-level client, with the object's ACL sent
+    in the same request, since resource objects cost more CPU per request
+    than small files take to send.
+
+    If a `checksum` keyword argument is given, one of :data:`CHECKSUMS`, each
+    file or part is checksummed from the mapping, and the checksum is sent for
+    S3 to verify. The hex checksum of each uploaded file is kept in the
+    :attr:`~S3Queue.checksums` dict. For multipart uploads this is the
+    checksum of the part checksums, followed by ``-`` and the number of parts,
+    which is how S3 reports them too.
+
+    A `timeout` keyword argument sets the seconds to wait connecting, or for
+    each read or write on a connection. With a `hedge` keyword argument, a
+    percentile, requests slower than that percentile of those so far are
+    hedged: sent again on a fresh connection, with the first to finish used.
+    Request times are kept in a :class:`~s3peat.hedge.LatencyTracker`, which
+    can be shared between queues with the `latencies` keyword argument. The
+    number of hedged requests is kept in :attr:`~S3Queue.hedged`.
+
+    The item being uploaded is kept in :attr:`~S3Queue.current`, and the
+    multipart uploads in progress in :attr:`~S3Queue.uploads`, mapping their
+    upload IDs to keys, so they can be waited for or aborted when stopping.
+
+    Files up to `read_size` bytes (default: 8 MiB) are read into memory in
+    one go, and larger ones are memory mapped. A file that's truncated while
+    it's mapped kills the process with ``SIGBUS``, so with a `map_files`
+    keyword argument of ``False``, large files are read a part at a time
+    instead. That's what to use for files which may still be changing.
+
+    If a `listing` keyword argument is given, a
+    :class:`~s3peat.listing.ListingCache`, each key uploaded is added to it,
+    with a modified time from just before the upload started, so files
+    changed while they were being uploaded aren't taken to be up to date.
+
+    If a `budget` keyword argument is given, a :class:`ByteBudget`, items in
+    `filenames` may also be ``(filename, data)`` tuples, with `data` already
+    read ahead and counted against `budget`, which is released once it's
+    uploaded.
+
+    Keys are normally `prefix`, a ``/``, and the filename's path after
+    `strip_path`. A `key_template` keyword argument can lay them out
+    differently, as a :meth:`str.format` string using any of these fields:
+
+    * ``{prefix}`` - `prefix`
+    * ``{path}`` - the filename's path after `strip_path`, with ``/``
+      separators
+    * ``{dirname}`` and ``{basename}`` - the two halves of ``{path}``
+    * ``{hash}`` - the hex MD5 of ``{path}``, so ``{hash:.4}`` is its first
+      four characters, which spreads keys across S3's partitions
+    * ``{mtime}`` - the file's modified time as a UTC
+      :class:`~datetime.datetime`, for date partitions like
+      ``{mtime:%Y/%m/%d}``
+
+    For example, ``{prefix}/{hash:.4}/{path}``.
+
     """
 
     def __init__(self, prefix, filenames, bucket, strip_path=None, **kwargs):
         # Get the counting callback if it's set
         self.counter = kwargs.pop("counter", None)
+        self.checksum = kwargs.pop("checksum", None)
+        self.budget = kwargs.pop("budget", None)
+        self.multipart_threshold = kwargs.pop(
+            "multipart_threshold", MULTIPART_THRESHOLD
+        )
+        self.part_size = kwargs.pop("part_size", PART_SIZE)
+        self.key_template = kwargs.pop("key_template", None)
+        self.timeout = kwargs.pop("timeout", None)
+        self.hedge = kwargs.pop("hedge", None)
+        self.latencies = kwargs.pop("latencies", None)
+        self.listing = kwargs.pop("listing", None)
+        self.read_size = kwargs.pop("read_size", MAP_SIZE)
+        self.map_files = kwargs.pop("map_files", True)
+        if self.hedge and self.latencies is None:
+            self.latencies = LatencyTracker()
+        # Fail early on templates using fields we don't have
+        self._template_fields = _template_fields(self.key_template)
+        if self.checksum:
+            # Fail early if we can't compute this checksum
+            compute_checksum(self.checksum, b"")
 
         kwargs.setdefault("name", "S3Queue.{}:{}".format(bucket, id(self)))
 
@@ -134,59 +479,376 @@ class S3Queue(Thread):
         self.prefix = (prefix or "").strip("/")
         self.filenames = filenames
         self.failed = []
+        self.checksums = {}
+        self.hedged = 0
+        self.current = None
+        self.uploads = {}
         self.bucket = bucket
         self.strip_path = strip_path
+        # Connection kept ready for hedged requests, see _request
+        self._spare = None
+        # The last directory seen and its key prefix, see _key
+        self._key_prefix = (None, None)
+        # Sent with every new object, so its access is set in the same request
+        self._params = {
+            "Bucket": bucket.name,
+            "ACL": "public-read" if bucket.public else "authenticated-read",
+        }
 
     def run(self):
         """Run method for the threading API."""
-        bucket = self.bucket.get_new()
-        # Iterate over the filenames attempting to upload them
-        while self.filenames:
+        bucket = self._connect()
+        if self.hedge:
+            self._spare = self._connect()
+        if isinstance(self.filenames, Queue):
+            self._run_stream(bucket)
+            return
+        filenames = self.filenames
+        # Iterate over the filenames attempting to upload them, until they're
+        # replaced (see S3Uploader.stop)
+        while filenames and self.filenames is filenames:
             # We need to peek at and upload the last filename
-            self._upload(self.filenames[-1], bucket)
+            self.current = filenames[-1]
+            self._transfer(self.current, bucket)
             # We don't pop off the list until after the filename is finished
             # uploading or has failed, otherwise the program will exit early
-            self.filenames.pop()
+            filenames.pop()
+            self.current = None
+
+    def _connect(self):
+        """Return a new bucket resource, with our timeouts if we have them."""
+        if self.timeout is None:
+            return self.bucket.get_new()
+
+        import botocore.config
+
+        config = botocore.config.Config(
+            connect_timeout=self.timeout, read_timeout=self.timeout
+        )
+        return self.bucket.get_new(config)
+
+    def _request(self, bucket, call, size=0):
+        """
+        Return the result of calling `call` with `bucket`.
+
+        With :attr:`hedge` set, if the call is slower than :attr:`hedge`
+        percent of requests so far, it's made again with a spare connection,
+        and whichever finishes first wins. The spare is made before it's
+        needed, and only replaced once it's been used.
+
+        :param bucket: A boto3 S3 bucket resource
+        :param call: Makes a request with the bucket it's given
+        :param size: Size of the request body, in bytes
+        :type call: callable
+        :type size: int
+
+        """
+        if not self.hedge:
+            return call(bucket)
+
+        delay = self.latencies.threshold(self.hedge, size)
+        if delay is not None and self._spare is None:
+            self._spare = self._connect()
+        spare = self._spare
+        start = time.time()
+        result, hedged = run_hedged(lambda: call(bucket), lambda: call(spare), delay)
+        self.latencies.record(time.time() - start, size)
+        if hedged:
+            self.log.debug("Hedged a request slower than %.2fs", delay)
+            self.hedged += 1
+            # The spare may still be busy with the losing request
+            self._spare = self._connect()
+        return result
+
+    def _run_stream(self, bucket):
+        """
+        Upload filenames taken from a shared :class:`queue.Queue` until a
+        ``None`` sentinel is received.
+
+        """
+        stream = self.filenames
+        # If the filenames are replaced (see S3Uploader.stop), we're done
+        while self.filenames is stream:
+            filename = stream.get()
+            try:
+                if filename is None:
+                    break
+                if isinstance(stream, PrefixQueue):
+                    # Everything left is in prefixes that are backing off
+                    time.sleep(stream.delay(filename))
+                self.current = filename
+                self._transfer(filename, bucket)
+            finally:
+                self.current = None
+                stream.task_done()
+
+    def _item_filename(self, item):
+        """
+        Return the filename for an item from :attr:`filenames`, which may be
+        a ``(filename, data)`` tuple.
+
+        """
+        return item[0] if isinstance(item, tuple) else item
+
+    def _transfer(self, filename, bucket):
+        """
+        Handle a single item from :attr:`filenames`. Subclasses may override
+        this to do something other than uploading.
 
-    def _upload(self, filename, bucket):
+        """
+        if isinstance(filename, tuple):
+            # This file was read ahead for us
+            filename, data = filename
+            self._upload(filename, bucket, data)
+        else:
+            self._upload(filename, bucket)
+
+    def _upload(self, filename, bucket, data=None):
         """
         Upload `filename` to `bucket`.
 
         :param filename: Filename to upload
         :param bucket: A boto3 S3 bucket resource
+        :param data: Contents of `filename`, if they've been read already
         :type filename: str
         :type bucket: boto3.resources.factory.s3.Bucket
+        :type data: bytes
 
         """
+        # Bytes we're holding against the budget
+        held = len(data) if data is not None else 0
+        started = time.time()
         # Get a new key in this bucket, set its name and upload to it
         try:
             key = self._key(filename)
-            with open(filename, "rb") as f:
-                bucket.put_object(Key=key, Body=f)
-
-            # Set the access for this key
-            obj = bucket.Object(key)
-            if self.bucket.public:
-                obj.Acl().put(ACL="public-read")
+            if data is not None:
+                size = len(data)
+                self._put(bucket, key, filename, data)
             else:
-                obj.Acl().put(ACL="authenticated-read")
-        except Exception:
+                size = self._put_file(bucket, key, filename)
+        except Exception as exc:
+            if self._requeue(filename, exc):
+                self.log.debug("Throttled %r, trying again later", key)
+                return
             self.log.debug("Failed %r", key, exc_info=True)
             self.failed.append(filename)
             if self.counter:
                 self.counter(False)
         else:
             self.log.debug("Uploaded %r", key)
+            if isinstance(self.filenames, PrefixQueue):
+                self.filenames.succeeded(filename)
+            if self.listing is not None:
+                # A second early, in case it changed the second we started
+                self.listing.add(key, size, int(started) - 1)
             if self.counter:
                 self.counter()
+        finally:
+            if held and self.budget:
+                self.budget.release(held)
+
+    def _requeue(self, filename, exc):
+        """
+        Put `filename` back on a :class:`~s3peat.schedule.PrefixQueue` if
+        `exc` means it was throttled, returning ``True`` if it was.
+
+        """
+        if not isinstance(self.filenames, PrefixQueue) or not is_throttle(exc):
+            return False
+        return self.filenames.throttled(filename)
+
+    def _put_file(self, bucket, key, filename):
+        """
+        Upload the file `filename` to `key`, and return its size.
+
+        """
+        if self.map_files:
+            with _mapped(filename, self.read_size) as view:
+                self._put(bucket, key, filename, view)
+                return len(view)
+
+        with open(filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= self.multipart_threshold:
+                data = f.read()
+                self._put(bucket, key, filename, data)
+                return len(data)
+
+            # Bigger parts for huge files, so we don't go over MAX_PARTS
+            part_size = max(self.part_size, -(-size // MAX_PARTS))
+            checksum = self._put_parts(
+                bucket, key, iter(lambda: f.read(part_size), b"")
+            )
+        if self.checksum:
+            self.checksums[filename] = checksum
+        return size
+
+    def _put(self, bucket, key, filename, data):
+        """
+        Upload the bytes-like `data` to `key`, in parts if it's big enough.
+
+        """
+        size = len(data)
+        if size > self.multipart_threshold:
+            view = memoryview(data)
+            # Bigger parts for huge files, so we don't go over MAX_PARTS
+            part_size = max(self.part_size, -(-size // MAX_PARTS))
+            parts = (view[i : i + part_size] for i in range(0, size, part_size))
+            checksum = self._put_parts(bucket, key, parts)
+        else:
+            params = {}
+            if self.checksum:
+                digest = compute_checksum(self.checksum, data)
+                params = _checksum_params(self.checksum, digest)
+                checksum = digest.hex()
+
+            def put(bucket):
+                # Each attempt needs its own body, since they're read at once
+                return bucket.meta.client.put_object(
+                    Key=key, Body=MemoryBody(data), **self._params, **params
+                )
+
+            self._request(bucket, put, len(data))
+
+        if self.checksum:
+            self.checksums[filename] = checksum
+
+    def _put_parts(self, bucket, key, parts):
+        """
+        Upload the bytes-like `parts` to `key` as a multipart upload, and
+        return the combined checksum if we're using one.
+
+        `parts` may be any iterable, so parts can be made as they're needed.
+
+        """
+        client = bucket.meta.client
+        kwargs = {}
+        if self.checksum == "crc32c":
+            kwargs["ChecksumAlgorithm"] = "CRC32C"
+        upload = client.create_multipart_upload(Key=key, **self._params, **kwargs)
+        upload_id = upload["UploadId"]
+        self.uploads[upload_id] = key
+
+        uploaded = []
+        digests = []
+        try:
+            for number, part in enumerate(parts, start=1):
+                entry, digest = self._put_part(bucket, key, upload_id, number, part)
+                uploaded.append(entry)
+                digests.append(digest)
+
+            client.complete_multipart_upload(
+                Bucket=self.bucket.name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": uploaded},
+            )
+        except Exception:
+            # Don't leave the parts around costing money
+            client.abort_multipart_upload(
+                Bucket=self.bucket.name, Key=key, UploadId=upload_id
+            )
+            raise
+        finally:
+            self.uploads.pop(upload_id, None)
+
+        if self.checksum:
+            return self._combined_checksum(digests)
+
+    def _put_part(self, bucket, key, upload_id, number, part):
+        """
+        Upload the bytes-like `part` as part `number` of the multipart upload
+        `upload_id` to `key`.
+
+        Returns the part's entry for completing the upload, and its checksum
+        digest if we're using one.
+
+        """
+        params = {}
+        digest = None
+        if self.checksum:
+            digest = compute_checksum(self.checksum, part)
+            params = _checksum_params(self.checksum, digest)
+
+        def put_part(bucket):
+            return bucket.meta.client.upload_part(
+                Bucket=self.bucket.name,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                Body=MemoryBody(part),
+                **params,
+            )
+
+        result = self._request(bucket, put_part, len(part))
+        entry = {"PartNumber": number, "ETag": result["ETag"]}
+        if "ChecksumCRC32C" in params:
+            entry["ChecksumCRC32C"] = params["ChecksumCRC32C"]
+        return entry, digest
+
+    def _combined_checksum(self, digests):
+        """
+        Return the hex checksum of a multipart upload from the `digests` of
+        its parts, in order.
+
+        """
+        combined = compute_checksum(self.checksum, b"".join(digests))
+        return "{}-{}".format(combined.hex(), len(digests))
 
     def _key(self, filename):
         """
         Return a S3 key from `filename`.
 
+        Without a key template, the part of the key for the last directory
+        seen is kept, so files arriving grouped by directory only change the
+        basename. Only one is kept, so a queue of millions of files in
+        millions of directories doesn't keep them all.
+
         :param filename: A filename
         :type filename: str
 
+        """
+        if self.key_template:
+            return self._template_key(filename)
+
+        index = filename.rfind(os.path.sep) + 1
+        head = filename[:index]
+        last, key_prefix = self._key_prefix
+        if head == last:
+            return key_prefix + filename[index:]
+
+        if self.strip_path and len(self.strip_path) > len(head):
+            # The path to strip may run into the basename, so don't cache
+            return "/".join((self.prefix, self._relative(filename)))
+
+        key_prefix = "/".join((self.prefix, self._relative(head)))
+        self._key_prefix = (head, key_prefix)
+        return key_prefix + filename[index:]
+
+    def _template_key(self, filename):
+        """
+        Return a S3 key from `filename` using :attr:`key_template`.
+
+        """
+        path = self._relative(filename)
+        fields = {
+            "prefix": self.prefix,
+            "path": path,
+            "dirname": posixpath.dirname(path),
+            "basename": posixpath.basename(path),
+        }
+        if "hash" in self._template_fields:
+            fields["hash"] = hashlib.md5(os.fsencode(path)).hexdigest()
+        if "mtime" in self._template_fields:
+            mtime = os.stat(filename).st_mtime
+            fields["mtime"] = datetime.fromtimestamp(mtime, timezone.utc)
+        return self.key_template.format(**fields)
+
+    def _relative(self, filename):
+        """
+        Return `filename` relative to :attr:`strip_path`, with posix
+        separators.
+
         """
         # Remove the leading path if necessary
         if self.strip_path and filename.startswith(self.strip_path):
@@ -195,14 +857,138 @@ class S3Queue(Thread):
         # Strip the filename of leading path separators
         filename = filename.lstrip(os.path.sep)
         # Replace path separators with posix separator
-        filename = filename.replace(os.path.sep, posixpath.sep)
-        # Join it to the prefix and go!
-        return "/".join((self.prefix, filename))
+        return filename.replace(os.path.sep, posixpath.sep)
 
     def __str__(self):
         return self.name
 
 
+class S3Deleter(Thread):
+    """
+    Delete the keys under `prefix` which aren't in `keep`.
+
+    The keys under `prefix` are listed first, and if there are more than
+    `max_delete` keys to remove, nothing is deleted and :attr:`error` is set.
+    Otherwise they're removed with ``DeleteObjects`` requests of up to
+    `batch_size` keys each.
+
+    :param prefix: S3 key prefix to clean up
+    :param keep: Container of keys which should not be deleted
+    :param bucket: A :class:`S3Bucket` instance
+    :param max_delete: Most keys we're willing to delete, or ``None`` for no
+                       limit (default: ``1000``)
+    :param batch_size: Keys per ``DeleteObjects`` request (default: ``1000``)
+    :param skip: Called with each key, returning ``True`` if it must be left
+                 alone even if it's not in `keep` (optional)
+    :type prefix: str
+    :type keep: set
+    :type bucket: :class:`S3Bucket`
+    :type max_delete: int
+    :type batch_size: int
+    :type skip: callable
+
+    Keys which couldn't be deleted will be available in the
+    :attr:`~S3Deleter.failed` list, and :attr:`~S3Deleter.deleted` is the
+    number of keys removed.
+
+    """
+
+    def __init__(
+        self,
+        prefix,
+        keep,
+        bucket,
+        max_delete=1000,
+        batch_size=1000,
+        skip=None,
+        **kwargs,
+    ):
+        kwargs.setdefault("name", "S3Deleter.{}:{}".format(bucket, id(self)))
+
+        super(S3Deleter, self).__init__(**kwargs)
+
+        self.log = logging.getLogger(self.name)
+        self.prefix = prefix
+        self.keep = keep
+        self.bucket = bucket
+        self.max_delete = max_delete
+        self.batch_size = min(batch_size, 1000)
+        self.skip = skip
+        self.deleted = 0
+        self.failed = []
+        self.error = None
+
+    def run(self):
+        """Run method for the threading API."""
+        try:
+            client = self.bucket.get_new().meta.client
+            stale = list(self._stale(client))
+        except Exception as exc:
+            self.log.debug("Failed listing %r", self.prefix, exc_info=True)
+            self.error = "Could not list {!r}: {}".format(self.prefix, exc)
+            return
+
+        if self.max_delete is not None and len(stale) > self.max_delete:
+            self.error = (
+                "Refusing to delete {} keys, more than the limit of {}.".format(
+                    len(stale), self.max_delete
+                )
+            )
+            return
+
+        for i in range(0, len(stale), self.batch_size):
+            self._delete_batch(client, stale[i : i + self.batch_size])
+
+    def _stale(self, client):
+        """Yield the keys under :attr:`prefix` that aren't in :attr:`keep`."""
+        paginator = client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket.name, Prefix=self.prefix):
+            for obj in page.get("Contents", []):
+                if obj["Key"] in self.keep:
+                    continue
+                if self.skip and self.skip(obj["Key"]):
+                    continue
+                yield obj["Key"]
+
+    def _delete_batch(self, client, keys):
+        """Delete a batch of `keys` in a single request."""
+        try:
+            response = client.delete_objects(
+                Bucket=self.bucket.name,
+                Delete={"Objects": [{"Key": key} for key in keys], "Quiet": True},
+            )
+        except Exception:
+            self.log.debug("Failed deleting %d keys", len(keys), exc_info=True)
+            self.failed.extend(keys)
+            return
+
+        errors = [error["Key"] for error in response.get("Errors", [])]
+        self.failed.extend(errors)
+        self.deleted += len(keys) - len(errors)
+        self.log.debug("Deleted %d keys", len(keys) - len(errors))
+
+    def __str__(self):
+        return self.name
+
+
+def _queued(stream):
+    """
+    Return the items waiting on `stream`, a :class:`queue.Queue`, without
+    taking them off it.
+
+    """
+    # We may have interrupted this thread while it held the lock, so don't
+    # wait forever for it
+    locked = stream.mutex.acquire(timeout=1)
+    try:
+        if isinstance(stream, PrefixQueue):
+            return stream.items()
+        return [item for item in stream.queue if item is not None]
+    finally:
+        if locked:
+            stream.mutex.release()
+
+
 class S3Uploader(object):
     """
     Runs a set of parallel uploads.
@@ -214,6 +1000,49 @@ class S3Uploader(object):
     :param include: List of filename regexes to include (optional)
     :param concurrency: Number of concurrent uploads to use (default: 1)
     :param output: File or stream to output progress to (optional)
+    :param files_from: Filename, ``'-'`` for stdin, or a binary file object
+                       listing the paths to upload (optional)
+    :param delete: Delete keys under `prefix` with no matching file (default:
+                   ``False``)
+    :param max_delete: Most keys `delete` may remove, or ``None`` for no limit
+                       (default: ``1000``)
+    :param dedup: Upload files with identical content once, and copy the rest
+                  server-side (default: ``False``)
+    :param checksum: Checksum to send with each upload for S3 to verify, one
+                     of :data:`CHECKSUMS` (optional)
+    :param max_in_flight: Most bytes of file contents to hold in memory at
+                          once, across all threads (optional)
+    :param read_ahead_size: Largest file to read ahead into memory, in bytes
+                            (default: 8 MiB)
+    :param multipart_threshold: Files larger than this are uploaded in parts
+                                (default: 64 MiB)
+    :param part_size: Size of uploaded parts, in bytes (default: 16 MiB)
+    :param key_template: Format string for keys, see :class:`S3Queue`
+                         (optional)
+    :param spread_prefixes: Spread uploads across key prefixes, backing off
+                            throttled prefixes (default: ``False``)
+    :param timeout: Seconds to wait connecting, or for each read or write on
+                    a connection, before giving up on a request (optional)
+    :param hedge: Percentile of request times after which a slow request is
+                  sent again on a fresh connection (optional)
+    :param drain_timeout: Seconds to let uploads in progress finish when
+                          stopping (default: 30)
+    :param checkpoint: File to write the files not uploaded to when stopping
+                       (optional)
+    :param snapshot: File to keep a :class:`~s3peat.snapshot.TreeSnapshot`
+                     of `directory` in between runs (optional)
+    :param inventory: Path to the ``manifest.json`` of a downloaded S3
+                      Inventory of `bucket`, used to skip files already
+                      uploaded (optional)
+    :param listing_cache: File to keep a :class:`~s3peat.listing.ListingCache`
+                          of `prefix` in between runs, used to skip files
+                          already uploaded (optional)
+    :param listing_ttl: Seconds to use a cached listing for before listing
+                        again (default: one day)
+    :param large_concurrency: Number of concurrent uploads to use for large
+                              files, in a lane of their own (optional)
+    :param large_file_size: Files larger than this, in bytes, go in the large
+                            file lane (default: 8 MiB)
     :type directory: str
     :type prefix: str
     :type bucket: :class:`S3Bucket`
@@ -221,9 +1050,105 @@ class S3Uploader(object):
     :type include: list
     :type concurrency: int
     :type output: file
+    :type files_from: str or file
+    :type delete: bool
+    :type max_delete: int
+    :type dedup: bool
+    :type checksum: str
+    :type max_in_flight: int
+    :type read_ahead_size: int
+
+    If `files_from` is given, `directory` isn't walked. Instead the paths are
+    read from `files_from`, separated by newlines or NUL characters, and are
+    fed to the upload threads as they're read. Relative paths are taken to be
+    relative to `directory`, and :attr:`include` and :attr:`exclude` still
+    apply.
+
+    If `delete` is ``True``, keys under `prefix` that don't match any of the
+    files found are removed while the upload runs, using an
+    :class:`S3Deleter`. It's used as :attr:`deleter`, so its results can be
+    checked once the upload is done. This can't be combined with
+    `files_from`, since we'd only know about some of the files.
+
+    If `dedup` is ``True``, files with the same contents are found using
+    :func:`s3peat.dedup.find_duplicates`. Only one of each is uploaded, and
+    the others are then copied from it server-side with ``CopyObject``. This
+    can't be combined with `files_from` either.
+
+    If `snapshot` is set, `directory` is walked using a
+    :class:`~s3peat.snapshot.TreeSnapshot` saved in that file, so directories
+    that haven't changed since the last walk aren't listed again. The
+    snapshot is saved each time the walk finishes.
+
+    If `inventory` is set, it's read into a :class:`~s3peat.index.RemoteIndex`
+    using :func:`s3peat.inventory.load_inventory`, kept as :attr:`index`.
+    Files with an object in the index of the same size, and modified no later
+    than the object, are skipped, and counted in :attr:`skipped`. Objects
+    deleted since the inventory was taken aren't uploaded again, so it should
+    be recent.
+
+    If `listing_cache` is set instead, the keys under `prefix` are kept in a
+    :class:`~s3peat.listing.ListingCache` in that file, which is used as
+    :attr:`index` the same way, and :attr:`listing`. Each top level
+    "directory" of keys is listed the first time a file is found for it, and
+    only if it was last listed more than `listing_ttl` seconds ago. Keys are
+    added to it as they're uploaded, and it's saved once the upload is done,
+    or when stopping. If `delete` removes anything, every directory is
+    listed again next time.
+
+    If `key_template` is set, it's used to compose keys as described for
+    :class:`S3Queue`. It can't be combined with `delete`, since keys laid out
+    by a template can't be matched against what's under `prefix`.
+
+    If `spread_prefixes` is ``True``, files are handed to the upload threads
+    round-robin across the top level "directories" of their keys using a
+    :class:`~s3peat.schedule.PrefixQueue`, rather than in the order they're
+    found, so the threads don't all hit one prefix. When S3 throttles a
+    prefix with ``503 SlowDown``, only that prefix backs off, and its files
+    are tried again later.
+
+    If `hedge` is set, once enough requests have been made to know how long
+    they take, any request slower than `hedge` percent of them is sent again
+    on a fresh connection, and whichever finishes first is used. Request
+    times are compared per MiB, so larger uploads get longer to finish. This
+    stops one stalled connection holding up the end of the run, at the cost
+    of a few duplicate requests. `timeout` puts a limit on stalls as well.
+
+    If `checksum` is set, the checksum of each uploaded file is sent with it,
+    so S3 rejects anything corrupted on the way. Once the upload is done, the
+    hex checksums are available in the :attr:`checksums` dict, keyed by
+    filename. MD5 checksums match the ETag S3 reports for the object.
+
+    If `large_concurrency` is set, files larger than `large_file_size` are
+    uploaded by that many threads of their own, and the `concurrency`
+    threads only upload smaller files, which they read into memory in one go
+    rather than mapping. Neither kind then waits behind the other, so many
+    small files are uploaded as fast as requests can be made while the large
+    files keep the bandwidth busy. The lanes share the same
+    `max_in_flight` budget, request times for `hedge`, and prefix backoff
+    for `spread_prefixes`. Large files aren't read ahead, so they can queue
+    up without holding up the small ones.
+
+    If `max_in_flight` is set, files are read ahead of the upload threads by a
+    separate reader, which keeps the upload threads busy on slow disks. Files
+    up to `read_ahead_size` are read into memory, while larger files are only
+    hinted to the kernel with ``posix_fadvise``. All file contents read ahead
+    are counted against a :class:`ByteBudget` of `max_in_flight` bytes, and
+    reading waits while the budget is used up. Files the upload threads map
+    themselves are left to the kernel's page cache.
+
+    When stopped by :meth:`stop`, which is what ``SIGINT`` and ``SIGTERM`` do
+    if `handle_signals` is ``True``, no more files are started and the uploads
+    in progress get `drain_timeout` seconds to finish. If `checkpoint` is set,
+    the files that weren't uploaded are written to it, relative to
+    `directory`, so it can be used as `files_from` to pick up where we left
+    off.
 
     """
 
+    # Describes what's been done to files, for progress output
+    verb = "uploaded"
+
     def __init__(
         self,
         directory,
@@ -234,6 +1159,27 @@ class S3Uploader(object):
         concurrency=1,
         output=None,
         handle_signals=True,
+        files_from=None,
+        delete=False,
+        max_delete=1000,
+        dedup=False,
+        checksum=None,
+        max_in_flight=None,
+        read_ahead_size=8 * 1024 * 1024,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=PART_SIZE,
+        key_template=None,
+        spread_prefixes=False,
+        timeout=None,
+        hedge=None,
+        drain_timeout=30.0,
+        checkpoint=None,
+        snapshot=None,
+        inventory=None,
+        listing_cache=None,
+        listing_ttl=24 * 60 * 60,
+        large_concurrency=None,
+        large_file_size=8 * 1024 * 1024,
     ):
         self.directory = directory
         self.prefix = prefix
@@ -243,125 +1189,802 @@ class S3Uploader(object):
         self.concurrency = concurrency
         self.output = output
         self.handle_signals = handle_signals
+        self.files_from = files_from
+        self.delete = delete
+        self.max_delete = max_delete
+        self.dedup = dedup
+        self.checksum = checksum
+        self.checksums = {}
+        self.max_in_flight = max_in_flight
+        self.read_ahead_size = read_ahead_size
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.key_template = key_template
+        self.spread_prefixes = spread_prefixes
+        self.timeout = timeout
+        self.hedge = hedge
+        self.drain_timeout = drain_timeout
+        self.checkpoint = checkpoint
+        self.snapshot = snapshot
+        self.inventory = inventory
+        self.listing_cache = listing_cache
+        self.listing_ttl = listing_ttl
+        self.large_concurrency = large_concurrency
+        self.large_file_size = large_file_size
+        self.index = None
+        self.listing = None
+        self.skipped = 0
+        # Shared between the queues, so they all learn how long requests take
+        self.latencies = LatencyTracker() if hedge else None
+        # Prefixes backing off, shared between the lanes' streams
+        self._backoff = {}
+        self.budget = ByteBudget(max_in_flight) if max_in_flight else None
+        self.deleter = None
         self.total = 0
         self.count = 0
         self.errors = 0
         self.queues = []
+        self.watcher = None
+        # Iterables of files not yet handed to a queue, see stop
+        self._pending = []
+        # The file taken from them which is waiting to be queued
+        self._in_hand = None
+        self._stopping = False
+        self.remaining = []
         self.log = logging.getLogger("S3Uploader")
 
     def upload(self):
         """
         Starts the uploading and returns a list of failed filenames.
 
+        """
+        if self.files_from is not None and (self.delete or self.dedup):
+            raise ValueError(
+                "Can't delete keys or find duplicates when uploading from a file list."
+            )
+        if self.delete and self.key_template:
+            raise ValueError("Can't delete keys when using a key template.")
+
+        if not self._prepare():
+            return
+
+        if self.files_from is not None:
+            self.total = 0
+            self._upload_stream(self._not_uploaded(self.iter_filenames()))
+        else:
+            # Until the files are queued, stopping leaves all of them to do, so
+            # this is here to list them again (see stop)
+            walk = self.iter_filenames()
+            self._pending.append(walk)
+
+            # Get all the files
+            filenames = self.get_filenames()
+
+            if self.delete:
+                self._start_deleter(filenames)
+
+            if self.index is not None:
+                # The deleter needs to know about these, but we don't
+                filenames = FileList(self._not_uploaded(filenames))
+
+            duplicates = []
+            if self.dedup:
+                from s3peat.dedup import find_duplicates
+
+                filenames, duplicates = find_duplicates(filenames, self.concurrency)
+                self._pending.append(duplicate for original, duplicate in duplicates)
+
+            self._pending.remove(walk)
+            if self.budget or self.spread_prefixes:
+                # Upload through a shared stream, so files are read ahead or
+                # spread across prefixes
+                self._upload_stream(filenames)
+            else:
+                # Start a queue with each group of files, and wait for them
+                self._run_queues(self._lanes(filenames))
+
+            # Duplicates are copied from files uploaded above
+            if duplicates:
+                from s3peat.dedup import S3DuplicateQueue
+
+                self._pending = []
+                # Copies get the checksums of the files they're copies of
+                sources = {}
+                for queue in self.queues:
+                    sources.update(queue.checksums)
+                self._run_queues(
+                    self._split(duplicates), S3DuplicateQueue, sources=sources
+                )
+
+            if self.deleter:
+                self.deleter.join()
+                if self.listing is not None and self.deleter.deleted:
+                    # We don't know which directories they were in
+                    self.listing.expire()
+
+        return self._finish()
+
+    def watch(self, settle=1.0, interval=2.0, initial=True, watcher=None):
+        """
+        Upload new and modified files as they appear in :attr:`directory`,
+        until :meth:`stop` is called or the watcher is closed.
+
+        Files are uploaded once they've gone unchanged for `settle` seconds.
+        Changes are found using inotify where it's available, otherwise by
+        scanning the directory every `interval` seconds. The upload threads and
+        their connections are kept for as long as we're watching.
+
+        If `initial` is ``True``, the files already in the directory are
+        uploaded first.
+
+        Returns a list of failed filenames once watching stops. Keys can't be
+        deleted while watching, so :attr:`delete` must be off.
+
+        :param settle: Seconds a file must go unchanged before uploading
+        :param interval: Seconds between scans, if polling
+        :param initial: Whether to upload existing files first
+        :param watcher: A :class:`s3peat.watch.Watcher` to use (optional)
+        :type settle: float
+        :type interval: float
+        :type initial: bool
+
+        """
+        from s3peat.watch import get_watcher
+
+        if self.delete:
+            raise ValueError("Can't delete keys while watching.")
+
+        if not self._prepare():
+            return
+
+        # Start watching before looking at what's there, so nothing is missed
+        self.watcher = watcher or get_watcher(self.directory, settle, interval)
+        streams = self._start_lanes()
+
+        self.total = 0
+        if initial:
+            for filename in self._not_uploaded(self.iter_filenames()):
+                self._queue_file(streams, filename)
+
+        for filename in self.watcher:
+            if self._skip(filename):
+                continue
+            self.total += 1
+            self._output()
+            self._queue_file(streams, filename)
+
+        self._stop_stream(*streams)
+        return self._finish()
+
+    def _prepare(self):
+        """
+        Reset counts, set up signals and check we're able to upload.
+
+        Returns ``False`` if the bucket can't be accessed.
+
         """
         self.count = 0
         self.errors = 0
         self.queues = []
+        self.checksums = {}
+        self.deleter = None
+        self.watcher = None
+        self._pending = []
+        self._in_hand = None
+        self._stopping = False
+        self._backoff = {}
+        self.remaining = []
 
         if self.handle_signals:
-            # Set up the signal catcher so Ctrl+C works
+            # Set up the signal catcher so Ctrl+C and kill work
             signal.signal(signal.SIGINT, self.stop)
+            signal.signal(signal.SIGTERM, self.stop)
 
-        # Make sure the directory actually exists
-        if not os.path.exists(self.directory):
+        # Make sure the directory actually exists, if we're using one
+        if self.directory is not None and not os.path.exists(self.directory):
             raise IOError("Directory %r does not exist." % self.directory)
 
+        if self.inventory is not None and self.listing_cache is not None:
+            raise ValueError("Can't use both an inventory and a listing cache.")
+
         # Make sure the bucket is configured
         try:
-            self.bucket.get_new()
+            connection = self.bucket.get_new()
         except Exception:
             # If we can't access the bucket, there's nothing we can do
-            return
+            return False
+
+        self.skipped = 0
+        if self.inventory is not None:
+            self.index = self._load_inventory()
+        if self.listing_cache is not None:
+            self.listing = self._load_listing(connection.meta.client)
+            self.index = self.listing
+
+        return True
 
-        # Get all the files
-        filenames = self.get_filenames(split=True)
+    def _load_inventory(self):
+        """Return a :class:`~s3peat.index.RemoteIndex` of :attr:`inventory`."""
+        from s3peat.inventory import load_inventory
 
-        # Start a queue with each group of files
-        for queue in filenames:
-            queue = S3Queue(
-                self.prefix, queue, self.bucket, self.directory, counter=self.counter
+        # Only keep the keys we could be uploading to
+        prefix = "" if self.key_template else self._new_queue([])._key("")
+        index = load_inventory(self.inventory, prefix, self.bucket.name)
+        self.log.debug("Read %d keys from the inventory", len(index))
+        return index
+
+    def _load_listing(self, client):
+        """
+        Return the :class:`~s3peat.listing.ListingCache` kept in
+        :attr:`listing_cache`.
+
+        """
+        from s3peat.listing import ListingCache
+
+        prefix = "" if self.key_template else self._new_queue([])._key("")
+        listing = ListingCache(
+            self.listing_cache, client, self.bucket.name, prefix, self.listing_ttl
+        )
+        if not listing.load():
+            self.log.debug("No usable listing cache, starting a new one")
+        return listing
+
+    def _save_listing(self):
+        """Save :attr:`listing`, if we're keeping one."""
+        if self.listing is None:
+            return
+        self.log.debug(
+            "Listed %d directories, reused %d from the cache",
+            self.listing.listed,
+            self.listing.reused,
+        )
+        try:
+            # We may be stopping, having interrupted this thread using it
+            saved = self.listing.save(timeout=1)
+        except OSError:
+            self.log.debug("Failed saving the listing cache", exc_info=True)
+            return
+        if not saved:
+            print(
+                "Couldn't save the listing cache while it was in use.", file=sys.stderr
             )
-            self.queues.append(queue)
-            queue.daemon = True
-            queue.start()
 
-        # Wait for the queues to all finish
-        failures = []
-        while True:
-            remaining = sum([len(q.filenames) for q in self.queues])
-            if not remaining:
-                break
-            time.sleep(0.1)
+    def _not_uploaded(self, filenames):
+        """
+        Yield the filenames in `filenames` which haven't been uploaded already
+        according to :attr:`index`, counting the rest in :attr:`skipped`.
+
+        """
+        if self.index is None:
+            for filename in filenames:
+                yield filename
+            return
 
+        keys = self._new_queue([])
+        for filename in filenames:
+            try:
+                stat = os.stat(filename)
+                remote = self.index.get(keys._key(filename))
+            except OSError:
+                # Let the upload thread try, so the failure gets counted
+                remote = None
+            if (
+                remote is not None
+                and remote[0] == stat.st_size
+                and remote[1] >= int(stat.st_mtime)
+            ):
+                self.skipped += 1
+                self.total -= 1
+                continue
+            yield filename
+
+    def _finish(self):
+        """Return the failed filenames from all the queues."""
+        failures = []
         for queue in self.queues:
             failures.extend(queue.failed)
+            self.checksums.update(getattr(queue, "checksums", {}))
+        self._save_listing()
 
         if self.output:
             self.output.write("\n")
 
         return failures
 
+    def _start_deleter(self, filenames):
+        """
+        Start the :class:`S3Deleter` to remove keys not matching any of
+        `filenames`.
+
+        """
+        # A queue that never runs is the simplest way to get keys the same way
+        keys = self._new_queue([])
+        keep = set(keys._key(filename) for filename in filenames)
+        prefix = keys._key("")
+
+        def skip(key):
+            # Files filtered out aren't ours to delete, even if they exist
+            path = key[len(prefix) :].replace(posixpath.sep, os.path.sep)
+            return self._skip(os.path.join(self.directory, path))
+
+        self.deleter = S3Deleter(
+            prefix,
+            keep,
+            self.bucket,
+            max_delete=self.max_delete,
+            skip=skip if self.include or self.exclude else None,
+        )
+        self.deleter.daemon = True
+        self.deleter.start()
+
+    def _run_queues(self, groups, queue_class=None, **kwargs):
+        """
+        Start a queue for each non-empty group in `groups`, and wait for them
+        all to finish. Any `kwargs` are passed on to each queue.
+
+        """
+        queues = [
+            self._start_queue(group, queue_class, **kwargs) for group in groups if group
+        ]
+
+        while True:
+            remaining = sum([len(q.filenames) for q in queues])
+            if not remaining:
+                break
+            time.sleep(0.1)
+
+    def _new_queue(self, filenames, queue_class=None, bucket=None, **kwargs):
+        """
+        Return a new :class:`S3Queue` for `filenames`, without starting it.
+
+        It uploads to :attr:`bucket`, unless another `bucket` is given. Any
+        other `kwargs` are passed on to the queue.
+
+        """
+        queue_class = queue_class or S3Queue
+        return queue_class(
+            self.prefix,
+            filenames,
+            bucket or self.bucket,
+            self.directory,
+            counter=self.counter,
+            checksum=self.checksum,
+            budget=self.budget,
+            multipart_threshold=self.multipart_threshold,
+            part_size=self.part_size,
+            key_template=self.key_template,
+            timeout=self.timeout,
+            hedge=self.hedge,
+            latencies=self.latencies,
+            listing=self.listing,
+            read_size=self.large_file_size if self.large_concurrency else MAP_SIZE,
+            # Files we're watching may be truncated while they're mapped
+            map_files=self.watcher is None,
+            **kwargs,
+        )
+
+    def _start_queue(self, filenames, queue_class=None, **kwargs):
+        """
+        Start and return a new :class:`S3Queue` thread for `filenames`.
+
+        """
+        queue = self._new_queue(filenames, queue_class, **kwargs)
+        self.queues.append(queue)
+        queue.daemon = True
+        queue.start()
+        return queue
+
+    def _upload_stream(self, filenames):
+        """
+        Feed `filenames` to the upload threads as they're found, rather than
+        finding them all up front.
+
+        """
+        streams = self._start_lanes()
+
+        # Whatever's left of this when stopping hasn't been queued yet
+        filenames = iter(filenames)
+        self._pending.append(filenames)
+        for filename in filenames:
+            self._queue_file(streams, filename)
+        self._pending.remove(filenames)
+
+        self._stop_stream(*streams)
+
+    def _start_lanes(self):
+        """
+        Start the queues for uploading from streams, and return a list of the
+        stream for small files, and the stream for large files if we have a
+        lane for them.
+
+        """
+        streams = [self._start_stream()]
+        if self.large_concurrency:
+            # Large files aren't read ahead, so any number can wait
+            streams.append(self._start_stream(0, self.large_concurrency))
+        return streams
+
+    def _queue_file(self, streams, filename):
+        """Put `filename` on the stream for its lane out of `streams`."""
+        # Reading ahead and putting may wait, see _remaining
+        self._in_hand = filename
+        if len(streams) > 1 and self._is_large(filename):
+            streams[1].put(filename)
+        else:
+            streams[0].put(self._read_ahead(filename))
+        self._in_hand = None
+
+    def _is_large(self, filename):
+        """Return ``True`` if `filename` belongs in the large file lane."""
+        try:
+            return os.stat(filename).st_size > self.large_file_size
+        except OSError:
+            # Let the upload thread try, so the failure gets counted
+            return False
+
+    def _read_ahead(self, filename):
+        """
+        Return the item for `filename` to put on an upload stream.
+
+        If we have a :attr:`budget`, small files are read into memory now, so
+        they're ready for an upload thread as soon as one is free, and this
+        waits if the budget's used up. Larger files are left for the upload
+        thread to read, but we ask the kernel to start reading them.
+
+        """
+        if not self.budget:
+            return filename
+
+        try:
+            with open(filename, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size > self.read_ahead_size:
+                    _fadvise(f, "POSIX_FADV_WILLNEED", self.read_ahead_size)
+                    return filename
+
+                self.budget.acquire(size)
+                try:
+                    _fadvise(f, "POSIX_FADV_SEQUENTIAL")
+                    data = f.read()
+                except Exception:
+                    self.budget.release(size)
+                    raise
+        except OSError:
+            # Let the upload thread try, so the failure gets counted
+            return filename
+
+        # The file may have changed size under us
+        self.budget.resize(size, len(data))
+        return (filename, data)
+
+    def _start_stream(self, maxsize=None, concurrency=None):
+        """
+        Start `concurrency` queues sharing a stream of filenames, and return
+        the stream.
+
+        `maxsize` limits how many items may wait on the stream, which is
+        otherwise 100 per queue, and ``0`` for no limit. When spreading
+        prefixes, at least :data:`~s3peat.schedule.SPREAD_SIZE` may wait.
+        `concurrency` defaults to :attr:`concurrency`.
+
+        """
+        concurrency = concurrency or self.concurrency
+        if maxsize is None:
+            maxsize = concurrency * 100
+        if self.spread_prefixes:
+            # This needs to see many filenames to spread them out, and the
+            # budget still limits reading ahead
+            keys = self._new_queue([])
+            stream = PrefixQueue(
+                lambda item: self._schedule_prefix(keys, item),
+                maxsize=maxsize and max(maxsize, SPREAD_SIZE),
+                backoff=self._backoff,
+            )
+        else:
+            # Keep the stream bounded so we don't read far ahead of the uploads
+            stream = Queue(maxsize=maxsize)
+        for i in range(concurrency):
+            self._start_queue(stream)
+        return stream
+
+    def _schedule_prefix(self, keys, item):
+        """
+        Return the key prefix to schedule the stream `item` under, using the
+        never-run queue `keys` to work out its key.
+
+        """
+        if isinstance(item, tuple):
+            item = item[0]
+        return top_prefix(keys._key(item), keys.prefix)
+
+    def _stop_stream(self, *streams):
+        """Tell each queue on `streams` it's done, and wait for them."""
+        for stream in streams:
+            for queue in self.queues:
+                if queue.filenames is stream:
+                    stream.put(None)
+        while any(q.is_alive() for q in self.queues):
+            time.sleep(0.1)
+
     def stop(self, *args):
         """
-        Stop all the running queues.
+        Stop all the running queues, and exit.
+
+        It works by replacing all the queues' lists of files left to process,
+        so no more are started. The files in progress are given up to
+        :attr:`drain_timeout` seconds to finish, after which any multipart
+        uploads still going are aborted, so their parts aren't left behind.
 
-        It works by clearing all the queues list of files left to process,
-        which means the current files will finish.
+        The files which weren't uploaded, including those that failed, are
+        kept in :attr:`remaining`, and written to :attr:`checkpoint` if it's
+        set. If we were stopped part way through finding files, and can't
+        list the rest, the checkpoint isn't written, since resuming from it
+        would skip them. Stopping again while waiting exits straight away.
 
         """
         print("                                                 ", file=sys.stderr)
         print("Stopping...                                      ", file=sys.stderr)
+        if self._stopping:
+            sys.exit(1)
+        self._stopping = True
+
+        if self.watcher:
+            self.watcher.close()
+        items = [(queue, queue.filenames) for queue in self.queues]
         for queue in self.queues:
             queue.filenames = []
+
+        self._drain()
+        self._save_listing()
+        self.remaining, complete = self._remaining(items)
+        if not complete:
+            print(
+                "Couldn't list all the files left to upload, "
+                "so no checkpoint was written.",
+                file=sys.stderr,
+            )
+        elif self.checkpoint:
+            self._write_checkpoint(self.remaining)
         sys.exit(1)
 
+    def _drain(self):
+        """
+        Wait up to :attr:`drain_timeout` seconds for the queues to finish what
+        they're doing, then abort their multipart uploads.
+
+        """
+        deadline = time.time() + (self.drain_timeout or 0)
+        while True:
+            busy = [q for q in self.queues if q.current is not None and q.is_alive()]
+            if not busy:
+                return
+            if time.time() >= deadline:
+                break
+            time.sleep(0.1)
+
+        self.log.debug("Gave up waiting for %d queues", len(busy))
+        # Queues may be uploading to different buckets, see S3FanOut
+        clients = {}
+        for queue in busy:
+            bucket = queue.bucket
+            for upload_id, key in list(queue.uploads.items()):
+                try:
+                    if bucket.name not in clients:
+                        clients[bucket.name] = bucket.get_new().meta.client
+                    clients[bucket.name].abort_multipart_upload(
+                        Bucket=bucket.name, Key=key, UploadId=upload_id
+                    )
+                except Exception:
+                    self.log.debug("Failed aborting %r", key, exc_info=True)
+
+    def _remaining(self, items):
+        """
+        Return the filenames left over in `items`, a list of queues and their
+        :attr:`~S3Queue.filenames`, once the queues have stopped, and whether
+        that's all of them.
+
+        """
+        remaining = []
+        complete = True
+        for queue, filenames in items:
+            if isinstance(filenames, Queue):
+                filenames = _queued(filenames)
+                if queue.current is not None:
+                    filenames.append(queue.current)
+            # A list still holds the file in progress, until it's finished
+            remaining.extend(queue._item_filename(item) for item in filenames)
+            remaining.extend(queue.failed)
+
+        if self._in_hand is not None:
+            # Taken from the pending files, but stopped before it was queued
+            remaining.append(self._in_hand)
+        for filenames in self._pending:
+            try:
+                remaining.extend(filenames)
+            except ValueError:
+                # We interrupted this generator, so can't take any more from it
+                self.log.debug("Couldn't list all the remaining files")
+                complete = False
+
+        # Files are only ever in one place, except the odd one in progress
+        return list(dict.fromkeys(remaining)), complete
+
+    def _write_checkpoint(self, filenames):
+        """
+        Write `filenames` to :attr:`checkpoint` in the format `files_from`
+        reads, relative to :attr:`directory`.
+
+        """
+        if self.directory is not None:
+            filenames = [os.path.relpath(f, self.directory) for f in filenames]
+        # NUL separators, if we have to
+        sep = "\0" if any("\n" in f for f in filenames) else "\n"
+        # Replace it in one go, since we may be resuming from it
+        temp = self.checkpoint + ".tmp"
+        with open(temp, "wb") as f:
+            for filename in filenames:
+                f.write(os.fsencode(filename + sep))
+        os.replace(temp, self.checkpoint)
+        print(
+            "Wrote {} remaining files to {}".format(len(filenames), self.checkpoint),
+            file=sys.stderr,
+        )
+
     def get_filenames(self, split=False):
         """
-        Return a list of filenames to upload, filtered by :attr:`include` and
-        :attr:`exclude`, if set.
+        Return a :class:`~s3peat.filelist.FileList` of filenames to upload,
+        filtered by :attr:`include` and :attr:`exclude`, if set.
 
-        If `split` is ``True``, then this method returns a list of lists, where
-        filenames are evenly divided into :attr:`concurrency` groups.
+        If `split` is ``True``, then this method returns a list of file lists,
+        where filenames are evenly divided into :attr:`concurrency` groups.
 
         After running this method, :attr:`total` will be set to the number of
         filenames found.
 
         """
-        filenames = []
         self.total = 0
-        for path, dirs, files in os.walk(self.directory):
-            for filename in files:
-                filename = os.path.join(path, filename)
-                # Iterate over all the include regexes, determining if we
-                # should include this filename
-                if self.include:
-                    skip = True
-                    for reg in self.include:
-                        if reg.search(filename):
-                            skip = False
-                            break
-                    if skip:
-                        continue
-                # Iterate over the exclude regexes, seeing if we should skip
-                if self.exclude:
-                    skip = False
-                    for reg in self.exclude:
-                        if reg.search(filename):
-                            skip = True
-                            break
-                    if skip:
-                        continue
-                filenames.append(filename)
-                self.total += 1
+        filenames = FileList(self.iter_filenames())
 
         if split:
-            groups = [list() for i in range(self.concurrency)]
-            for i in range(len(filenames)):
-                groups[i % self.concurrency].append(filenames[i])
-            filenames = groups
+            filenames = self._split(filenames)
 
         return filenames
 
+    def _split(self, items, count=None):
+        """
+        Return `items` evenly divided into `count` lists, or
+        :attr:`concurrency` lists by default.
+
+        A :class:`~s3peat.filelist.FileList` or
+        :class:`~s3peat.filelist.PairList` is split into contiguous runs,
+        which keeps it compact.
+
+        """
+        count = count or self.concurrency
+        if isinstance(items, (FileList, PairList)):
+            return items.split(count)
+
+        groups = [list() for i in range(count)]
+        for i in range(len(items)):
+            groups[i % count].append(items[i])
+        return groups
+
+    def _lanes(self, filenames):
+        """
+        Return `filenames` split into a group for each queue, with the large
+        files split between the :attr:`large_concurrency` queues of their own
+        lane, if we have one.
+
+        """
+        if not self.large_concurrency:
+            return self._split(filenames)
+
+        small = FileList()
+        large = FileList()
+        for filename in filenames:
+            if self._is_large(filename):
+                large.append(filename)
+            else:
+                small.append(filename)
+        return self._split(small) + self._split(large, self.large_concurrency)
+
+    def iter_filenames(self):
+        """
+        Yield the filenames to upload, filtered by :attr:`include` and
+        :attr:`exclude`, if set.
+
+        Filenames come from walking :attr:`directory`, or from
+        :attr:`files_from` if it's set. Each filename yielded increments
+        :attr:`total`.
+
+        """
+        if self.files_from is None:
+            filenames = self._walk()
+        else:
+            filenames = self._read_files_from()
+
+        for filename in filenames:
+            if self._skip(filename):
+                continue
+            self.total += 1
+            yield filename
+
+    def _walk(self):
+        """Yield every filename found under :attr:`directory`."""
+        if self.snapshot is not None:
+            for filename in self._walk_snapshot():
+                yield filename
+            return
+
+        for path, dirs, files in os.walk(self.directory):
+            for filename in files:
+                yield os.path.join(path, filename)
+
+    def _walk_snapshot(self):
+        """
+        Yield every filename found under :attr:`directory`, using and then
+        updating the :attr:`snapshot`.
+
+        """
+        snapshot = TreeSnapshot(self.snapshot)
+        snapshot.load()
+        for filename in snapshot.walk(self.directory):
+            yield filename
+
+        self.log.debug(
+            "Listed %d directories, and reused %d from the snapshot",
+            snapshot.scanned,
+            snapshot.reused,
+        )
+        try:
+            snapshot.save()
+        except OSError:
+            # We'll just have to list everything next time
+            self.log.debug("Failed saving %r", self.snapshot, exc_info=True)
+
+    def _read_files_from(self):
+        """Yield every filename listed in :attr:`files_from`."""
+        if self.files_from == "-":
+            stream = getattr(sys.stdin, "buffer", sys.stdin)
+            close = False
+        elif isinstance(self.files_from, str):
+            stream = open(self.files_from, "rb")
+            close = True
+        else:
+            stream = self.files_from
+            close = False
+
+        try:
+            for filename in read_files_from(stream):
+                # Relative paths are relative to the directory we're syncing
+                yield os.path.join(self.directory, filename)
+        finally:
+            if close:
+                stream.close()
+
+    def _skip(self, filename):
+        """
+        Return ``True`` if `filename` is filtered out by :attr:`include` or
+        :attr:`exclude`.
+
+        """
+        # Iterate over all the include regexes, determining if we should
+        # include this filename
+        if self.include:
+            skip = True
+            for reg in self.include:
+                if reg.search(filename):
+                    skip = False
+                    break
+            if skip:
+                return True
+        # Iterate over the exclude regexes, seeing if we should skip
+        if self.exclude:
+            for reg in self.exclude:
+                if reg.search(filename):
+                    return True
+        return False
+
     def counter(self, error=False):
         """
         Increment :attr:`count` for each time this is called.
@@ -393,7 +2016,7 @@ class S3Uploader(object):
         # Format the count nicely with our specifier, which pads with spaces
         count = count.format(self.count)
         # Compose our whole line
-        line = count + "/" + total + " files uploaded"
+        line = count + "/" + total + " files " + self.verb
 
         # Add the error count if we have one
         if self.errors:
@@ -419,6 +2042,26 @@ def sync_to_s3(
     concurrency=1,
     output=None,
     handle_signals=True,
+    files_from=None,
+    delete=False,
+    max_delete=1000,
+    dedup=False,
+    checksum=None,
+    max_in_flight=None,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    part_size=PART_SIZE,
+    key_template=None,
+    spread_prefixes=False,
+    timeout=None,
+    hedge=None,
+    drain_timeout=30.0,
+    checkpoint=None,
+    snapshot=None,
+    inventory=None,
+    listing_cache=None,
+    listing_ttl=24 * 60 * 60,
+    large_concurrency=None,
+    large_file_size=8 * 1024 * 1024,
 ):
     """
     This is a convenience wrapper around :class:`S3Uploader`.
@@ -433,10 +2076,70 @@ def sync_to_s3(
         concurrency=concurrency,
         output=output,
         handle_signals=handle_signals,
+        files_from=files_from,
+        delete=delete,
+        max_delete=max_delete,
+        dedup=dedup,
+        checksum=checksum,
+        max_in_flight=max_in_flight,
+        multipart_threshold=multipart_threshold,
+        part_size=part_size,
+        key_template=key_template,
+        spread_prefixes=spread_prefixes,
+        timeout=timeout,
+        hedge=hedge,
+        drain_timeout=drain_timeout,
+        checkpoint=checkpoint,
+        snapshot=snapshot,
+        inventory=inventory,
+        listing_cache=listing_cache,
+        listing_ttl=listing_ttl,
+        large_concurrency=large_concurrency,
+        large_file_size=large_file_size,
     )
     return uploader.upload()
 
 
+def read_files_from(stream, chunk_size=65536):
+    """
+    Yield the paths listed in the binary file object `stream`.
+
+    Paths may be separated by newlines, or by NUL characters as produced by
+    ``find -print0`` or ``git diff -z``. If there's a NUL anywhere in the first
+    chunk read, NUL is used as the separator. Empty entries are skipped.
+
+    :param stream: A binary file object
+    :param chunk_size: Number of bytes to read at a time
+    :type stream: file
+    :type chunk_size: int
+
+    """
+    sep = None
+    buf = b""
+    while True:
+        chunk = stream.read(chunk_size)
+        if isinstance(chunk, str):
+            # Be forgiving of text streams
+            chunk = os.fsencode(chunk)
+        if sep is None and chunk:
+            sep = b"\0" if b"\0" in chunk else b"\n"
+        if not chunk:
+            break
+        buf += chunk
+        entries = buf.split(sep)
+        # The last entry may be incomplete, so keep it for the next round
+        buf = entries.pop()
+        for entry in entries:
+            entry = entry.rstrip(b"\r") if sep == b"\n" else entry
+            if entry:
+                yield os.fsdecode(entry)
+
+    if sep == b"\n":
+        buf = buf.rstrip(b"\r")
+    if buf:
+        yield os.fsdecode(buf)
+
+
 def version():
     """Get the version of s3peat package."""
     try:
@@ -453,3 +2156,45 @@ def version():
             return "0.0.0-dev"
     except Exception:
         return "0.0.0-dev"
+
+
+# Names from submodules which need the classes above, so are imported the
+# first time they're used, see __getattr__
+_SUBMODULE_NAMES = {
+    "S3ArchiveQueue": "s3peat.archive",
+    "S3ArchiveUploader": "s3peat.archive",
+    "upload_archive": "s3peat.archive",
+    "S3Copier": "s3peat.copy",
+    "S3CopyQueue": "s3peat.copy",
+    "copy_s3_to_s3": "s3peat.copy",
+    "S3Daemon": "s3peat.daemon",
+    "S3Job": "s3peat.daemon",
+    "S3Downloader": "s3peat.download",
+    "S3DownloadQueue": "s3peat.download",
+    "sync_from_s3": "s3peat.download",
+    "S3FanOut": "s3peat.fanout",
+    "sync_to_many": "s3peat.fanout",
+    "S3ObjectQueue": "s3peat.objects",
+    "S3ObjectUploader": "s3peat.objects",
+    "upload_objects": "s3peat.objects",
+    "S3PartQueue": "s3peat.stream",
+    "S3StreamUploader": "s3peat.stream",
+    "upload_stream": "s3peat.stream",
+}
+
+
+def __getattr__(name):
+    """Import names from the submodules in :data:`_SUBMODULE_NAMES` lazily."""
+    if name not in _SUBMODULE_NAMES:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    import importlib
+
+    value = getattr(importlib.import_module(_SUBMODULE_NAMES[name]), name)
+    # Only look it up once
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_SUBMODULE_NAMES))
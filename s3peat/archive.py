@@ -0,0 +1,287 @@
+"""
+Upload the files in a tar or zip archive without extracting it first.
+
+The members of the archive are uploaded as objects from memory, using
+:class:`~s3peat.objects.S3ObjectUploader`, with keys made of the prefix and
+each member's path in the archive.
+
+Tar archives, compressed or not, are read from start to finish, and can come
+from a pipe. Small members are read into memory and handed to the upload
+threads as they're found. Larger ones are uploaded in parts as they're read,
+so they don't need to fit in memory, and the archive isn't read any further
+until they're done. Zip archives can be read in any order, so each member is
+read and decompressed by the upload thread that uploads it.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat import S3Bucket, upload_archive
+
+    bucket = S3Bucket('my-bucket', AWS_KEY, AWS_SECRET)
+
+    # A list of member names will be returned if there were failures
+    failures = upload_archive('build.tar.gz', prefix='builds/42',
+        bucket=bucket, concurrency=20)
+
+"""
+
+import stat
+import sys
+import tarfile
+import zipfile
+from contextlib import contextmanager
+from threading import Event
+
+from s3peat import MULTIPART_THRESHOLD, PART_SIZE
+from s3peat.objects import S3ObjectQueue, S3ObjectUploader
+
+# Largest tar member to read into memory before handing it over
+READ_SIZE = 8 * 1024 * 1024
+
+# Size of the reads for members that aren't read all at once
+CHUNK_SIZE = 1024 * 1024
+
+
+class S3ArchiveQueue(S3ObjectQueue):
+    """
+    Take a list of ``(name, body)`` archive members and upload them to
+    `bucket`.
+
+    This works just like :class:`~s3peat.objects.S3ObjectQueue`, except each
+    body that's read in chunks is closed once it's been uploaded or has
+    failed, so the archive can move on.
+
+    """
+
+    def _transfer(self, item, bucket):
+        try:
+            self._upload_object(item, bucket)
+        finally:
+            body = item[1]
+            if hasattr(body, "close"):
+                body.close()
+
+
+class S3ArchiveUploader(S3ObjectUploader):
+    """
+    Runs a set of parallel uploads of the files in a tar or zip archive.
+
+    :param archive: Path to a tar or zip archive, or ``'-'`` for a tar
+                    archive on stdin
+    :param prefix: S3 key prefix
+    :param bucket: A :class:`~s3peat.S3Bucket` instance
+    :param include: List of member name regexes to include (optional)
+    :param exclude: List of member name regexes to exclude (optional)
+    :param concurrency: Number of concurrent uploads to use (default: 1)
+    :param output: File or stream to output progress to (optional)
+    :param checksum: Checksum to send with each upload for S3 to verify, one
+                     of :data:`~s3peat.CHECKSUMS` (optional)
+    :param multipart_threshold: Members larger than this are uploaded in
+                                parts (default: 64 MiB)
+    :param part_size: Size of uploaded parts, in bytes (default: 16 MiB)
+    :param timeout: Seconds to wait connecting, or for each read or write on
+                    a connection, before giving up on a request (optional)
+    :param hedge: Percentile of request times after which a slow request is
+                  sent again on a fresh connection (optional)
+    :type archive: str
+    :type prefix: str
+    :type bucket: :class:`~s3peat.S3Bucket`
+    :type include: list
+    :type exclude: list
+    :type concurrency: int
+    :type output: file
+
+    Only regular files are uploaded, not directories or links. The paths of
+    links which were skipped are kept in :attr:`links`. A tar hard link holds
+    its target's contents, but reading a tar archive as a stream means they're
+    gone by the time the link is found, so each one is logged as a warning.
+    `include` and `exclude` are matched against each member's path in the
+    archive, and :meth:`upload` returns a list of the paths which failed.
+
+    """
+
+    def __init__(
+        self,
+        archive,
+        prefix,
+        bucket,
+        include=None,
+        exclude=None,
+        concurrency=1,
+        output=None,
+        handle_signals=True,
+        checksum=None,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=PART_SIZE,
+        timeout=None,
+        hedge=None,
+    ):
+        super(S3ArchiveUploader, self).__init__(
+            None,
+            prefix,
+            bucket,
+            concurrency=concurrency,
+            output=output,
+            handle_signals=handle_signals,
+            checksum=checksum,
+            multipart_threshold=multipart_threshold,
+            part_size=part_size,
+            timeout=timeout,
+            hedge=hedge,
+        )
+        self.archive = archive
+        self.include = include
+        self.exclude = exclude
+        self.links = []
+
+    def upload(self):
+        """
+        Starts the uploading and returns a list of failed member names.
+
+        """
+        with self._open() as members:
+            self.objects = members
+            return super(S3ArchiveUploader, self).upload()
+
+    @contextmanager
+    def _open(self):
+        """Open :attr:`archive`, and yield an iterable of its members."""
+        if self.archive != "-" and zipfile.is_zipfile(self.archive):
+            with zipfile.ZipFile(self.archive) as archive:
+                yield self._zip_members(archive)
+            return
+
+        if self.archive == "-":
+            archive = tarfile.open(fileobj=sys.stdin.buffer, mode="r|*")
+        else:
+            archive = tarfile.open(self.archive, mode="r|*")
+        with archive:
+            yield self._tar_members(archive)
+
+    def _tar_members(self, archive):
+        """Yield ``(name, body)`` tuples for the members of a tar archive."""
+        for member in archive:
+            name = _member_name(member.name)
+            if member.islnk() or member.issym():
+                self._skip_link(name, member.islnk())
+                continue
+            if not member.isfile() or self._skip(name):
+                continue
+            f = archive.extractfile(member)
+            if member.size <= READ_SIZE:
+                yield name, f.read()
+                continue
+
+            # The archive can't move on until this member has been read
+            chunks = _MemberChunks(f)
+            yield name, chunks
+            while not self._stopping and not chunks.done.wait(0.1):
+                pass
+
+    def _zip_members(self, archive):
+        """Yield ``(name, body)`` tuples for the members of a zip archive."""
+        for info in archive.infolist():
+            name = _member_name(info.filename)
+            # Members without a file type in their mode are regular files
+            kind = stat.S_IFMT(info.external_attr >> 16)
+            if kind == stat.S_IFLNK:
+                self._skip_link(name)
+                continue
+            if info.is_dir() or kind not in (0, stat.S_IFREG):
+                continue
+            if self._skip(name):
+                continue
+            yield name, _zip_chunks(archive, info)
+
+    def _skip_link(self, name, hard=False):
+        """Note that the link `name` isn't being uploaded."""
+        if self._skip(name):
+            return
+        if hard:
+            self.log.warning("Skipping hard link %r, which isn't uploaded", name)
+        self.links.append(name)
+
+    def _new_queue(self, objects, queue_class=None):
+        return super(S3ArchiveUploader, self)._new_queue(
+            objects, queue_class or S3ArchiveQueue
+        )
+
+
+def upload_archive(
+    archive,
+    prefix,
+    bucket,
+    include=None,
+    exclude=None,
+    concurrency=1,
+    output=None,
+    handle_signals=True,
+    checksum=None,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    part_size=PART_SIZE,
+    timeout=None,
+    hedge=None,
+):
+    """
+    This is a convenience wrapper around :class:`S3ArchiveUploader`.
+
+    """
+    uploader = S3ArchiveUploader(
+        archive,
+        prefix,
+        bucket,
+        include=include,
+        exclude=exclude,
+        concurrency=concurrency,
+        output=output,
+        handle_signals=handle_signals,
+        checksum=checksum,
+        multipart_threshold=multipart_threshold,
+        part_size=part_size,
+        timeout=timeout,
+        hedge=hedge,
+    )
+    return uploader.upload()
+
+
+class _MemberChunks(object):
+    """
+    Iterate over the chunks of a tar member being read from `f`, setting
+    :attr:`done` once they've all been read or it's closed.
+
+    """
+
+    def __init__(self, f):
+        self.done = Event()
+        self._f = f
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        chunk = self._f.read(CHUNK_SIZE)
+        if not chunk:
+            self.done.set()
+            raise StopIteration
+        return chunk
+
+    def close(self):
+        self.done.set()
+
+
+def _zip_chunks(archive, info):
+    """Yield the chunks of the zip member `info`, opening it when first asked."""
+    with archive.open(info) as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _member_name(name):
+    """Return the path of an archive member, without any leading ``./``."""
+    while name.startswith("./"):
+        name = name[2:]
+    return name.lstrip("/")
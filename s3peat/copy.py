@@ -0,0 +1,428 @@
+"""
+Fast server-side copying between S3 buckets and prefixes.
+
+Objects are copied by S3 itself using ``CopyObject``, or ``UploadPartCopy``
+for large objects, so none of the data passes through the machine running
+s3peat.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat import S3Bucket, copy_s3_to_s3
+
+    staging = S3Bucket('staging-bucket', AWS_KEY, AWS_SECRET)
+    production = S3Bucket('production-bucket', AWS_KEY, AWS_SECRET)
+
+    # A list of source keys will be returned if there were failures copying
+    failures = copy_s3_to_s3(staging, 'builds/1234', production, 'current',
+        concurrency=50)
+
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from s3peat import MAX_PARTS, S3Queue, S3Uploader
+from s3peat.download import list_prefix
+
+# Objects bigger than this are copied in parts
+PART_SIZE = 256 * 1024 * 1024
+
+# CopyObject can't copy anything bigger than this in one request
+MAX_COPY_SIZE = 5 * 1024 * 1024 * 1024
+
+# What CopyObject keeps from the source, which we have to pass on ourselves
+# when copying in parts
+COPIED_HEADERS = (
+    "CacheControl",
+    "ContentDisposition",
+    "ContentEncoding",
+    "ContentLanguage",
+    "ContentType",
+    "Expires",
+    "Metadata",
+    "WebsiteRedirectLocation",
+)
+
+
+class S3CopyQueue(S3Queue):
+    """
+    Take a list of object summaries from `source` and copy them to `bucket`
+    with leading key `prefix`.
+
+    This works just like :class:`S3Queue`, except `filenames` is a list of
+    object summaries as returned by :func:`s3peat.download.list_prefix`, and
+    the :attr:`~S3Queue.failed` list holds source keys.
+
+    Objects larger than `part_size` are copied as a multipart upload, with
+    `part_concurrency` ``UploadPartCopy`` requests at once.
+
+    :param source: A :class:`S3Bucket` instance to copy from
+    :param source_prefix: S3 key prefix to copy from
+    :param prefix: S3 key prefix to copy to
+    :param objects: List of object summaries
+    :param bucket: A :class:`S3Bucket` instance to copy to
+    :param part_size: Size of copied parts, in bytes
+    :param part_concurrency: Number of parts of one object to copy at once
+    :type source: :class:`S3Bucket`
+    :type source_prefix: str
+    :type prefix: str
+    :type objects: list
+    :type bucket: :class:`S3Bucket`
+    :type part_size: int
+    :type part_concurrency: int
+
+    """
+
+    def __init__(
+        self,
+        source,
+        source_prefix,
+        prefix,
+        objects,
+        bucket,
+        part_size=PART_SIZE,
+        part_concurrency=4,
+        **kwargs,
+    ):
+        super(S3CopyQueue, self).__init__(prefix, objects, bucket, **kwargs)
+        self.source = source
+        self.source_prefix = (source_prefix or "").strip("/")
+        self.part_size = min(part_size, MAX_COPY_SIZE)
+        self.part_concurrency = part_concurrency
+
+    def _transfer(self, obj, bucket):
+        self._copy(obj, bucket.meta.client)
+
+    def _item_filename(self, obj):
+        return obj["Key"]
+
+    def _copy(self, obj, client):
+        """
+        Copy the object summarized by `obj`.
+
+        :param obj: An object summary
+        :param client: A boto3 S3 client
+        :type obj: dict
+
+        """
+        source_key = obj["Key"]
+        try:
+            key = self._key(source_key)
+            copy_source = {"Bucket": self.source.name, "Key": source_key}
+            if obj["Size"] > self.part_size:
+                self._copy_parts(client, copy_source, key, obj["Size"])
+            else:
+                client.copy_object(Key=key, CopySource=copy_source, **self._params)
+        except Exception:
+            self.log.debug("Failed %r", source_key, exc_info=True)
+            self.failed.append(source_key)
+            if self.counter:
+                self.counter(False)
+        else:
+            self.log.debug("Copied %r to %r", source_key, key)
+            if self.counter:
+                self.counter()
+
+    def _copy_parts(self, client, copy_source, key, size):
+        """
+        Copy `copy_source` to `key` as a multipart upload, with parts bigger
+        than :attr:`part_size` if that would take too many.
+
+        The source's headers, metadata and tags are copied too, as
+        ``CopyObject`` does for smaller objects.
+
+        """
+        # Round up, so the parts always cover the whole object
+        part_size = max(self.part_size, -(-size // MAX_PARTS))
+        head = client.head_object(**copy_source)
+        kwargs = {name: head[name] for name in COPIED_HEADERS if name in head}
+        tags = client.get_object_tagging(**copy_source)["TagSet"]
+        if tags:
+            kwargs["Tagging"] = urlencode([(t["Key"], t["Value"]) for t in tags])
+        upload = client.create_multipart_upload(Key=key, **self._params, **kwargs)
+        upload_id = upload["UploadId"]
+        self.uploads[upload_id] = key
+
+        def copy_part(number, start):
+            end = min(start + part_size, size) - 1
+            result = client.upload_part_copy(
+                Bucket=self.bucket.name,
+                Key=key,
+                UploadId=upload_id,
+                PartNumber=number,
+                CopySource=copy_source,
+                CopySourceRange="bytes={}-{}".format(start, end),
+            )
+            return {"PartNumber": number, "ETag": result["CopyPartResult"]["ETag"]}
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.part_concurrency) as pool:
+                futures = [
+                    pool.submit(copy_part, number, start)
+                    for number, start in enumerate(range(0, size, part_size), start=1)
+                ]
+                parts = [future.result() for future in futures]
+
+            client.complete_multipart_upload(
+                Bucket=self.bucket.name,
+                Key=key,
+                UploadId=upload_id,
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            # Don't leave the parts around costing money
+            client.abort_multipart_upload(
+                Bucket=self.bucket.name, Key=key, UploadId=upload_id
+            )
+            raise
+        finally:
+            self.uploads.pop(upload_id, None)
+
+    def _key(self, source_key):
+        """
+        Return the destination key for `source_key`.
+
+        :param source_key: Key in the source bucket
+        :type source_key: str
+
+        """
+        # Remove the source prefix, leaving the key relative to it
+        if self.source_prefix and source_key.startswith(self.source_prefix + "/"):
+            source_key = source_key[len(self.source_prefix) + 1 :]
+        return "/".join((self.prefix, source_key.lstrip("/")))
+
+
+class S3Copier(S3Uploader):
+    """
+    Runs a set of parallel server-side copies.
+
+    Everything under `source_prefix` in `source` is copied to `prefix` in
+    `bucket`. :attr:`include` and :attr:`exclude` are matched against the
+    source keys.
+
+    Objects which already exist in `bucket` with the same size and ETag are
+    skipped. Objects copied in parts have a different ETag to their source,
+    so those are skipped if they're the same size and were last modified no
+    earlier than the source. :attr:`skipped` is the number of objects
+    skipped.
+
+    :param source: A :class:`S3Bucket` instance to copy from
+    :param source_prefix: S3 key prefix to copy from
+    :param prefix: S3 key prefix to copy to
+    :param bucket: A :class:`S3Bucket` instance to copy to
+    :param include: List of key regexes to include (optional)
+    :param exclude: List of key regexes to exclude (optional)
+    :param concurrency: Number of concurrent copies to use (default: 1)
+    :param output: File or stream to output progress to (optional)
+    :param part_size: Objects larger than this are copied in parts of this
+                      size (default: 256 MiB)
+    :param part_concurrency: Number of parts of one object to copy at once
+                             (default: ``4``)
+    :type source: :class:`S3Bucket`
+    :type source_prefix: str
+    :type prefix: str
+    :type bucket: :class:`S3Bucket`
+    :type include: list
+    :type exclude: list
+    :type concurrency: int
+    :type output: file
+    :type part_size: int
+    :type part_concurrency: int
+
+    """
+
+    verb = "copied"
+
+    def __init__(
+        self,
+        source,
+        source_prefix,
+        prefix,
+        bucket,
+        include=None,
+        exclude=None,
+        concurrency=1,
+        output=None,
+        handle_signals=True,
+        part_size=PART_SIZE,
+        part_concurrency=4,
+    ):
+        super(S3Copier, self).__init__(
+            None,
+            prefix,
+            bucket,
+            include=include,
+            exclude=exclude,
+            concurrency=concurrency,
+            output=output,
+            handle_signals=handle_signals,
+        )
+        self.source = source
+        self.source_prefix = source_prefix
+        self.part_size = part_size
+        self.part_concurrency = part_concurrency
+        self.skipped = 0
+
+    def copy(self):
+        """
+        Starts the copying and returns a list of failed source keys.
+
+        """
+        if not self._prepare():
+            return
+
+        # Make sure we can read the source too
+        try:
+            self.source.get_new()
+        except Exception:
+            return
+
+        # Get all the objects
+        groups = self.get_objects(split=True)
+
+        # Start a queue with each group of objects
+        for objects in groups:
+            if objects:
+                self._start_queue(objects)
+
+        # Wait for the queues to all finish
+        while True:
+            remaining = sum([len(q.filenames) for q in self.queues])
+            if not remaining:
+                break
+            time.sleep(0.1)
+
+        return self._finish()
+
+    # Let S3Uploader.upload callers use us the same way
+    upload = copy
+
+    def get_objects(self, split=False):
+        """
+        Return a list of source object summaries to copy, filtered by
+        :attr:`include` and :attr:`exclude`, and skipping objects which are
+        already in the destination.
+
+        If `split` is ``True``, then this method returns a list of lists, where
+        objects are evenly divided into :attr:`concurrency` groups.
+
+        After running this method, :attr:`total` will be set to the number of
+        objects found.
+
+        """
+        # Use a queue that never runs to map source keys to destination keys
+        queue = self._new_queue([])
+        source_prefix = queue.source_prefix + "/" if queue.source_prefix else ""
+
+        # Find what's already been copied
+        client = self.bucket.get_new().meta.client
+        existing = {}
+        for obj in list_prefix(
+            client, self.bucket.name, queue._key(""), self.concurrency
+        ):
+            existing[obj["Key"]] = (obj["Size"], obj["ETag"], obj["LastModified"])
+
+        client = self.source.get_new().meta.client
+        objects = []
+        self.total = 0
+        self.skipped = 0
+        for obj in list_prefix(
+            client, self.source.name, source_prefix, self.concurrency
+        ):
+            if self._skip(obj["Key"]):
+                continue
+            if _is_copied(obj, existing.get(queue._key(obj["Key"]))):
+                self.skipped += 1
+                continue
+            objects.append(obj)
+            self.total += 1
+
+        if split:
+            groups = [list() for i in range(self.concurrency)]
+            for i in range(len(objects)):
+                groups[i % self.concurrency].append(objects[i])
+            objects = groups
+
+        return objects
+
+    def get_filenames(self, split=False):
+        """
+        Return the source keys that would be copied.
+
+        """
+        return [obj["Key"] for obj in self.get_objects()]
+
+    def _new_queue(self, objects):
+        """Return a new :class:`S3CopyQueue` for `objects`."""
+        return S3CopyQueue(
+            self.source,
+            self.source_prefix,
+            self.prefix,
+            objects,
+            self.bucket,
+            part_size=self.part_size,
+            part_concurrency=self.part_concurrency,
+            counter=self.counter,
+        )
+
+    def _start_queue(self, objects):
+        queue = self._new_queue(objects)
+        self.queues.append(queue)
+        queue.daemon = True
+        queue.start()
+        return queue
+
+
+def copy_s3_to_s3(
+    source,
+    source_prefix,
+    bucket,
+    prefix,
+    include=None,
+    exclude=None,
+    concurrency=1,
+    output=None,
+    handle_signals=True,
+    part_size=PART_SIZE,
+    part_concurrency=4,
+):
+    """
+    This is a convenience wrapper around :class:`S3Copier`.
+
+    """
+    copier = S3Copier(
+        source,
+        source_prefix,
+        prefix,
+        bucket,
+        include=include,
+        exclude=exclude,
+        concurrency=concurrency,
+        output=output,
+        handle_signals=handle_signals,
+        part_size=part_size,
+        part_concurrency=part_concurrency,
+    )
+    return copier.copy()
+
+
+def _is_copied(obj, existing):
+    """
+    Return ``True`` if `existing`, a ``(size, etag, modified)`` tuple for the
+    destination key, matches the source object summary `obj`.
+
+    """
+    if existing is None:
+        return False
+    size, etag, modified = existing
+    if size != obj["Size"]:
+        return False
+    # Multipart ETags aren't content hashes, so they only match if the parts
+    # were the same, which we can't know. A copy is at least as new as what
+    # it was copied from, though.
+    if "-" in etag or "-" in obj["ETag"]:
+        return modified >= obj["LastModified"]
+    return etag == obj["ETag"]
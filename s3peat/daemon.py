@@ -0,0 +1,569 @@
+"""
+Keep a warm pool of upload threads running, and upload batches of files sent
+to it as jobs.
+
+Each call to :func:`s3peat.sync_to_s3` starts its threads, creates sessions
+and connects to S3 afresh, which takes far longer than uploading a handful
+of files. :class:`S3Daemon` starts its threads once, and they keep their
+connections open between jobs, so a small job takes about as long as its
+uploads do. Jobs can be submitted from Python, or over HTTP on a local port
+or Unix socket with :func:`serve`.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat import S3Bucket, S3Daemon
+
+    bucket = S3Bucket('my-bucket', AWS_KEY, AWS_SECRET)
+
+    daemon = S3Daemon(bucket, concurrency=20)
+    daemon.start()
+
+    job = daemon.submit('my/directory', prefix='my/key')
+    job.wait()
+    print(job.result())
+
+.. rubric:: HTTP API
+
+``POST /jobs``
+    Submit a job, from a JSON object with a `directory` and `prefix`, and
+    optionally a list of `files` relative to the directory instead of
+    walking it, lists of `include` and `exclude` regexes, and a
+    `key_template`. With ``"wait": true`` the response waits for the job to
+    finish. Responds with the job's result.
+
+``GET /jobs/<id>``
+    Respond with the job's result, waiting for it to finish with
+    ``?wait=1``.
+
+``GET /jobs``
+    Respond with a list of the results of the jobs kept.
+
+The API has no authentication, so :func:`make_server` only listens on a
+Unix socket or a loopback address unless told otherwise.
+
+Results are JSON objects with the job's `id`, whether it's `done`, the
+`total` files to upload, the number `uploaded`, the `failed` filenames,
+an `error` if the files couldn't be listed, the `seconds` it's taken, and
+the `checksums` of the uploaded files, if a checksum is used.
+
+"""
+
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import socketserver
+import stat
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue
+from threading import Event, Lock, Thread
+from urllib.parse import parse_qs, urlsplit
+
+from s3peat import MULTIPART_THRESHOLD, PART_SIZE, S3Queue, S3Uploader
+from s3peat.hedge import LatencyTracker
+
+
+class S3Job(S3Uploader):
+    """
+    A batch of files for a :class:`S3Daemon` to upload, and how it went.
+
+    This is a :class:`~s3peat.S3Uploader` that doesn't upload anything
+    itself, but lists and filters its files, works out their keys, and
+    counts their uploads by the daemon's threads.
+
+    :param id: Job ID
+    :param directory: Directory the files are in
+    :param prefix: S3 key prefix
+    :param bucket: A :class:`~s3peat.S3Bucket` instance
+    :param files: Filenames relative to `directory`, instead of walking it,
+                  which must not be absolute or go up out of it (optional)
+    :param include: List of regexes to include (optional)
+    :param exclude: List of regexes to exclude (optional)
+    :param key_template: Format for keys, see :class:`~s3peat.S3Queue`
+                         (optional)
+    :type id: str
+    :type directory: str
+    :type prefix: str
+    :type bucket: :class:`~s3peat.S3Bucket`
+    :type files: list
+    :type include: list
+    :type exclude: list
+    :type key_template: str
+
+    """
+
+    def __init__(
+        self,
+        id,
+        directory,
+        prefix,
+        bucket,
+        files=None,
+        include=None,
+        exclude=None,
+        key_template=None,
+    ):
+        super(S3Job, self).__init__(
+            directory,
+            prefix,
+            bucket,
+            include=include,
+            exclude=exclude,
+            key_template=key_template,
+        )
+        self.id = id
+        if files is not None:
+            files = [_relative(filename) for filename in files]
+        self.files = files
+        self.failed = []
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._lock = Lock()
+        self._done = Event()
+        # Set once all the files have been handed to the daemon
+        self._queued = False
+        # Never run, this works out the keys
+        self._keys = self._new_queue([])
+
+    def iter_filenames(self):
+        """
+        Yield the filenames to upload, from :attr:`files` if it's set, or by
+        walking :attr:`directory`, filtered by :attr:`include` and
+        :attr:`exclude`.
+
+        """
+        if self.files is None:
+            yield from super(S3Job, self).iter_filenames()
+            return
+
+        for filename in self.files:
+            filename = os.path.join(self.directory, filename)
+            if self._skip(filename):
+                continue
+            self.total += 1
+            yield filename
+
+    def key(self, filename):
+        """Return the key to upload `filename` to."""
+        return self._keys._key(filename)
+
+    def uploaded(self, filename, success=True, checksum=None):
+        """
+        Count the upload of `filename`, which failed unless `success`.
+
+        """
+        with self._lock:
+            self.count += 1
+            if not success:
+                self.errors += 1
+                self.failed.append(filename)
+            elif checksum is not None:
+                self.checksums[filename] = checksum
+            self._check_done()
+
+    def queued(self, error=None):
+        """
+        Note all the files have been handed to the daemon, or that listing
+        them failed with `error`.
+
+        """
+        with self._lock:
+            self.error = error
+            self._queued = True
+            self._check_done()
+
+    def _check_done(self):
+        if self._queued and self.count >= self.total and not self._done.is_set():
+            self.finished = time.time()
+            self._done.set()
+
+    @property
+    def done(self):
+        """``True`` once every file has been uploaded or has failed."""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Wait up to `timeout` seconds for the job to be done, returning
+        whether it is.
+
+        """
+        return self._done.wait(timeout)
+
+    def result(self):
+        """Return a dict of how the job went, for sending as JSON."""
+        with self._lock:
+            result = {
+                "id": self.id,
+                "done": self.done,
+                "total": self.total,
+                "uploaded": self.count - self.errors,
+                "failed": list(self.failed),
+                "error": self.error,
+                "seconds": round((self.finished or time.time()) - self.started, 3),
+            }
+            if self.checksums:
+                result["checksums"] = dict(self.checksums)
+        return result
+
+
+class S3DaemonQueue(S3Queue):
+    """
+    Take ``(job, filename)`` tuples from a stream and upload each file to
+    its key in the :class:`S3Job` `job`, reporting back to the job.
+
+    This works just like :class:`~s3peat.S3Queue`, except keys come from
+    each file's job, and the result of each upload is counted by its job
+    rather than kept here, since the queue runs for as long as the daemon.
+
+    """
+
+    def _transfer(self, item, bucket):
+        job, filename = item
+        key = None
+        try:
+            key = job.key(filename)
+            self._put_file(bucket, key, filename)
+        except Exception:
+            self.log.debug("Failed %r", key, exc_info=True)
+            job.uploaded(filename, False)
+        else:
+            self.log.debug("Uploaded %r", key)
+            job.uploaded(filename, True, self.checksums.pop(filename, None))
+
+    def _item_filename(self, item):
+        return item[1]
+
+
+class S3Daemon(object):
+    """
+    Runs a pool of upload threads that stay connected to S3, and uploads the
+    files in the jobs submitted to it.
+
+    :param bucket: A :class:`~s3peat.S3Bucket` instance
+    :param concurrency: Number of upload threads (default: 1)
+    :param checksum: Checksum to send with each upload for S3 to verify, one
+                     of :data:`~s3peat.CHECKSUMS` (optional)
+    :param multipart_threshold: Files larger than this are uploaded in parts
+                                (default: 64 MiB)
+    :param part_size: Size of uploaded parts, in bytes (default: 16 MiB)
+    :param timeout: Seconds to wait connecting, or for each read or write on
+                    a connection, before giving up on a request (optional)
+    :param hedge: Percentile of request times after which a slow request is
+                  sent again on a fresh connection (optional)
+    :param keep_jobs: Number of finished jobs to keep the results of
+                      (default: 1000)
+    :type bucket: :class:`~s3peat.S3Bucket`
+    :type concurrency: int
+    :type keep_jobs: int
+
+    Every job's files share one stream, in the order they're listed, with
+    each job listing its files in a thread of its own, so a big job doesn't
+    stop a small one from starting. Only a few files per thread wait on the
+    stream.
+
+    """
+
+    def __init__(
+        self,
+        bucket,
+        concurrency=1,
+        checksum=None,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=PART_SIZE,
+        timeout=None,
+        hedge=None,
+        keep_jobs=1000,
+    ):
+        self.bucket = bucket
+        self.concurrency = concurrency
+        self.checksum = checksum
+        self.multipart_threshold = multipart_threshold
+        self.part_size = part_size
+        self.timeout = timeout
+        self.hedge = hedge
+        self.keep_jobs = keep_jobs
+        self.jobs = OrderedDict()
+        self.queues = []
+        self.stream = None
+        self.latencies = LatencyTracker() if hedge else None
+        self._lock = Lock()
+        self.log = logging.getLogger("S3Daemon")
+
+    def start(self):
+        """
+        Start the upload threads, raising an exception if the bucket can't
+        be accessed.
+
+        """
+        self.bucket.get_new()
+        self.stream = Queue(maxsize=self.concurrency * 4)
+        for i in range(self.concurrency):
+            queue = S3DaemonQueue(
+                None,
+                self.stream,
+                self.bucket,
+                checksum=self.checksum,
+                multipart_threshold=self.multipart_threshold,
+                part_size=self.part_size,
+                timeout=self.timeout,
+                hedge=self.hedge,
+                latencies=self.latencies,
+                # Files submitted may still be being written, so aren't mapped
+                map_files=False,
+            )
+            self.queues.append(queue)
+            queue.daemon = True
+            queue.start()
+
+    def stop(self):
+        """
+        Stop the upload threads once they've uploaded the files already
+        waiting, and wait for them.
+
+        """
+        for queue in self.queues:
+            self.stream.put(None)
+        for queue in self.queues:
+            queue.join()
+        self.queues = []
+
+    def submit(
+        self,
+        directory,
+        prefix,
+        files=None,
+        include=None,
+        exclude=None,
+        key_template=None,
+    ):
+        """
+        Submit a job uploading the files in `directory`, and return it.
+
+        See :class:`S3Job` for the arguments. The job's files are listed
+        and queued in the background.
+
+        :rtype: :class:`S3Job`
+
+        """
+        job = S3Job(
+            uuid.uuid4().hex,
+            directory,
+            prefix,
+            self.bucket,
+            files=files,
+            include=include,
+            exclude=exclude,
+            key_template=key_template,
+        )
+        with self._lock:
+            self.jobs[job.id] = job
+            self._forget()
+
+        feeder = Thread(target=self._feed, args=(job,), name="S3Job.{}".format(job.id))
+        feeder.daemon = True
+        feeder.start()
+        return job
+
+    def job(self, id):
+        """Return the job with `id`, or ``None`` if there isn't one."""
+        return self.jobs.get(id)
+
+    def _feed(self, job):
+        """Put each of `job`'s files on the stream."""
+        error = None
+        try:
+            if not os.path.isdir(job.directory):
+                raise IOError("Directory %r does not exist." % job.directory)
+            for filename in job.iter_filenames():
+                self.stream.put((job, filename))
+        except Exception as exc:
+            self.log.debug("Failed listing job %s", job.id, exc_info=True)
+            error = str(exc)
+        job.queued(error)
+
+    def _forget(self):
+        """Drop the oldest finished jobs, keeping :attr:`keep_jobs`."""
+        for id in list(self.jobs):
+            if len(self.jobs) <= self.keep_jobs:
+                break
+            if self.jobs[id].done:
+                del self.jobs[id]
+
+
+class JobHandler(BaseHTTPRequestHandler):
+    """Handle requests to the HTTP API of the server's :class:`S3Daemon`."""
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip("/").split("/")
+        daemon = self.server.daemon
+
+        if parts == ["jobs"]:
+            self._respond(200, [job.result() for job in list(daemon.jobs.values())])
+            return
+
+        if len(parts) != 2 or parts[0] != "jobs":
+            self._respond(404, {"error": "Not found."})
+            return
+
+        job = daemon.job(parts[1])
+        if job is None:
+            self._respond(404, {"error": "No such job."})
+            return
+        if parse_qs(url.query).get("wait", ["0"])[0] not in ("", "0"):
+            job.wait()
+        self._respond(200, job.result())
+
+    def do_POST(self):
+        if urlsplit(self.path).path.strip("/") != "jobs":
+            self._respond(404, {"error": "Not found."})
+            return
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            spec = json.loads(self.rfile.read(length) or b"{}")
+            job = self.server.daemon.submit(
+                spec["directory"],
+                spec.get("prefix"),
+                files=spec.get("files"),
+                include=_regexes(spec.get("include")),
+                exclude=_regexes(spec.get("exclude")),
+                key_template=spec.get("key_template"),
+            )
+        except (ValueError, TypeError, KeyError, re.error) as exc:
+            self._respond(400, {"error": "Bad job: {}".format(exc)})
+            return
+
+        if spec.get("wait"):
+            job.wait()
+        self._respond(201, job.result())
+
+    def _respond(self, status, body):
+        body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger("S3Daemon").debug(format, *args)
+
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """A :class:`~http.server.ThreadingHTTPServer` on a Unix socket."""
+
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # Replace a socket left by a daemon that didn't clean up
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        # Skip HTTPServer's, which looks up the address as a host name
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = "localhost"
+        self.server_port = 0
+
+    def get_request(self):
+        request, client_address = super(UnixHTTPServer, self).get_request()
+        # The HTTP handler expects a host and port
+        return request, ("", 0)
+
+    def server_close(self):
+        super(UnixHTTPServer, self).server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def make_server(daemon, address, listen_any=False):
+    """
+    Return an HTTP server for the API of `daemon`, listening on `address`.
+
+    Anyone who can reach the API can have any file the daemon can read
+    uploaded, so unless `listen_any` is ``True``, only Unix sockets and
+    loopback addresses are allowed.
+
+    :param daemon: A started :class:`S3Daemon`
+    :param address: A ``(host, port)`` tuple, or the path of a Unix socket
+    :param listen_any: Allow listening on any address
+    :type daemon: :class:`S3Daemon`
+    :type address: tuple or str
+    :type listen_any: bool
+
+    """
+    if isinstance(address, str):
+        server = UnixHTTPServer(address, JobHandler)
+    else:
+        if not listen_any and not _is_loopback(address[0]):
+            raise ValueError(
+                "Not listening on {!r}, which isn't a loopback address.".format(
+                    address[0]
+                )
+            )
+        server = ThreadingHTTPServer(address, JobHandler)
+    server.daemon = daemon
+    return server
+
+
+def serve(daemon, address, listen_any=False):
+    """
+    Serve the API of `daemon` on `address` until interrupted, then stop it.
+
+    See :func:`make_server` for the arguments.
+
+    """
+    try:
+        server = make_server(daemon, address, listen_any)
+    except Exception:
+        daemon.stop()
+        raise
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        daemon.stop()
+
+
+def _regexes(patterns):
+    """Return a list of the compiled regexes in `patterns`, if there are any."""
+    if not patterns:
+        return None
+    return [re.compile(pattern) for pattern in patterns]
+
+
+def _relative(filename):
+    """
+    Return `filename` if it's a path inside a job's directory, otherwise
+    raise :exc:`ValueError`.
+
+    """
+    if not isinstance(filename, str):
+        raise TypeError("File {!r} isn't a string.".format(filename))
+    path = os.path.normpath(filename)
+    if os.path.isabs(path) or path == os.pardir or path.startswith(os.pardir + os.sep):
+        raise ValueError("File {!r} isn't inside the directory.".format(filename))
+    return path
+
+
+def _is_loopback(host):
+    """Return ``True`` if `host` is a loopback address."""
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
@@ -0,0 +1,170 @@
+"""
+Find files with identical contents, so each is only uploaded once.
+
+Hashing every file would mean reading the whole tree an extra time, so files
+are first grouped by size, and only files which share their size with
+another file are hashed. Hard links to the same inode are found from their
+stat alone, without reading them at all.
+
+Duplicates are then created with a server-side ``CopyObject`` from the
+uploaded original by :class:`S3DuplicateQueue`. Both are returned in the
+compact lists of :mod:`s3peat.filelist`, so a tree of millions of files costs
+no more to dedup than to upload.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.dedup import find_duplicates
+
+    originals, duplicates = find_duplicates(filenames, concurrency=8)
+    for original, duplicate in duplicates:
+        print(duplicate, "is a copy of", original)
+
+"""
+
+import hashlib
+import logging
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from s3peat import S3Queue
+from s3peat.filelist import FileList, PairList
+
+# Read size when hashing files
+CHUNK_SIZE = 1024 * 1024
+
+log = logging.getLogger("s3peat.dedup")
+
+
+def find_duplicates(filenames, concurrency=1):
+    """
+    Split `filenames` into originals and duplicates.
+
+    Returns a tuple of ``(originals, duplicates)`` where `originals` is a
+    :class:`~s3peat.filelist.FileList` of filenames with unique contents, in
+    their original order, and `duplicates` is a
+    :class:`~s3peat.filelist.PairList` of ``(original, duplicate)`` filename
+    tuples.
+
+    Files which are hard links to the same inode are duplicates. Otherwise,
+    files are duplicates if they have the same size and SHA-256 hash. Hashing
+    is done with `concurrency` threads.
+
+    Files which can't be read are treated as originals, so the upload can
+    report them as failures.
+
+    :param filenames: List of filenames
+    :param concurrency: Number of files to hash at once
+    :type filenames: list
+    :type concurrency: int
+
+    """
+    # The first filename seen for each inode, and each size
+    inodes = {}
+    sizes = defaultdict(list)
+    # Maps each duplicate filename to the filename it's a copy of
+    copy_of = {}
+
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            continue
+        inode = (stat.st_dev, stat.st_ino)
+        if inode in inodes:
+            copy_of[filename] = inodes[inode]
+            continue
+        inodes[inode] = filename
+        sizes[stat.st_size].append(filename)
+
+    # Only files that share their size with another could be duplicates
+    candidates = [f for group in sizes.values() if len(group) > 1 for f in group]
+    with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+        digests = dict(zip(candidates, pool.map(_hash, candidates)))
+
+    for size, group in sizes.items():
+        if len(group) < 2:
+            continue
+        first = {}
+        for filename in group:
+            digest = digests[filename]
+            if digest is None:
+                continue
+            if digest in first:
+                copy_of[filename] = first[digest]
+            else:
+                first[digest] = filename
+
+    originals = FileList()
+    duplicates = PairList()
+    for filename in filenames:
+        if filename in copy_of:
+            duplicates.append((copy_of[filename], filename))
+        else:
+            originals.append(filename)
+
+    log.debug("Found %d duplicates in %d files", len(duplicates), len(filenames))
+    return originals, duplicates
+
+
+def _hash(filename):
+    """Return the SHA-256 digest of `filename`, or ``None`` if unreadable."""
+    digest = hashlib.sha256()
+    try:
+        with open(filename, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.digest()
+
+
+class S3DuplicateQueue(S3Queue):
+    """
+    Take a list of ``(original, duplicate)`` filename tuples and create each
+    duplicate's key with a server-side copy from the original's key.
+
+    The originals must already have been uploaded. If a copy fails, perhaps
+    because the original failed to upload, the duplicate is uploaded from disk
+    instead. The :attr:`~S3Queue.failed` list holds the duplicate filenames
+    which couldn't be copied or uploaded.
+
+    This takes the same arguments as :class:`S3Queue`, as well as a `sources`
+    keyword argument: the :attr:`~S3Queue.checksums` of the originals, keyed
+    by filename. A copy has the same contents as its original, so it's given
+    the original's checksum.
+
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.sources = kwargs.pop("sources", None) or {}
+        super(S3DuplicateQueue, self).__init__(*args, **kwargs)
+
+    def _transfer(self, pair, bucket):
+        original, duplicate = pair
+        started = time.time()
+        try:
+            key = self._key(duplicate)
+            size = os.path.getsize(duplicate)
+            bucket.meta.client.copy_object(
+                Key=key,
+                CopySource={"Bucket": self.bucket.name, "Key": self._key(original)},
+                **self._params,
+            )
+        except Exception:
+            self.log.debug("Failed copying %r, uploading", key, exc_info=True)
+            self._upload(duplicate, bucket)
+        else:
+            self.log.debug("Copied %r", key)
+            if self.checksum and original in self.sources:
+                self.checksums[duplicate] = self.sources[original]
+            if self.listing is not None:
+                self.listing.add(key, size, int(started) - 1)
+            if self.counter:
+                self.counter()
+
+    def _item_filename(self, pair):
+        return pair[1]
@@ -0,0 +1,462 @@
+"""
+Fast downloading of S3 prefixes to directories.
+
+This is the reverse of :func:`s3peat.sync_to_s3`, using the same threaded
+queues to download keys in parallel.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat import S3Bucket, sync_from_s3
+
+    bucket = S3Bucket('my-bucket', AWS_KEY, AWS_SECRET)
+
+    # A list of keys will be returned if there were failures in downloading
+    failures = sync_from_s3(directory='my/directory', prefix='my/key',
+        bucket=bucket, concurrency=50)
+
+"""
+
+import calendar
+import os
+import posixpath
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from s3peat import S3Queue, S3Uploader
+
+# Objects bigger than this are downloaded in ranged parts
+PART_SIZE = 8 * 1024 * 1024
+
+# Read size when streaming a response body to disk
+CHUNK_SIZE = 256 * 1024
+
+# Suffix for files that are still being downloaded
+TEMP_SUFFIX = ".s3peat-part"
+
+
+def list_prefix(client, bucket, prefix, concurrency=1):
+    """
+    Yield the object summaries under `prefix` in `bucket`.
+
+    With a `concurrency` greater than one, the prefix is first split into its
+    top level "directories", which are then paginated in parallel. Each summary
+    is a dict with at least ``Key``, ``Size`` and ``LastModified``.
+
+    :param client: A boto3 S3 client
+    :param bucket: S3 bucket name
+    :param prefix: S3 key prefix to list
+    :param concurrency: Number of listings to run at once
+    :type bucket: str
+    :type prefix: str
+    :type concurrency: int
+
+    """
+    paginator = client.get_paginator("list_objects_v2")
+
+    def paginate(prefix, delimiter=None):
+        kwargs = {"Bucket": bucket, "Prefix": prefix}
+        if delimiter:
+            kwargs["Delimiter"] = delimiter
+        return paginator.paginate(**kwargs)
+
+    if concurrency < 2:
+        for page in paginate(prefix):
+            for obj in page.get("Contents", []):
+                yield obj
+        return
+
+    # List the top level, so we know what we can list in parallel
+    subprefixes = []
+    for page in paginate(prefix, "/"):
+        for obj in page.get("Contents", []):
+            yield obj
+        for common in page.get("CommonPrefixes", []):
+            subprefixes.append(common["Prefix"])
+
+    def list_all(subprefix):
+        return [obj for page in paginate(subprefix) for obj in page.get("Contents", [])]
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for objs in pool.map(list_all, subprefixes):
+            for obj in objs:
+                yield obj
+
+
+class S3DownloadQueue(S3Queue):
+    """
+    Take a list of object summaries and download them from S3 into
+    `directory`.
+
+    This works just like :class:`S3Queue`, except `filenames` is a list of
+    object summaries as returned by :func:`list_prefix`, and the
+    :attr:`~S3Queue.failed` list holds keys.
+
+    Objects larger than `part_size` are downloaded as `part_concurrency`
+    parallel ranged requests, written straight into a preallocated file.
+
+    :param prefix: S3 key prefix
+    :param objects: List of object summaries
+    :param bucket: A :class:`S3Bucket` instance
+    :param directory: Directory to download into
+    :param part_size: Size of ranged requests, in bytes
+    :param part_concurrency: Number of ranged requests per object at once
+    :type prefix: str
+    :type objects: list
+    :type bucket: :class:`S3Bucket`
+    :type directory: str
+    :type part_size: int
+    :type part_concurrency: int
+
+    """
+
+    def __init__(
+        self,
+        prefix,
+        objects,
+        bucket,
+        directory,
+        part_size=PART_SIZE,
+        part_concurrency=4,
+        **kwargs,
+    ):
+        super(S3DownloadQueue, self).__init__(prefix, objects, bucket, **kwargs)
+        self.directory = directory
+        self.part_size = part_size
+        self.part_concurrency = part_concurrency
+
+    def _transfer(self, obj, bucket):
+        self._download(obj, bucket.meta.client)
+
+    def _item_filename(self, obj):
+        return obj["Key"]
+
+    def _download(self, obj, client):
+        """
+        Download the object summarized by `obj`.
+
+        :param obj: An object summary
+        :param client: A boto3 S3 client
+        :type obj: dict
+
+        """
+        key = obj["Key"]
+        filename = self._filename(key)
+        temp = filename + TEMP_SUFFIX
+        try:
+            # Don't let keys like "../../etc/passwd" write outside directory
+            root = os.path.abspath(self.directory)
+            if not os.path.abspath(filename).startswith(root + os.path.sep):
+                raise ValueError("Key {!r} is outside the directory".format(key))
+
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            size = obj["Size"]
+            # Every request must get the version we listed, or the file
+            # would mix the bytes of two versions
+            etag = obj.get("ETag")
+            fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                _preallocate(fd, size)
+                if size > self.part_size:
+                    written = self._get_parts(client, key, fd, size, etag)
+                else:
+                    written = self._get_range(client, key, fd, 0, None, etag)
+            finally:
+                os.close(fd)
+            if written != size:
+                raise IOError(
+                    "Got {} bytes of {!r}, expected {}".format(written, key, size)
+                )
+
+            os.replace(temp, filename)
+            # Match the modified time to the object, so it's skipped next time
+            mtime = _timestamp(obj["LastModified"])
+            os.utime(filename, (mtime, mtime))
+        except Exception:
+            self.log.debug("Failed %r", key, exc_info=True)
+            self.failed.append(key)
+            if os.path.exists(temp):
+                os.remove(temp)
+            if self.counter:
+                self.counter(False)
+        else:
+            self.log.debug("Downloaded %r", key)
+            if self.counter:
+                self.counter()
+
+    def _get_parts(self, client, key, fd, size, etag=None):
+        """
+        Download `key` as parallel ranged requests written into `fd`, and
+        return the number of bytes written.
+
+        """
+        ranges = [
+            (start, min(start + self.part_size, size) - 1)
+            for start in range(0, size, self.part_size)
+        ]
+        with ThreadPoolExecutor(max_workers=self.part_concurrency) as pool:
+            futures = [
+                pool.submit(self._get_range, client, key, fd, start, end, etag)
+                for start, end in ranges
+            ]
+            # Raises any exception from the parts
+            return sum(future.result() for future in futures)
+
+    def _get_range(self, client, key, fd, start, end, etag=None):
+        """
+        Download bytes `start` to `end` of `key` into `fd` at the same offset,
+        and return the number of bytes written. If `end` is ``None`` the whole
+        object is downloaded.
+
+        With an `etag`, the request fails if the object has been replaced.
+
+        """
+        kwargs = {"Bucket": self.bucket.name, "Key": key}
+        if end is not None:
+            kwargs["Range"] = "bytes={}-{}".format(start, end)
+        if etag:
+            kwargs["IfMatch"] = etag
+        body = client.get_object(**kwargs)["Body"]
+        offset = start
+        for chunk in iter(lambda: body.read(CHUNK_SIZE), b""):
+            offset += _pwrite(fd, chunk, offset)
+        return offset - start
+
+    def _filename(self, key):
+        """
+        Return the local filename for `key`.
+
+        :param key: S3 key
+        :type key: str
+
+        """
+        # Remove the prefix, leaving the path relative to it
+        if self.prefix and key.startswith(self.prefix + "/"):
+            key = key[len(self.prefix) + 1 :]
+        key = key.lstrip(posixpath.sep)
+        # Replace posix separators with the local path separator
+        path = key.replace(posixpath.sep, os.path.sep)
+        return os.path.join(self.directory, path)
+
+
+class S3Downloader(S3Uploader):
+    """
+    Runs a set of parallel downloads.
+
+    This takes the same arguments as :class:`S3Uploader`, but downloads
+    everything under `prefix` into `directory`, creating it if needed.
+    :attr:`include` and :attr:`exclude` are matched against the local
+    filenames.
+
+    Files which already exist locally with the same size and modified time as
+    their object are skipped, so an interrupted download can be picked up
+    where it left off. :attr:`skipped` is the number of files skipped.
+
+    :param part_size: Objects larger than this are downloaded in ranged
+                      parts of this size (default: 8 MiB)
+    :param part_concurrency: Number of parts of one object to download at
+                             once (default: ``4``)
+    :type part_size: int
+    :type part_concurrency: int
+
+    """
+
+    verb = "downloaded"
+
+    def __init__(
+        self,
+        directory,
+        prefix,
+        bucket,
+        include=None,
+        exclude=None,
+        concurrency=1,
+        output=None,
+        handle_signals=True,
+        part_size=PART_SIZE,
+        part_concurrency=4,
+    ):
+        super(S3Downloader, self).__init__(
+            directory,
+            prefix,
+            bucket,
+            include=include,
+            exclude=exclude,
+            concurrency=concurrency,
+            output=output,
+            handle_signals=handle_signals,
+        )
+        self.part_size = part_size
+        self.part_concurrency = part_concurrency
+        self.skipped = 0
+
+    def download(self):
+        """
+        Starts the downloading and returns a list of failed keys.
+
+        """
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        if not self._prepare():
+            return
+
+        # Get all the objects
+        groups = self.get_objects(split=True)
+
+        # Start a queue with each group of objects
+        for objects in groups:
+            if objects:
+                self._start_queue(objects)
+
+        # Wait for the queues to all finish
+        while True:
+            remaining = sum([len(q.filenames) for q in self.queues])
+            if not remaining:
+                break
+            time.sleep(0.1)
+
+        return self._finish()
+
+    # Let S3Uploader.upload callers use us the same way
+    upload = download
+
+    def get_objects(self, split=False):
+        """
+        Return a list of object summaries to download, filtered by
+        :attr:`include` and :attr:`exclude`, and skipping files we already
+        have.
+
+        If `split` is ``True``, then this method returns a list of lists, where
+        objects are evenly divided into :attr:`concurrency` groups.
+
+        After running this method, :attr:`total` will be set to the number of
+        objects found.
+
+        """
+        client = self.bucket.get_new().meta.client
+        # Use a queue that never runs to map keys to filenames
+        queue = self._new_queue([])
+        prefix = queue.prefix + "/" if queue.prefix else ""
+
+        objects = []
+        self.total = 0
+        self.skipped = 0
+        for obj in list_prefix(client, self.bucket.name, prefix, self.concurrency):
+            # Skip "directory" placeholder objects
+            if obj["Key"].endswith("/"):
+                continue
+            filename = queue._filename(obj["Key"])
+            if self._skip(filename):
+                continue
+            if _is_current(filename, obj):
+                self.skipped += 1
+                continue
+            objects.append(obj)
+            self.total += 1
+
+        if split:
+            groups = [list() for i in range(self.concurrency)]
+            for i in range(len(objects)):
+                groups[i % self.concurrency].append(objects[i])
+            objects = groups
+
+        return objects
+
+    def get_filenames(self, split=False):
+        """
+        Return the local filenames that would be downloaded.
+
+        """
+        queue = self._new_queue([])
+        return [queue._filename(obj["Key"]) for obj in self.get_objects()]
+
+    def _new_queue(self, objects):
+        """Return a new :class:`S3DownloadQueue` for `objects`."""
+        return S3DownloadQueue(
+            self.prefix,
+            objects,
+            self.bucket,
+            self.directory,
+            part_size=self.part_size,
+            part_concurrency=self.part_concurrency,
+            counter=self.counter,
+        )
+
+    def _start_queue(self, objects):
+        queue = self._new_queue(objects)
+        self.queues.append(queue)
+        queue.daemon = True
+        queue.start()
+        return queue
+
+
+def sync_from_s3(
+    directory,
+    prefix,
+    bucket,
+    include=None,
+    exclude=None,
+    concurrency=1,
+    output=None,
+    handle_signals=True,
+    part_size=PART_SIZE,
+    part_concurrency=4,
+):
+    """
+    This is a convenience wrapper around :class:`S3Downloader`.
+
+    """
+    downloader = S3Downloader(
+        directory,
+        prefix,
+        bucket,
+        include=include,
+        exclude=exclude,
+        concurrency=concurrency,
+        output=output,
+        handle_signals=handle_signals,
+        part_size=part_size,
+        part_concurrency=part_concurrency,
+    )
+    return downloader.download()
+
+
+def _is_current(filename, obj):
+    """Return ``True`` if `filename` already matches the object `obj`."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return False
+    return stat.st_size == obj["Size"] and int(stat.st_mtime) == int(
+        _timestamp(obj["LastModified"])
+    )
+
+
+def _timestamp(value):
+    """Return a POSIX timestamp for the datetime `value`."""
+    return calendar.timegm(value.utctimetuple())
+
+
+def _preallocate(fd, size):
+    """Reserve `size` bytes on disk for `fd`, so parts can be written anywhere."""
+    if not size:
+        return
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # Not every platform or filesystem supports this
+        os.ftruncate(fd, size)
+
+
+def _pwrite(fd, data, offset):
+    """Write all of `data` to `fd` at `offset`, returning the bytes written."""
+    view = memoryview(data)
+    written = 0
+    while written < len(view):
+        written += os.pwrite(fd, view[written:], offset + written)
+    return written
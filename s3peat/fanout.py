@@ -0,0 +1,361 @@
+"""
+Upload the same files to several buckets at once, reading each file once.
+
+Replicating a tree to buckets in several regions by running an upload for
+each bucket reads every file from disk once per bucket. :class:`S3FanOut`
+reads each file once instead, and hands the same contents to a separate set
+of upload threads for each bucket, which upload at their own pace, with
+their own connections, retries and failures.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat import S3Bucket, sync_to_many
+
+    buckets = [
+        S3Bucket('my-bucket-us', AWS_KEY, AWS_SECRET, region='us-east-1'),
+        S3Bucket('my-bucket-eu', AWS_KEY, AWS_SECRET, region='eu-west-1'),
+    ]
+
+    # Each bucket's name is mapped to the files that failed uploading to it
+    failures = sync_to_many(directory='my/directory', prefix='my/key',
+        buckets=buckets, concurrency=[50, 20])
+
+"""
+
+import mmap
+import os
+from queue import Queue
+from threading import Lock
+
+from s3peat import MULTIPART_THRESHOLD, PART_SIZE, S3Queue, S3Uploader
+from s3peat.hedge import LatencyTracker
+
+
+class SharedFile(object):
+    """
+    The contents of `filename`, read once and shared by the uploads of it to
+    each of `users` buckets.
+
+    Files up to `read_size` bytes are read into memory, and larger ones are
+    memory mapped. Each upload calls :meth:`release` when it's done, and the
+    contents are let go of, and their bytes returned to `budget` if there is
+    one, once they all have.
+
+    :param filename: File to read
+    :param users: Number of uploads sharing the contents
+    :param read_size: Largest file to read into memory, in bytes
+    :param budget: A :class:`~s3peat.ByteBudget` to count the contents
+                   against (optional)
+    :type filename: str
+    :type users: int
+    :type read_size: int
+    :type budget: :class:`~s3peat.ByteBudget`
+
+    """
+
+    def __init__(self, filename, users, read_size, budget=None):
+        self.filename = filename
+        # The contents, or None if the file couldn't be read
+        self.data = None
+        self.size = 0
+        self._users = users
+        self._budget = budget
+        self._mapping = None
+        self._lock = Lock()
+        try:
+            self._read(read_size)
+        except OSError:
+            # Let the upload threads try, so the failures get counted
+            pass
+
+    def _read(self, read_size):
+        with open(self.filename, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if self._budget:
+                self._budget.acquire(size)
+            try:
+                if size <= read_size:
+                    data = f.read()
+                else:
+                    try:
+                        self._mapping = mmap.mmap(
+                            f.fileno(), 0, access=mmap.ACCESS_READ
+                        )
+                        data = memoryview(self._mapping)
+                    except (ValueError, OSError):
+                        # Special files can't be mapped
+                        data = f.read()
+            except Exception:
+                if self._budget:
+                    self._budget.release(size)
+                raise
+
+        if self._budget:
+            # The file may have changed size under us
+            self._budget.resize(size, len(data))
+        self.data = data
+        self.size = len(data)
+
+    def release(self):
+        """Note one upload is done with the contents."""
+        with self._lock:
+            self._users -= 1
+            if self._users:
+                return
+        if self._mapping is not None:
+            self.data.release()
+            try:
+                self._mapping.close()
+            except BufferError:
+                # Something still has a slice, it'll be unmapped once that's gone
+                pass
+        self.data = None
+        if self._budget:
+            self._budget.release(self.size)
+
+
+class S3FanOutQueue(S3Queue):
+    """
+    Take a list of :class:`SharedFile` items and upload them to `bucket`.
+
+    This works just like :class:`~s3peat.S3Queue`, except each item is
+    released once it's been uploaded or has failed, and the budget is left
+    to the :class:`SharedFile`, since it's shared with other queues.
+
+    """
+
+    def __init__(self, prefix, filenames, bucket, strip_path=None, **kwargs):
+        kwargs.pop("budget", None)
+        super(S3FanOutQueue, self).__init__(
+            prefix, filenames, bucket, strip_path, **kwargs
+        )
+
+    def _transfer(self, shared, bucket):
+        try:
+            self._upload(shared.filename, bucket, shared.data)
+        finally:
+            shared.release()
+
+    def _item_filename(self, shared):
+        return shared.filename
+
+
+class S3FanOut(S3Uploader):
+    """
+    Runs a set of parallel uploads of the same files to several buckets.
+
+    This takes the same arguments as :class:`~s3peat.S3Uploader`, except for
+    `buckets`, a list of :class:`~s3peat.S3Bucket` instances, instead of
+    `bucket`, and `concurrency`, which may be a list of the number of threads
+    for each bucket. Deleting, deduplicating, inventories, listing caches,
+    lanes and spreading prefixes aren't supported.
+
+    :param directory: Directory to sync
+    :param prefix: S3 key prefix, the same in each bucket
+    :param buckets: List of :class:`~s3peat.S3Bucket` instances
+    :param concurrency: Number of concurrent uploads to each bucket, or a
+                        list with a number for each bucket (default: 1)
+    :type directory: str
+    :type prefix: str
+    :type buckets: list
+    :type concurrency: int or list
+
+    Each file is read once, into memory if it's up to `read_ahead_size`
+    bytes or memory mapped if it's bigger, and put on a stream for each
+    bucket. Only a few files wait on each stream, so the fastest bucket can
+    only get a little ahead of the slowest, and with `max_in_flight` set,
+    the contents held at once are limited to that many bytes. Each bucket
+    has its own request times for `hedge`.
+
+    :meth:`upload` returns a dict mapping each bucket's name to the list of
+    files which failed to upload to it, which is kept as :attr:`failures`.
+    Progress counts an upload to each bucket separately.
+
+    """
+
+    def __init__(
+        self,
+        directory,
+        prefix,
+        buckets,
+        include=None,
+        exclude=None,
+        concurrency=1,
+        output=None,
+        handle_signals=True,
+        files_from=None,
+        checksum=None,
+        max_in_flight=None,
+        read_ahead_size=8 * 1024 * 1024,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=PART_SIZE,
+        key_template=None,
+        timeout=None,
+        hedge=None,
+        drain_timeout=30.0,
+        checkpoint=None,
+        snapshot=None,
+    ):
+        if not buckets:
+            raise ValueError("At least one bucket is needed.")
+        if isinstance(concurrency, int):
+            concurrency = [concurrency] * len(buckets)
+        if len(concurrency) != len(buckets):
+            raise ValueError("Concurrency must be given for each bucket.")
+
+        super(S3FanOut, self).__init__(
+            directory,
+            prefix,
+            buckets[0],
+            include=include,
+            exclude=exclude,
+            concurrency=max(concurrency),
+            output=output,
+            handle_signals=handle_signals,
+            files_from=files_from,
+            checksum=checksum,
+            max_in_flight=max_in_flight,
+            read_ahead_size=read_ahead_size,
+            multipart_threshold=multipart_threshold,
+            part_size=part_size,
+            key_template=key_template,
+            timeout=timeout,
+            hedge=hedge,
+            drain_timeout=drain_timeout,
+            checkpoint=checkpoint,
+            snapshot=snapshot,
+        )
+        self.buckets = buckets
+        self.concurrencies = concurrency
+        self.failures = {}
+        # Request times for each bucket, since they may be far apart
+        self._latencies = {}
+
+    def upload(self):
+        """
+        Starts the uploading and returns a dict of failed filenames for each
+        bucket.
+
+        """
+        if not self._prepare():
+            return
+
+        streams = [
+            self._start_destination(bucket, concurrency)
+            for bucket, concurrency in zip(self.buckets, self.concurrencies)
+        ]
+
+        self.total = 0
+        # Whatever's left of this when stopping hasn't been queued yet
+        filenames = iter(self.iter_filenames())
+        self._pending.append(filenames)
+        for filename in filenames:
+            # Each bucket is counted as its own upload
+            self.total += len(streams) - 1
+            shared = SharedFile(
+                filename, len(streams), self.read_ahead_size, self.budget
+            )
+            # Putting may wait, see _remaining
+            self._in_hand = filename
+            for stream in streams:
+                stream.put(shared)
+            self._in_hand = None
+        self._pending.remove(filenames)
+
+        self._stop_stream(*streams)
+        return self._finish()
+
+    def _prepare(self):
+        if not super(S3FanOut, self)._prepare():
+            return False
+        # The first bucket has been checked already
+        for bucket in self.buckets[1:]:
+            try:
+                bucket.get_new()
+            except Exception:
+                return False
+        self.failures = {}
+        self._latencies = {}
+        return True
+
+    def _start_destination(self, bucket, concurrency):
+        """
+        Start `concurrency` queues uploading to `bucket` from a stream of
+        their own, and return the stream.
+
+        """
+        stream = Queue(maxsize=concurrency * 4)
+        for i in range(concurrency):
+            queue = self._new_queue(stream, bucket=bucket)
+            self.queues.append(queue)
+            queue.daemon = True
+            queue.start()
+        return stream
+
+    def _new_queue(self, filenames, queue_class=None, bucket=None, **kwargs):
+        queue = super(S3FanOut, self)._new_queue(
+            filenames, queue_class or S3FanOutQueue, bucket, **kwargs
+        )
+        if self.hedge:
+            queue.latencies = self._latencies.setdefault(
+                queue.bucket.name, LatencyTracker()
+            )
+        return queue
+
+    def _finish(self):
+        super(S3FanOut, self)._finish()
+        self.failures = dict((bucket.name, []) for bucket in self.buckets)
+        for queue in self.queues:
+            self.failures[queue.bucket.name].extend(queue.failed)
+        return self.failures
+
+
+def sync_to_many(
+    directory,
+    prefix,
+    buckets,
+    include=None,
+    exclude=None,
+    concurrency=1,
+    output=None,
+    handle_signals=True,
+    files_from=None,
+    checksum=None,
+    max_in_flight=None,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    part_size=PART_SIZE,
+    key_template=None,
+    timeout=None,
+    hedge=None,
+    drain_timeout=30.0,
+    checkpoint=None,
+    snapshot=None,
+):
+    """
+    This is a convenience wrapper around :class:`S3FanOut`.
+
+    """
+    uploader = S3FanOut(
+        directory,
+        prefix,
+        buckets,
+        include=include,
+        exclude=exclude,
+        concurrency=concurrency,
+        output=output,
+        handle_signals=handle_signals,
+        files_from=files_from,
+        checksum=checksum,
+        max_in_flight=max_in_flight,
+        multipart_threshold=multipart_threshold,
+        part_size=part_size,
+        key_template=key_template,
+        timeout=timeout,
+        hedge=hedge,
+        drain_timeout=drain_timeout,
+        checkpoint=checkpoint,
+        snapshot=snapshot,
+    )
+    return uploader.upload()
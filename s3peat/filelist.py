@@ -0,0 +1,229 @@
+"""
+A compact list of filenames, for trees with millions of files.
+
+A Python list of full path strings costs a string object per file, each
+repeating its whole directory. :class:`FileList` instead keeps each
+directory once, with the basenames in it joined into a single string, so a
+file costs little more than the length of its basename.
+
+It supports just what :class:`s3peat.S3Queue` needs from a list: taking the
+last filename, popping it, :func:`len`, and iterating over full paths, which
+are only built as they're used.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.filelist import FileList
+
+    filenames = FileList()
+    for path, dirs, files in os.walk('my/directory'):
+        for name in files:
+            filenames.append(os.path.join(path, name))
+
+    groups = filenames.split(8)
+
+:class:`PairList` does the same for pairs of filenames, such as duplicates
+and the originals they're copies of.
+
+"""
+
+import os
+
+# Basenames are joined with this, since it can't appear in a filename
+SEP = "\0"
+
+# Most basenames held in one chunk, so huge flat directories are still split
+CHUNK_NAMES = 4096
+
+
+class FileList(object):
+    """
+    A compact, list-like collection of filenames.
+
+    Filenames are stored in chunks of up to :data:`CHUNK_NAMES` names which
+    share a leading directory. Each chunk is a ``[head, names, end, count]``
+    list, where `head` is the directory including its trailing separator,
+    `names` is the basenames joined with NUL characters, `end` is where the
+    names still in the list end, and `count` is how many there are.
+
+    :param filenames: Filenames to start with (optional)
+    :type filenames: iterable
+
+    """
+
+    def __init__(self, filenames=None):
+        self._chunks = []
+        self._len = 0
+        # Basenames not yet joined into a chunk, and their directory
+        self._head = None
+        self._pending = []
+        if filenames is not None:
+            for filename in filenames:
+                self.append(filename)
+
+    def append(self, filename):
+        """Add `filename` to the end of the list."""
+        index = filename.rfind(os.path.sep) + 1
+        head = filename[:index]
+        if head != self._head:
+            self._flush()
+            self._head = head
+        elif len(self._pending) >= CHUNK_NAMES:
+            # Chunks of the same directory share one copy of its string
+            self._flush()
+        self._pending.append(filename[index:])
+        self._len += 1
+
+    def pop(self):
+        """Remove and return the last filename."""
+        self._flush()
+        if not self._chunks:
+            raise IndexError("pop from empty FileList")
+        chunk = self._chunks[-1]
+        head, names, end, count = chunk
+        start = names.rfind(SEP, 0, end) + 1
+        chunk[2] = max(start - 1, 0)
+        chunk[3] = count - 1
+        if not chunk[3]:
+            self._chunks.pop()
+        self._len -= 1
+        return head + names[start:end]
+
+    def split(self, count):
+        """
+        Return this list divided into `count` :class:`FileList` instances.
+
+        Each gets a contiguous run of filenames, so files in the same
+        directory mostly stay together.
+
+        """
+        self._flush()
+        groups = [FileList() for i in range(count)]
+        size, extra = divmod(self._len, count)
+        group = 0
+        # How many more filenames the current group should get
+        want = size + (1 if extra else 0)
+        for head, names, end, total in self._chunks:
+            start = 0
+            while total:
+                while not want:
+                    group += 1
+                    want = size + (1 if group < extra else 0)
+                take = min(want, total)
+                stop = _find_nth(names, SEP, take, start, end)
+                groups[group]._add_chunk(head, names[start:stop], take)
+                start = stop + 1
+                total -= take
+                want -= take
+        return groups
+
+    def _add_chunk(self, head, names, count):
+        """Add a whole chunk of `count` NUL separated `names` in `head`."""
+        self._flush()
+        self._chunks.append([head, names, len(names), count])
+        self._len += count
+
+    def _flush(self):
+        """Join any pending basenames into a chunk."""
+        if self._pending:
+            names = SEP.join(self._pending)
+            self._chunks.append([self._head, names, len(names), len(self._pending)])
+            self._pending = []
+
+    def __getitem__(self, index):
+        if not isinstance(index, int):
+            raise TypeError("FileList indices must be integers")
+        self._flush()
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError("FileList index out of range")
+
+        # Taking the last filename is what S3Queue does, so make it cheap
+        if index == self._len - 1:
+            head, names, end, count = self._chunks[-1]
+            return head + names[names.rfind(SEP, 0, end) + 1 : end]
+
+        for head, names, end, count in self._chunks:
+            if index < count:
+                return head + names[:end].split(SEP)[index]
+            index -= count
+
+    def __iter__(self):
+        self._flush()
+        for head, names, end, count in list(self._chunks):
+            for name in names[:end].split(SEP):
+                yield head + name
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return "<FileList of {} files in {} chunks>".format(
+            self._len, len(self._chunks) + (1 if self._pending else 0)
+        )
+
+
+class PairList(object):
+    """
+    A compact, list-like collection of ``(first, second)`` filename pairs,
+    kept as two :class:`FileList` instances.
+
+    :param pairs: Pairs of filenames to start with (optional)
+    :type pairs: iterable
+
+    """
+
+    def __init__(self, pairs=None):
+        self.first = FileList()
+        self.second = FileList()
+        if pairs is not None:
+            for pair in pairs:
+                self.append(pair)
+
+    def append(self, pair):
+        """Add the `pair` of filenames to the end of the list."""
+        first, second = pair
+        self.first.append(first)
+        self.second.append(second)
+
+    def pop(self):
+        """Remove and return the last pair."""
+        return self.first.pop(), self.second.pop()
+
+    def split(self, count):
+        """Return this list divided into `count` :class:`PairList` instances."""
+        groups = [PairList() for i in range(count)]
+        # Both lists are the same length, so they split at the same places
+        for group, first, second in zip(
+            groups, self.first.split(count), self.second.split(count)
+        ):
+            group.first, group.second = first, second
+        return groups
+
+    def __getitem__(self, index):
+        return self.first[index], self.second[index]
+
+    def __iter__(self):
+        return zip(self.first, self.second)
+
+    def __len__(self):
+        return len(self.first)
+
+    def __repr__(self):
+        return "<PairList of {} pairs>".format(len(self))
+
+
+def _find_nth(names, sep, n, start, end):
+    """
+    Return the index of the `n`-th `sep` in `names` after `start`, or `end`
+    if there aren't that many.
+
+    """
+    index = start - 1
+    for i in range(n):
+        index = names.find(sep, index + 1, end)
+        if index < 0:
+            return end
+    return index
@@ -0,0 +1,129 @@
+"""
+Hedged requests, so one stuck connection doesn't hold up the end of a run.
+
+Every so often a request to S3 stalls on a bad connection. A hedged request
+waits as long as most requests take, and if it still hasn't finished by then,
+sends the same request again on a fresh connection and takes whichever
+finishes first. Uploads are idempotent, so it's safe for both to complete.
+
+:class:`LatencyTracker` keeps the recent request times for the run, so the
+wait before hedging adapts to the network we're on.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.hedge import LatencyTracker, run_hedged
+
+    latencies = LatencyTracker()
+    delay = latencies.threshold(95, size=len(data))
+    result, hedged = run_hedged(lambda: put(client), lambda: put(fresh()), delay)
+
+"""
+
+import threading
+from collections import deque
+from queue import Empty, Queue
+
+# Request times are compared per MiB, but nothing counts as smaller than this
+MIN_SIZE = 1024 * 1024
+
+# Don't hedge until we know this much about how long requests take
+MIN_SAMPLES = 20
+
+
+class LatencyTracker(object):
+    """
+    Keep the latencies of the last `window` requests, shared between threads.
+
+    Since bigger requests take longer, latencies are kept per MiB of request
+    body, with anything under a MiB counted as one.
+
+    :param window: Number of recent requests to keep
+    :type window: int
+
+    """
+
+    def __init__(self, window=1000):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, size=0):
+        """Note a request of `size` bytes that took `elapsed` seconds."""
+        with self._lock:
+            self._samples.append(elapsed / _units(size))
+
+    def threshold(self, percentile, size=0):
+        """
+        Return the seconds within which `percentile` percent of requests for
+        `size` bytes have finished, or ``None`` if we don't know yet.
+
+        """
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            samples = sorted(self._samples)
+        index = min(int(len(samples) * percentile / 100.0), len(samples) - 1)
+        return samples[index] * _units(size)
+
+    def __len__(self):
+        return len(self._samples)
+
+
+def run_hedged(primary, backup, delay):
+    """
+    Call `primary`, and if it hasn't finished after `delay` seconds, call
+    `backup` as well.
+
+    Returns a tuple of the first successful result, and whether `backup` was
+    called. If every call made fails, the last exception is raised. A call
+    that loses the race is left to finish in the background.
+
+    :param primary: Makes the request
+    :param backup: Makes the same request on a fresh connection
+    :param delay: Seconds to wait before calling `backup`, or ``None`` to
+                  never call it
+    :type primary: callable
+    :type backup: callable
+    :type delay: float
+
+    """
+    if delay is None:
+        return primary(), False
+
+    results = Queue()
+    _start(primary, results)
+    try:
+        ok, value = results.get(timeout=delay)
+        hedged = False
+    except Empty:
+        _start(backup, results)
+        ok, value = results.get()
+        if not ok:
+            # One failed, but the other may still succeed
+            ok, value = results.get()
+        hedged = True
+
+    if not ok:
+        raise value
+    return value, hedged
+
+
+def _start(func, results):
+    """Call `func` in a daemon thread, putting its outcome on `results`."""
+
+    def call():
+        try:
+            results.put((True, func()))
+        except Exception as exc:
+            results.put((False, exc))
+
+    thread = threading.Thread(target=call, name="s3peat.hedge")
+    # A stuck request mustn't keep the program from exiting
+    thread.daemon = True
+    thread.start()
+
+
+def _units(size):
+    """Return `size` bytes in MiB, counting anything smaller as one."""
+    return max(size, MIN_SIZE) / float(MIN_SIZE)
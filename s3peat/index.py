@@ -0,0 +1,156 @@
+"""
+A compact index of the objects already in S3, for skipping files that don't
+need uploading again.
+
+A dict of Python strings costs well over a hundred bytes per key, which
+doesn't work for buckets with hundreds of millions of objects.
+:class:`RemoteIndex` is an open addressing hash table kept in three flat
+arrays, holding a 64 bit hash of each key with the object's size and modified
+time, for 24 bytes a slot. The number of slots is a power of two, kept no
+more than 70% full, so each key takes between 35 and 70 bytes: 500 million
+keys need 2**30 slots, or 24 GiB. Growing the table holds the old and new
+tables at once, so when the number of keys is known, it's best given as the
+`capacity` up front.
+
+Keys are only kept as hashes, so two keys could in theory collide, but with
+64 bits that's about a one in 37 billion chance per lookup even with 500
+million keys, and the sizes and times have to match too.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.index import RemoteIndex
+
+    index = RemoteIndex()
+    index.add('my/key', 1024, 1700000000)
+    index.get('my/key')  # (1024, 1700000000)
+
+"""
+
+import hashlib
+import struct
+from array import array
+
+# Grow the table once it's this full
+MAX_LOAD = 0.7
+
+# A hash of zero marks an empty slot
+EMPTY = 0
+
+# Written before the arrays: the number of slots, and of keys
+HEADER = struct.Struct("<QQ")
+
+
+class RemoteIndex(object):
+    """
+    Map S3 keys to the size and modified time of their objects.
+
+    The modified time is in whole seconds since the epoch.
+
+    :param capacity: Number of keys to make room for up front (optional)
+    :type capacity: int
+
+    """
+
+    def __init__(self, capacity=0):
+        self._len = 0
+        slots = 8
+        while slots * MAX_LOAD < capacity:
+            slots *= 2
+        self._alloc(slots)
+
+    def _alloc(self, slots):
+        """Replace the table with an empty one of `slots` slots."""
+        self._mask = slots - 1
+        # Repeating one element doesn't need a temporary buffer of zeros
+        self._hashes = array("Q", [EMPTY]) * slots
+        self._sizes = array("q", [0]) * slots
+        self._mtimes = array("q", [0]) * slots
+
+    def add(self, key, size, mtime):
+        """Add `key`, or update it, with the `size` and `mtime` of its object."""
+        if (self._len + 1) > MAX_LOAD * (self._mask + 1):
+            self._grow()
+        self._put(_hash(key), size, mtime)
+
+    def _put(self, hashed, size, mtime):
+        hashes = self._hashes
+        mask = self._mask
+        slot = hashed & mask
+        while hashes[slot] != EMPTY and hashes[slot] != hashed:
+            slot = (slot + 1) & mask
+        if hashes[slot] == EMPTY:
+            self._len += 1
+            hashes[slot] = hashed
+        self._sizes[slot] = size
+        self._mtimes[slot] = mtime
+
+    def _grow(self):
+        """Double the size of the table."""
+        hashes, sizes, mtimes = self._hashes, self._sizes, self._mtimes
+        self._alloc(2 * len(hashes))
+        self._len = 0
+        for slot, hashed in enumerate(hashes):
+            if hashed != EMPTY:
+                self._put(hashed, sizes[slot], mtimes[slot])
+
+    def get(self, key):
+        """
+        Return a tuple of the size and modified time of `key`'s object, or
+        ``None`` if it's not in the index.
+
+        """
+        hashed = _hash(key)
+        hashes = self._hashes
+        mask = self._mask
+        slot = hashed & mask
+        while hashes[slot] != EMPTY:
+            if hashes[slot] == hashed:
+                return self._sizes[slot], self._mtimes[slot]
+            slot = (slot + 1) & mask
+        return None
+
+    def write(self, f):
+        """
+        Write the index to the binary file object `f`, to be read back with
+        :meth:`read`. The arrays are written as they are in memory, so it can
+        only be read on a machine with the same byte order.
+
+        """
+        f.write(HEADER.pack(self._mask + 1, self._len))
+        for values in (self._hashes, self._sizes, self._mtimes):
+            values.tofile(f)
+
+    @classmethod
+    def read(cls, f):
+        """Return an index read from the binary file object `f`."""
+        slots, length = HEADER.unpack(f.read(HEADER.size))
+        if not slots or slots & (slots - 1) or length > slots:
+            raise ValueError("Not a saved index.")
+        index = cls()
+        index._mask = slots - 1
+        index._len = length
+        index._hashes = array("Q")
+        index._sizes = array("q")
+        index._mtimes = array("q")
+        for values in (index._hashes, index._sizes, index._mtimes):
+            values.fromfile(f, slots)
+        return index
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        return self._len
+
+    def __repr__(self):
+        return "<RemoteIndex of {} keys in {} slots>".format(self._len, self._mask + 1)
+
+
+def _hash(key):
+    """Return a 64 bit hash of `key` that's never :data:`EMPTY`."""
+    digest = hashlib.blake2b(
+        key.encode("utf-8", "surrogateescape"), digest_size=8
+    ).digest()
+    return int.from_bytes(digest, "little") or 1
@@ -0,0 +1,294 @@
+"""
+Read S3 Inventory reports, to find what's already in a bucket without listing
+it.
+
+Listing a prefix with hundreds of millions of objects takes longer than most
+uploads. S3 Inventory writes the same information out daily or weekly, as
+CSV, ORC or Parquet files described by a ``manifest.json``. Once they've been
+downloaded, :func:`load_inventory` reads them into a
+:class:`~s3peat.index.RemoteIndex`.
+
+The inventory must include the ``Size`` and ``LastModifiedDate`` fields. CSV
+reports are read with the standard library, while ORC and Parquet reports
+need the `pyarrow <https://pypi.org/project/pyarrow/>`_ package.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.inventory import load_inventory
+
+    index = load_inventory('inventory/2024-01-01T01-00Z/manifest.json',
+        prefix='my/key/')
+
+"""
+
+import calendar
+import csv
+import gzip
+import json
+import os
+from urllib.parse import quote_plus, unquote_plus
+
+from s3peat.index import RemoteIndex
+
+# Names of the columns we need in ORC and Parquet reports, by CSV field name
+COLUMNS = {
+    "Key": "key",
+    "Size": "size",
+    "LastModifiedDate": "last_modified_date",
+    "IsLatest": "is_latest",
+    "IsDeleteMarker": "is_delete_marker",
+}
+
+# Rows read from ORC and Parquet files at once
+BATCH_SIZE = 65536
+
+# Bytes of a CSV report read at once when counting its rows
+READ_SIZE = 1024 * 1024
+
+# Seconds in each unit of an Arrow timestamp
+TIME_UNITS = {"s": 1, "ms": 1000, "us": 10**6, "ns": 10**9}
+
+
+def load_inventory(manifest, prefix="", bucket=None):
+    """
+    Return a :class:`~s3peat.index.RemoteIndex` of the objects under `prefix`
+    in the inventory described by the `manifest` file.
+
+    The data files listed in the manifest are looked for next to it, in a
+    ``data`` directory next to it, or in a ``data`` directory next to its
+    parent, which is where S3 puts them.
+
+    The rows under `prefix` are counted first, which is much quicker than
+    reading them, so the index is made big enough up front. Growing it would
+    mean holding the old table and the new one at once.
+
+    :param manifest: Path to a downloaded inventory ``manifest.json``
+    :param prefix: Only index keys starting with this (optional)
+    :param bucket: Raise :class:`ValueError` if the inventory isn't of this
+                   bucket (optional)
+    :type manifest: str
+    :type prefix: str
+    :type bucket: str
+
+    """
+    with open(manifest) as f:
+        description = json.load(f)
+
+    source = description.get("sourceBucket")
+    if bucket is not None and source is not None and source != bucket:
+        raise ValueError(
+            "Inventory is of bucket {!r}, not {!r}.".format(source, bucket)
+        )
+
+    file_format = description.get("fileFormat", "CSV").upper()
+    if file_format == "CSV":
+        read = _read_csv
+    elif file_format in ("ORC", "PARQUET"):
+        read = _read_columnar
+    else:
+        raise ValueError("Unknown inventory format {!r}.".format(file_format))
+    fields = _fields(description.get("fileSchema", ""), file_format)
+
+    filenames = [
+        _find(manifest, entry["key"]) for entry in description.get("files", [])
+    ]
+    count = _count_csv if file_format == "CSV" else _count_columnar
+    index = RemoteIndex(sum(count(f, fields, file_format, prefix) for f in filenames))
+    for filename in filenames:
+        for key, size, mtime in read(filename, fields, file_format):
+            if key.startswith(prefix):
+                index.add(key, size, mtime)
+    return index
+
+
+def _fields(schema, file_format):
+    """
+    Return the field names from a manifest's `schema`, checking it has the
+    ones we need.
+
+    """
+    if file_format == "CSV":
+        fields = [field.strip() for field in schema.split(",")]
+    else:
+        # The columnar schemas are harder to parse, but the names are fixed
+        fields = [name for name, column in COLUMNS.items() if column in schema]
+
+    for required in ("Key", "Size", "LastModifiedDate"):
+        if required not in fields:
+            raise ValueError(
+                "Inventory must include the {} field to be used.".format(required)
+            )
+    return fields
+
+
+def _find(manifest, key):
+    """Return the local path of the inventory data file `key`."""
+    here = os.path.dirname(os.path.abspath(manifest))
+    name = key.rpartition("/")[2]
+    data = os.path.join(here, "data")
+    for directory in (here, data, os.path.join(os.path.dirname(here), "data")):
+        filename = os.path.join(directory, name)
+        if os.path.exists(filename):
+            return filename
+    raise IOError("Inventory data file {!r} was not found.".format(name))
+
+
+def _count_csv(filename, fields, file_format=None, prefix=""):
+    """
+    Return the number of rows in a CSV report with keys starting with
+    `prefix`, including any old versions and delete markers.
+
+    """
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rb") as f:
+        if not prefix:
+            return sum(
+                chunk.count(b"\n") for chunk in iter(lambda: f.read(READ_SIZE), b"")
+            )
+
+        # Keys are URL encoded, which may or may not include slashes. Fields
+        # are all quoted, and encoded keys have no quotes or commas in them.
+        key = fields.index("Key")
+        encoded = tuple(
+            quote_plus(prefix, safe=safe).encode("utf-8") for safe in ("", "/")
+        )
+        count = 0
+        for line in f:
+            if line.split(b'","', key + 1)[key].lstrip(b'"').startswith(encoded):
+                count += 1
+        return count
+
+
+def _read_csv(filename, fields, file_format=None):
+    """Yield ``(key, size, mtime)`` for each current object in a CSV report."""
+    key = fields.index("Key")
+    size = fields.index("Size")
+    modified = fields.index("LastModifiedDate")
+    latest = fields.index("IsLatest") if "IsLatest" in fields else None
+    deleted = fields.index("IsDeleteMarker") if "IsDeleteMarker" in fields else None
+
+    opener = gzip.open if filename.endswith(".gz") else open
+    with opener(filename, "rt", newline="", encoding="utf-8") as f:
+        for row in csv.reader(f):
+            if latest is not None and row[latest] != "true":
+                continue
+            if deleted is not None and row[deleted] == "true":
+                continue
+            if not row[size]:
+                continue
+            # Keys are URL encoded in CSV reports
+            yield unquote_plus(row[key]), int(row[size]), _timestamp(row[modified])
+
+
+def _count_columnar(filename, fields, file_format, prefix=""):
+    """
+    Return the number of rows in an ORC or Parquet report with keys starting
+    with `prefix`, including any old versions and delete markers.
+
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError(
+            "{} inventories need the pyarrow package installed.".format(file_format)
+        )
+
+    if file_format == "ORC":
+        from pyarrow import orc
+
+        report = orc.ORCFile(filename)
+        if not prefix:
+            return report.nrows
+        batches = (
+            report.read_stripe(i, columns=["key"]) for i in range(report.nstripes)
+        )
+    else:
+        from pyarrow import parquet
+
+        report = parquet.ParquetFile(filename)
+        if not prefix:
+            return report.metadata.num_rows
+        batches = report.iter_batches(batch_size=BATCH_SIZE, columns=["key"])
+
+    import pyarrow.compute
+
+    count = 0
+    for batch in batches:
+        matches = pyarrow.compute.starts_with(batch.column(0), pattern=prefix)
+        count += pyarrow.compute.sum(matches).as_py() or 0
+    return count
+
+
+def _read_columnar(filename, fields, file_format):
+    """
+    Yield ``(key, size, mtime)`` for each current object in an ORC or Parquet
+    report.
+
+    """
+    try:
+        import pyarrow
+    except ImportError:
+        raise ValueError(
+            "{} inventories need the pyarrow package installed.".format(file_format)
+        )
+
+    columns = [COLUMNS[field] for field in fields]
+    if file_format == "ORC":
+        from pyarrow import orc
+
+        report = orc.ORCFile(filename)
+        batches = (
+            report.read_stripe(i, columns=columns) for i in range(report.nstripes)
+        )
+    else:
+        from pyarrow import parquet
+
+        report = parquet.ParquetFile(filename)
+        batches = report.iter_batches(batch_size=BATCH_SIZE, columns=columns)
+
+    for batch in batches:
+        data = {}
+        for name in columns:
+            column = batch.column(batch.schema.get_field_index(name))
+            if pyarrow.types.is_timestamp(column.type):
+                unit = TIME_UNITS[column.type.unit]
+                values = column.cast(pyarrow.int64()).to_pylist()
+                column = [
+                    value // unit if value is not None else None for value in values
+                ]
+            else:
+                column = column.to_pylist()
+            data[name] = column
+
+        latest = data.get("is_latest")
+        deleted = data.get("is_delete_marker")
+        for i, key in enumerate(data["key"]):
+            if latest is not None and not latest[i]:
+                continue
+            if deleted is not None and deleted[i]:
+                continue
+            size = data["size"][i]
+            if size is None:
+                continue
+            yield key, size, data["last_modified_date"][i] or 0
+
+
+def _timestamp(value):
+    """
+    Return the seconds since the epoch for an inventory date like
+    ``2024-01-01T12:00:00.000Z``.
+
+    """
+    # Much quicker than strptime, which matters for millions of rows
+    return calendar.timegm(
+        (
+            int(value[0:4]),
+            int(value[5:7]),
+            int(value[8:10]),
+            int(value[11:13]),
+            int(value[14:16]),
+            int(value[17:19]),
+        )
+    )
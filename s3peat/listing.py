@@ -0,0 +1,233 @@
+"""
+Keep what's in S3 cached between runs, so syncing to the same prefix again
+doesn't list all of it again.
+
+:class:`ListingCache` splits the keys under a prefix by their top level
+"directory", and keeps each directory's objects in a
+:class:`~s3peat.index.RemoteIndex` along with when it was listed. A directory
+is only listed when a file is about to be uploaded into it and its listing is
+older than the TTL, and keys are added as they're uploaded, so a run which
+adds a few files to a few directories lists those directories at most.
+
+Objects deleted from S3 by anything else stay in the cache until their
+directory is listed again, and files matching them aren't uploaded until
+then, so the TTL should be short enough for that not to matter.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.listing import ListingCache
+
+    listing = ListingCache('.s3peat-listing', client, 'my-bucket', 'my/key/')
+    listing.load()
+    listing.get('my/key/some/file')  # (size, mtime) or None
+    listing.save()
+
+"""
+
+import json
+import logging
+import os
+import struct
+import sys
+import time
+from threading import Lock
+
+from s3peat.index import RemoteIndex
+
+# Bumped whenever the saved format changes, so old caches are ignored
+VERSION = 1
+
+# Seconds a directory's listing is used for before it's listed again
+TTL = 24 * 60 * 60
+
+
+class ListingCache(object):
+    """
+    The objects under `prefix` in `bucket`, by top level directory, saved to
+    `filename` between runs.
+
+    This can be used in place of a :class:`~s3peat.index.RemoteIndex`.
+    :meth:`get` lists a key's directory the first time it's asked about one
+    whose listing is more than `ttl` seconds old, and :meth:`add` may be
+    called from any thread. After a run, :attr:`listed` is the number of
+    directories that were listed, and :attr:`reused` the number whose cached
+    listing was used.
+
+    :param filename: File to load the cache from and save it to
+    :param client: A boto3 S3 client, for listing
+    :param bucket: S3 bucket name
+    :param prefix: S3 key prefix, ending with ``/`` unless it's empty
+    :param ttl: Seconds to use a listing for (default: one day)
+    :type filename: str
+    :type bucket: str
+    :type prefix: str
+    :type ttl: float
+
+    """
+
+    def __init__(self, filename, client, bucket, prefix="", ttl=TTL):
+        self.filename = filename
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.ttl = ttl
+        # Top level directory names, mapped to [time listed, RemoteIndex]
+        self.listings = {}
+        self.listed = 0
+        self.reused = 0
+        self.log = logging.getLogger("ListingCache")
+        # Directories we've already checked are fresh enough
+        self._checked = set()
+        self._lock = Lock()
+
+    def load(self):
+        """
+        Load the saved cache, returning ``False`` if there isn't a usable one
+        for this bucket and prefix.
+
+        """
+        listings = {}
+        try:
+            with open(self.filename, "rb") as f:
+                saved = json.loads(f.readline())
+                if (
+                    saved.get("version") != VERSION
+                    or saved.get("byteorder") != sys.byteorder
+                    or saved.get("bucket") != self.bucket
+                    or saved.get("prefix") != self.prefix
+                ):
+                    return False
+                # The indexes follow in the same order as their names
+                for name, listed in saved["listed"]:
+                    listings[name] = [listed, RemoteIndex.read(f)]
+        except (OSError, ValueError, KeyError, TypeError, EOFError, struct.error):
+            return False
+        self.listings = listings
+        return True
+
+    def save(self, timeout=None):
+        """
+        Save the cache, replacing the old one in one go.
+
+        Returns ``False`` without saving if the cache is still in use after
+        `timeout` seconds. A signal handler may have interrupted this thread
+        while it was using the cache, in which case it'd never be free.
+
+        """
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        temp = self.filename + ".tmp"
+        try:
+            with open(temp, "wb") as f:
+                saved = {
+                    "version": VERSION,
+                    "byteorder": sys.byteorder,
+                    "bucket": self.bucket,
+                    "prefix": self.prefix,
+                    "listed": [
+                        [name, entry[0]] for name, entry in self.listings.items()
+                    ],
+                }
+                f.write(json.dumps(saved, separators=(",", ":")).encode("utf-8"))
+                f.write(b"\n")
+                for entry in self.listings.values():
+                    entry[1].write(f)
+        finally:
+            self._lock.release()
+        os.replace(temp, self.filename)
+        return True
+
+    def get(self, key):
+        """
+        Return a tuple of the size and modified time of `key`'s object, or
+        ``None`` if it's not in S3, listing its directory first if need be.
+
+        """
+        name = self._directory(key)
+        if name is None:
+            return None
+        if name not in self._checked:
+            self._refresh(name)
+        with self._lock:
+            entry = self.listings.get(name)
+            return entry[1].get(key) if entry else None
+
+    def add(self, key, size, mtime):
+        """Add `key`, or update it, with the `size` and `mtime` of its object."""
+        name = self._directory(key)
+        if name is None:
+            return
+        with self._lock:
+            entry = self.listings.get(name)
+            if entry is None:
+                # It's never been listed, so it will be when it's next needed
+                entry = self.listings[name] = [0, RemoteIndex()]
+            entry[1].add(key, size, mtime)
+
+    def expire(self):
+        """Have every directory listed again the next time it's needed."""
+        with self._lock:
+            for entry in self.listings.values():
+                entry[0] = 0
+        self._checked.clear()
+
+    def _refresh(self, name):
+        """List the directory `name` again if its listing is too old."""
+        self._checked.add(name)
+        entry = self.listings.get(name)
+        if entry is not None and entry[0] > time.time() - self.ttl:
+            self.reused += 1
+            return
+
+        listed = time.time()
+        index = RemoteIndex()
+        try:
+            for obj in self._list(name):
+                modified = int(obj["LastModified"].timestamp())
+                index.add(obj["Key"], obj["Size"], modified)
+        except Exception:
+            # Without a listing, its files are all uploaded
+            self.log.debug("Failed listing %r", name, exc_info=True)
+            with self._lock:
+                self.listings.pop(name, None)
+            return
+
+        self.listed += 1
+        with self._lock:
+            self.listings[name] = [listed, index]
+
+    def _list(self, name):
+        """Yield the summaries of the objects in the directory `name`."""
+        paginator = self.client.get_paginator("list_objects_v2")
+        if name:
+            pages = paginator.paginate(
+                Bucket=self.bucket, Prefix=self.prefix + name + "/"
+            )
+        else:
+            # Just the objects that aren't in a directory
+            pages = paginator.paginate(
+                Bucket=self.bucket, Prefix=self.prefix, Delimiter="/"
+            )
+        for page in pages:
+            for obj in page.get("Contents", []):
+                yield obj
+
+    def _directory(self, key):
+        """
+        Return the top level directory of `key` below the prefix, ``""`` if
+        it's not in one, or ``None`` if it's not below the prefix at all.
+
+        """
+        if not key.startswith(self.prefix):
+            return None
+        rest = key[len(self.prefix) :]
+        return rest.partition("/")[0] if "/" in rest else ""
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(entry[1]) for entry in self.listings.values())
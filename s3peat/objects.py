@@ -0,0 +1,253 @@
+"""
+Fast uploading of objects made in memory, without writing them to disk.
+
+Each object is a ``(key, body)`` tuple, where `body` is the bytes to upload,
+a binary file object to read them from, or an iterable of bytes chunks, such
+as a generator. The objects are uploaded by the same threaded queues as
+:func:`s3peat.sync_to_s3`, and may themselves come from a generator, so they
+only need to exist as they're uploaded.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat import S3Bucket, upload_objects
+
+    bucket = S3Bucket('my-bucket', AWS_KEY, AWS_SECRET)
+
+    def reports():
+        for customer in customers:
+            yield 'reports/{}.html'.format(customer.id), render(customer)
+
+    # A list of keys will be returned if there were failures in uploading
+    failures = upload_objects(reports(), prefix='my/key', bucket=bucket,
+        concurrency=50)
+
+"""
+
+from itertools import chain
+
+from s3peat import MULTIPART_THRESHOLD, PART_SIZE, S3Queue, S3Uploader
+
+
+class S3ObjectQueue(S3Queue):
+    """
+    Take a list of ``(key, body)`` tuples and upload each `body` to `bucket`
+    with leading key `prefix`.
+
+    This works just like :class:`S3Queue`, except `filenames` holds objects
+    instead of filenames, and the :attr:`~S3Queue.failed` list and
+    :attr:`~S3Queue.checksums` dict use their keys, without `prefix`.
+
+    Bytes-like bodies are uploaded as they are. File objects and iterables
+    are read in chunks, and once more than `multipart_threshold` bytes have
+    been read they're uploaded as a multipart upload of `part_size` parts,
+    which are sent as they're read. Since the size isn't known ahead of
+    time, these can't be bigger than `part_size` times
+    :data:`~s3peat.MAX_PARTS`.
+
+    """
+
+    def _transfer(self, item, bucket):
+        self._upload_object(item, bucket)
+
+    def _upload_object(self, item, bucket):
+        """
+        Upload the object `item` to `bucket`.
+
+        :param item: A ``(key, body)`` tuple
+        :param bucket: A boto3 S3 bucket resource
+        :type item: tuple
+        :type bucket: boto3.resources.factory.s3.Bucket
+
+        """
+        name, body = item
+        key = None
+        try:
+            key = self._object_key(name)
+            if isinstance(body, (bytes, bytearray, memoryview)):
+                self._put(bucket, key, name, body)
+            elif hasattr(body, "read"):
+                chunks = iter(lambda: body.read(self.part_size), b"")
+                self._put_chunks(bucket, key, name, chunks)
+            else:
+                self._put_chunks(bucket, key, name, iter(body))
+        except Exception:
+            self.log.debug("Failed %r", key, exc_info=True)
+            self.failed.append(name)
+            if self.counter:
+                self.counter(False)
+        else:
+            self.log.debug("Uploaded %r", key)
+            if self.counter:
+                self.counter()
+
+    def _put_chunks(self, bucket, key, name, chunks):
+        """
+        Upload the bytes in the iterable `chunks` to `key`, in parts if
+        there's enough of them.
+
+        """
+        buffer = bytearray()
+        for chunk in chunks:
+            buffer += chunk
+            if len(buffer) > self.multipart_threshold:
+                break
+        else:
+            # It all fit, so it goes in one request
+            self._put(bucket, key, name, buffer)
+            return
+
+        parts = _parts(buffer, chunks, self.part_size)
+        checksum = self._put_parts(bucket, key, parts)
+        if self.checksum:
+            self.checksums[name] = checksum
+
+    def _object_key(self, name):
+        """Return the S3 key for an object called `name`."""
+        name = name.lstrip("/")
+        return "/".join((self.prefix, name)) if self.prefix else name
+
+
+class S3ObjectUploader(S3Uploader):
+    """
+    Runs a set of parallel uploads of objects from memory.
+
+    :param objects: Iterable of ``(key, body)`` tuples
+    :param prefix: S3 key prefix
+    :param bucket: A :class:`S3Bucket` instance
+    :param concurrency: Number of concurrent uploads to use (default: 1)
+    :param output: File or stream to output progress to (optional)
+    :param checksum: Checksum to send with each upload for S3 to verify, one
+                     of :data:`~s3peat.CHECKSUMS` (optional)
+    :param multipart_threshold: Objects larger than this are uploaded in
+                                parts (default: 64 MiB)
+    :param part_size: Size of uploaded parts, in bytes (default: 16 MiB)
+    :param timeout: Seconds to wait connecting, or for each read or write on
+                    a connection, before giving up on a request (optional)
+    :param hedge: Percentile of request times after which a slow request is
+                  sent again on a fresh connection (optional)
+    :type objects: iterable
+    :type prefix: str
+    :type bucket: :class:`S3Bucket`
+    :type concurrency: int
+    :type output: file
+
+    Each object's key is `prefix`, a ``/``, and the key it's given with.
+    Objects are taken from `objects` as the upload threads are ready for
+    them, with only a couple waiting per thread, so a generator of objects
+    doesn't have to make them all up front. See :class:`S3ObjectQueue` for
+    the bodies that can be uploaded.
+
+    """
+
+    def __init__(
+        self,
+        objects,
+        prefix,
+        bucket,
+        concurrency=1,
+        output=None,
+        handle_signals=True,
+        checksum=None,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=PART_SIZE,
+        timeout=None,
+        hedge=None,
+    ):
+        super(S3ObjectUploader, self).__init__(
+            None,
+            prefix,
+            bucket,
+            concurrency=concurrency,
+            output=output,
+            handle_signals=handle_signals,
+            checksum=checksum,
+            multipart_threshold=multipart_threshold,
+            part_size=part_size,
+            timeout=timeout,
+            hedge=hedge,
+        )
+        self.objects = objects
+
+    def upload(self):
+        """
+        Starts the uploading and returns a list of failed keys.
+
+        """
+        if not self._prepare():
+            return
+
+        # Objects may take a lot of memory, so don't let many wait
+        stream = self._start_stream(self.concurrency * 2)
+
+        self.total = 0
+        objects = iter(self.objects)
+        # The keys of whatever's left when stopping haven't been queued yet
+        pending = (key for key, body in objects)
+        self._pending.append(pending)
+        for item in objects:
+            self.total += 1
+            self._output()
+            # This may wait, see _remaining
+            self._in_hand = item[0]
+            stream.put(item)
+            self._in_hand = None
+        self._pending.remove(pending)
+
+        self._stop_stream(stream)
+        return self._finish()
+
+    def _new_queue(self, objects, queue_class=None):
+        return super(S3ObjectUploader, self)._new_queue(
+            objects, queue_class or S3ObjectQueue
+        )
+
+
+def upload_objects(
+    objects,
+    prefix,
+    bucket,
+    concurrency=1,
+    output=None,
+    handle_signals=True,
+    checksum=None,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    part_size=PART_SIZE,
+    timeout=None,
+    hedge=None,
+):
+    """
+    This is a convenience wrapper around :class:`S3ObjectUploader`.
+
+    """
+    uploader = S3ObjectUploader(
+        objects,
+        prefix,
+        bucket,
+        concurrency=concurrency,
+        output=output,
+        handle_signals=handle_signals,
+        checksum=checksum,
+        multipart_threshold=multipart_threshold,
+        part_size=part_size,
+        timeout=timeout,
+        hedge=hedge,
+    )
+    return uploader.upload()
+
+
+def _parts(buffer, chunks, size):
+    """
+    Yield `size` byte parts of `buffer` followed by the bytes in `chunks`,
+    with whatever's left over as a smaller last part.
+
+    """
+    buffer = bytearray(buffer)
+    for chunk in chain([b""], chunks):
+        buffer += chunk
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,211 @@
+"""
+Spread uploads across key prefixes, and back off the ones S3 is throttling.
+
+S3 limits the request rate for each key prefix, so when every thread uploads
+files from the same giant directory at once, S3 answers with ``503 SlowDown``.
+:class:`PrefixQueue` hands out filenames round-robin across the top level key
+prefixes instead, and when one prefix is throttled only that prefix is backed
+off, while the others keep going at full speed.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.schedule import PrefixQueue
+
+    stream = PrefixQueue(lambda filename: filename.split('/')[0])
+    for filename in filenames:
+        stream.put(filename)
+
+"""
+
+import time
+from collections import OrderedDict, deque
+from queue import Queue
+
+# Error codes S3 uses when we're going too fast
+THROTTLE_CODES = frozenset(
+    ("SlowDown", "503", "ServiceUnavailable", "Throttling", "RequestLimitExceeded")
+)
+
+# Backoff for a throttled prefix starts here, and doubles up to the maximum
+MIN_BACKOFF = 0.5
+MAX_BACKOFF = 30.0
+
+# Filenames to hold at most while spreading them out, so walking a huge tree
+# doesn't hold all of it in memory, while still seeing many prefixes at once
+SPREAD_SIZE = 100000
+
+
+class PrefixQueue(Queue):
+    """
+    A :class:`queue.Queue` of filenames which are taken round-robin across
+    their key prefixes, skipping prefixes that are backing off.
+
+    `key_prefix` is called with each item put on the queue, and returns the
+    prefix it'll be scheduled under. ``None`` items, which tell upload threads
+    to stop, are only handed out once everything else is gone.
+
+    When an upload is throttled, :meth:`throttled` backs off that item's
+    prefix and puts the item back to try again later. :meth:`succeeded`
+    shortens the backoff again.
+
+    Queues given the same `backoff` dict share their backoff, so a prefix
+    throttled on one is backed off on all of them.
+
+    Like a :class:`queue.Queue`, :meth:`put` blocks while there are `maxsize`
+    items waiting across all the prefixes. Items put back by
+    :meth:`throttled` don't wait for room, so upload threads can't block each
+    other.
+
+    :param key_prefix: Returns the prefix for an item
+    :param max_retries: Most times an item is put back after being throttled
+    :param maxsize: Most items to hold, ``0`` for no limit (default: ``0``)
+    :param backoff: Dict to keep the prefixes backing off in (optional)
+    :type key_prefix: callable
+    :type max_retries: int
+    :type maxsize: int
+    :type backoff: dict
+
+    """
+
+    def __init__(self, key_prefix, max_retries=5, maxsize=0, backoff=None):
+        self.key_prefix = key_prefix
+        self.max_retries = max_retries
+        # Prefixes backing off, mapped to their (backoff, until) times
+        self._backoff = {} if backoff is None else backoff
+        super(PrefixQueue, self).__init__(maxsize)
+
+    def _init(self, maxsize):
+        # Items waiting under each prefix, in the order we'll visit them
+        self._prefixes = OrderedDict()
+        # Number of times each item has been throttled
+        self._retries = {}
+        self._sentinels = deque()
+        self._size = 0
+
+    def _qsize(self):
+        return self._size
+
+    def _put(self, item):
+        self._size += 1
+        if item is None:
+            self._sentinels.append(item)
+            return
+        prefix = self.key_prefix(item)
+        if prefix not in self._prefixes:
+            self._prefixes[prefix] = deque()
+        self._prefixes[prefix].append(item)
+
+    def _get(self):
+        self._size -= 1
+        if not self._prefixes:
+            return self._sentinels.popleft()
+
+        # Take from the next prefix that isn't backing off, or if they all
+        # are, the one that'll be ready soonest
+        now = time.time()
+        chosen = None
+        for prefix in self._prefixes:
+            until = self._until(prefix)
+            if until <= now:
+                chosen = prefix
+                break
+            if chosen is None or until < self._until(chosen):
+                chosen = prefix
+
+        items = self._prefixes[chosen]
+        item = items.popleft()
+        if items:
+            # Go to the back of the line
+            self._prefixes.move_to_end(chosen)
+        else:
+            del self._prefixes[chosen]
+        return item
+
+    def _until(self, prefix):
+        """Return when `prefix` is done backing off."""
+        return self._backoff.get(prefix, (0, 0))[1]
+
+    def items(self):
+        """
+        Return a list of the items on the queue, in the order they'd be taken
+        if nothing was backing off. The caller should hold :attr:`mutex`.
+
+        """
+        items = []
+        queues = [deque(q) for q in self._prefixes.values()]
+        while queues:
+            for q in queues:
+                items.append(q.popleft())
+            queues = [q for q in queues if q]
+        return items
+
+    def delay(self, item):
+        """Return the seconds until the prefix of `item` is done backing off."""
+        with self.mutex:
+            return max(self._until(self.key_prefix(item)) - time.time(), 0)
+
+    def throttled(self, item):
+        """
+        Back off the prefix of `item`, and put `item` back on the queue.
+
+        Returns ``False`` if `item` has been throttled too many times already,
+        in which case it isn't put back.
+
+        """
+        with self.mutex:
+            prefix = self.key_prefix(item)
+            backoff = self._backoff.get(prefix, (0, 0))[0]
+            backoff = min(max(backoff * 2, MIN_BACKOFF), MAX_BACKOFF)
+            self._backoff[prefix] = (backoff, time.time() + backoff)
+
+            retries = self._retries.get(item, 0) + 1
+            if retries > self.max_retries:
+                self._retries.pop(item, None)
+                return False
+            self._retries[item] = retries
+
+            # This is an item we already had room for
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        return True
+
+    def succeeded(self, item):
+        """Note that `item` was uploaded, easing off its prefix's backoff."""
+        with self.mutex:
+            self._retries.pop(item, None)
+            prefix = self.key_prefix(item)
+            # Another queue sharing the backoff may have just removed it
+            entry = self._backoff.get(prefix)
+            if entry is None:
+                return
+            backoff, until = entry
+            if backoff / 2 < MIN_BACKOFF:
+                self._backoff.pop(prefix, None)
+            else:
+                self._backoff[prefix] = (backoff / 2, until)
+
+
+def top_prefix(key, prefix=""):
+    """
+    Return the top level "directory" of `key` below `prefix`, or ``""`` if
+    it's not in one.
+
+    """
+    if prefix and key.startswith(prefix + "/"):
+        key = key[len(prefix) + 1 :]
+    return key.partition("/")[0] if "/" in key else ""
+
+
+def is_throttle(exc):
+    """Return ``True`` if the exception `exc` means S3 is throttling us."""
+    import botocore.exceptions
+
+    if not isinstance(exc, botocore.exceptions.ClientError):
+        return False
+    response = exc.response
+    code = response.get("Error", {}).get("Code")
+    status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    return code in THROTTLE_CODES or status == 503
@@ -3,7 +3,10 @@ from __future__ import print_function
 import logging
 import os
 import re
+import signal
 import sys
+import tarfile
+import zipfile
 from builtins import str
 
 from pytool.cmd import Command
@@ -58,6 +61,193 @@ class Main(Command):
             help="inclusion regex",
         )
 
+        self.opt(
+            "--files-from",
+            "-f",
+            metavar="",
+            help="read paths to upload from a file ('-' for stdin)",
+        )
+
+        self.opt(
+            "--watch",
+            "-w",
+            action="store_true",
+            help="keep uploading new and modified files until stopped",
+        )
+
+        self.opt(
+            "--settle",
+            metavar="",
+            type=float,
+            default=1.0,
+            help="seconds a watched file must be unchanged before upload",
+        )
+
+        self.opt(
+            "--delete",
+            action="store_true",
+            help="delete keys under the prefix with no matching file",
+        )
+
+        self.opt(
+            "--max-delete",
+            metavar="",
+            type=int,
+            default=1000,
+            help="refuse to delete more than this many keys (default 1000)",
+        )
+
+        self.opt(
+            "--checksum",
+            choices=s3peat.CHECKSUMS,
+            help="send a checksum with each upload for S3 to verify",
+        )
+
+        self.opt(
+            "--max-in-flight",
+            metavar="",
+            type=int,
+            help="MiB of file data to hold in memory, reading ahead",
+        )
+
+        self.opt(
+            "--large-concurrency",
+            metavar="",
+            type=int,
+            help="threads to use for large files, in a lane of their own",
+        )
+
+        self.opt(
+            "--large-size",
+            metavar="",
+            type=int,
+            default=8,
+            help="MiB over which files go in the large file lane (default 8)",
+        )
+
+        self.opt(
+            "--key-template",
+            metavar="",
+            help="format keys from {prefix}, {path}, {hash}, {mtime}, etc.",
+        )
+
+        self.opt(
+            "--spread-prefixes",
+            action="store_true",
+            help="interleave uploads across key prefixes to avoid throttling",
+        )
+
+        self.opt(
+            "--timeout",
+            metavar="",
+            type=float,
+            help="seconds a request may stall before it's given up on",
+        )
+
+        self.opt(
+            "--hedge",
+            metavar="",
+            type=float,
+            help="resend requests slower than this percentile, e.g. 95",
+        )
+
+        self.opt(
+            "--inventory",
+            metavar="",
+            help="skip files already in this downloaded S3 Inventory manifest.json",
+        )
+
+        self.opt(
+            "--listing-cache",
+            metavar="",
+            help="skip files already uploaded, using a listing of S3 kept here",
+        )
+
+        self.opt(
+            "--listing-ttl",
+            metavar="",
+            type=float,
+            default=24 * 60 * 60,
+            help="seconds to use a cached listing for (default 1 day)",
+        )
+
+        self.opt(
+            "--snapshot",
+            metavar="",
+            help="skip listing unchanged directories, using a snapshot kept here",
+        )
+
+        self.opt(
+            "--checkpoint",
+            metavar="",
+            help="when stopped, write the files left to this for --files-from",
+        )
+
+        self.opt(
+            "--drain-timeout",
+            metavar="",
+            type=float,
+            default=30.0,
+            help="seconds to let uploads finish when stopped (default 30)",
+        )
+
+        self.opt(
+            "--dedup",
+            action="store_true",
+            help="upload identical files once and copy the rest in S3",
+        )
+
+        self.opt(
+            "--download",
+            action="store_true",
+            help="download the prefix into the directory instead",
+        )
+
+        self.opt(
+            "--fan-out",
+            metavar="",
+            action="append",
+            help="also upload to this bucket, reading each file once (repeatable)",
+        )
+
+        self.opt(
+            "--archive",
+            action="store_true",
+            help="upload the members of a tar or zip file ('-' for a tar on stdin)",
+        )
+
+        self.opt(
+            "--stream",
+            metavar="",
+            help="upload stdin to this key under the prefix, several parts at once",
+        )
+
+        self.opt(
+            "--part-size",
+            metavar="",
+            type=int,
+            default=16,
+            help="MiB in each part of a multipart upload or download (default 16)",
+        )
+
+        self.opt(
+            "--daemon",
+            metavar="",
+            help="keep uploading jobs sent over HTTP to HOST:PORT or a Unix socket",
+        )
+
+        self.opt(
+            "--listen-any",
+            action="store_true",
+            help="let --daemon listen on addresses other than loopback",
+        )
+
+        self.opt(
+            "--copy-from",
+            metavar="",
+            help="copy from BUCKET[/PREFIX] in S3 instead of a directory",
+        )
+
         self.opt("--private", "-r", action="store_true", help="do not set ACL public")
 
         self.opt(
@@ -77,7 +267,7 @@ class Main(Command):
 
         self.opt("--version", action="version", version=s3peat.version())
 
-        self.opt("directory", help="directory to be uploaded")
+        self.opt("directory", nargs="?", help="directory to be uploaded")
 
     def run(self):
         """
@@ -90,6 +280,204 @@ class Main(Command):
             print("Concurrency must be positive.", file=sys.stderr)
             sys.exit(1)
 
+        if a.copy_from:
+            if a.directory or a.files_from or a.watch or a.delete or a.download:
+                print(
+                    "--copy-from can't be used with a directory, --files-from, "
+                    "--watch, --delete or --download.",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+        elif not a.directory and not a.stream and not a.daemon:
+            print("A directory is required.", file=sys.stderr)
+            sys.exit(1)
+
+        if a.dedup and (a.files_from or a.watch):
+            print(
+                "--dedup can't be used with --files-from or --watch.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.delete and (a.files_from or a.watch):
+            print(
+                "--delete can't be used with --files-from or --watch.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.download and (a.files_from or a.watch or a.delete or a.checksum):
+            print(
+                "--download can't be used with --files-from, --watch, --delete "
+                "or --checksum.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.hedge is not None and not 0 < a.hedge < 100:
+            print("--hedge must be a percentile between 0 and 100.", file=sys.stderr)
+            sys.exit(1)
+
+        if a.key_template and (a.delete or a.download or a.copy_from):
+            print(
+                "--key-template can't be used with --delete, --download or "
+                "--copy-from.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.snapshot and (a.files_from or a.download or a.copy_from):
+            print(
+                "--snapshot can't be used with --files-from, --download or "
+                "--copy-from.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.inventory and (a.download or a.copy_from):
+            print(
+                "--inventory can't be used with --download or --copy-from.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.listing_cache and (a.inventory or a.download or a.copy_from):
+            print(
+                "--listing-cache can't be used with --inventory, --download or "
+                "--copy-from.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.large_concurrency and (a.download or a.copy_from):
+            print(
+                "--large-concurrency can't be used with --download or --copy-from.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.fan_out and (
+            a.download
+            or a.copy_from
+            or a.watch
+            or a.delete
+            or a.dedup
+            or a.inventory
+            or a.listing_cache
+            or a.large_concurrency
+            or a.spread_prefixes
+        ):
+            print(
+                "--fan-out can't be used with --download, --copy-from, --watch, "
+                "--delete, --dedup, --inventory, --listing-cache, "
+                "--large-concurrency or --spread-prefixes.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.archive and (
+            a.files_from
+            or a.watch
+            or a.delete
+            or a.dedup
+            or a.download
+            or a.copy_from
+            or a.fan_out
+            or a.key_template
+            or a.snapshot
+            or a.inventory
+            or a.listing_cache
+            or a.large_concurrency
+            or a.spread_prefixes
+            or a.checkpoint
+            or a.max_in_flight
+            or a.dry_run
+        ):
+            print(
+                "--archive can't be used with --files-from, --watch, --delete, "
+                "--dedup, --download, --copy-from, --fan-out, --key-template, "
+                "--snapshot, --inventory, --listing-cache, --large-concurrency, "
+                "--spread-prefixes, --checkpoint, --max-in-flight or --dry-run.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.stream and (
+            a.directory
+            or a.files_from
+            or a.watch
+            or a.delete
+            or a.dedup
+            or a.download
+            or a.copy_from
+            or a.fan_out
+            or a.archive
+            or a.key_template
+            or a.snapshot
+            or a.inventory
+            or a.listing_cache
+            or a.large_concurrency
+            or a.spread_prefixes
+            or a.checkpoint
+            or a.max_in_flight
+            or a.dry_run
+        ):
+            print(
+                "--stream can't be used with a directory, --files-from, --watch, "
+                "--delete, --dedup, --download, --copy-from, --fan-out, "
+                "--archive, --key-template, --snapshot, --inventory, "
+                "--listing-cache, --large-concurrency, --spread-prefixes, "
+                "--checkpoint, --max-in-flight or --dry-run.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.daemon and (
+            a.directory
+            or a.files_from
+            or a.watch
+            or a.delete
+            or a.dedup
+            or a.download
+            or a.copy_from
+            or a.fan_out
+            or a.archive
+            or a.stream
+            or a.key_template
+            or a.snapshot
+            or a.inventory
+            or a.listing_cache
+            or a.large_concurrency
+            or a.spread_prefixes
+            or a.checkpoint
+            or a.max_in_flight
+            or a.dry_run
+        ):
+            print(
+                "--daemon can't be used with a directory, --files-from, --watch, "
+                "--delete, --dedup, --download, --copy-from, --fan-out, "
+                "--archive, --stream, --key-template, --snapshot, --inventory, "
+                "--listing-cache, --large-concurrency, --spread-prefixes, "
+                "--checkpoint, --max-in-flight or --dry-run.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
+        if a.listen_any and not a.daemon:
+            print("--listen-any can only be used with --daemon.", file=sys.stderr)
+            sys.exit(1)
+
+        if a.part_size < 5:
+            print("--part-size must be at least 5 MiB.", file=sys.stderr)
+            sys.exit(1)
+
+        if a.checkpoint and (a.download or a.copy_from):
+            print(
+                "--checkpoint can't be used with --download or --copy-from.",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+
         if a.verbose > 2:
             logging.basicConfig()
             logging.getLogger().setLevel(1)
@@ -99,6 +487,9 @@ class Main(Command):
             logging.getLogger("boto").setLevel(1)
 
         # If we have a dry run, do it
+        if a.dry_run and a.copy_from:
+            print("--dry-run can't be used with --copy-from.", file=sys.stderr)
+            sys.exit(1)
         if a.dry_run:
             self._dry_run()
             # The dry run call exits the program when done
@@ -107,6 +498,31 @@ class Main(Command):
         output = sys.stdout if a.verbose else None
         # Create our bucket so we can get connections to it later
         bucket = s3peat.S3Bucket(a.bucket, a.key, a.secret, not a.private)
+
+        if a.download:
+            self._download(bucket, output)
+            # The download call exits the program when done
+
+        if a.copy_from:
+            self._copy(bucket, output)
+            # The copy call exits the program when done
+
+        if a.fan_out:
+            self._fan_out(bucket, output)
+            # The fan out call exits the program when done
+
+        if a.archive:
+            self._archive(bucket, output)
+            # The archive call exits the program when done
+
+        if a.stream:
+            self._stream(bucket, output)
+            # The stream call exits the program when done
+
+        if a.daemon:
+            self._daemon(bucket)
+            # The daemon call exits the program when done
+
         # Create our uploader instance
         uploader = s3peat.S3Uploader(
             directory=a.directory,
@@ -116,12 +532,34 @@ class Main(Command):
             exclude=a.exclude,
             concurrency=a.concurrency,
             output=output,
+            files_from=a.files_from,
+            delete=a.delete,
+            max_delete=a.max_delete,
+            dedup=a.dedup,
+            checksum=a.checksum,
+            max_in_flight=a.max_in_flight and a.max_in_flight * 1024 * 1024,
+            part_size=a.part_size * 1024 * 1024,
+            key_template=a.key_template,
+            spread_prefixes=a.spread_prefixes,
+            timeout=a.timeout,
+            hedge=a.hedge,
+            drain_timeout=a.drain_timeout,
+            checkpoint=a.checkpoint,
+            snapshot=a.snapshot,
+            inventory=a.inventory,
+            listing_cache=a.listing_cache,
+            listing_ttl=a.listing_ttl,
+            large_concurrency=a.large_concurrency,
+            large_file_size=a.large_size * 1024 * 1024,
         )
 
         try:
             # Start the upload
-            filenames = uploader.upload()
-        except IOError as exc:
+            if a.watch:
+                filenames = uploader.watch(settle=a.settle)
+            else:
+                filenames = uploader.upload()
+        except (IOError, ValueError) as exc:
             print(str(exc), file=sys.stderr)
             sys.exit(1)
 
@@ -131,29 +569,298 @@ class Main(Command):
             print("\n".join(filenames), file=sys.stderr)
             sys.exit(1)
 
+        if a.verbose and uploader.skipped:
+            print("{} files already up to date.".format(uploader.skipped))
+
+        if a.delete and uploader.deleter:
+            self._check_deleter(uploader.deleter)
+
         # This call isn't really necessary, but whatevs
         self.stop()
 
-    def _dry_run(self):
+    def _download(self, bucket, output):
         """
-        Do a dry run, just printing a list of filenames to upload.
+        Download the prefix into the directory.
 
-        :param directory: Directory to use
-        :param include: Inclusion regex (optional)
-        :param exclude: Exclusion regex (optional)
+        :param bucket: A :class:`s3peat.S3Bucket` instance
+        :param output: Stream for progress output (optional)
 
         """
         a = self.args  # Shorthand
-        if a.verbose > 1:
-            print("Finding files in {} ...".format(os.path.realpath(a.directory)))
-            print()
+        downloader = s3peat.S3Downloader(
+            directory=a.directory,
+            prefix=a.prefix,
+            bucket=bucket,
+            include=a.include,
+            exclude=a.exclude,
+            concurrency=a.concurrency,
+            output=output,
+            part_size=a.part_size * 1024 * 1024,
+        )
 
-        # Use a dummy bucket and uploader to get the file names
-        bucket = None
-        uploader = s3peat.S3Uploader(
-            a.directory, a.prefix, bucket, include=a.include, exclude=a.exclude
+        keys = downloader.download()
+        if keys:
+            # If any keys were returned, that means they failed to download
+            print("Error downloading keys:", file=sys.stderr)
+            print("\n".join(keys), file=sys.stderr)
+            sys.exit(1)
+
+        if a.verbose and downloader.skipped:
+            print("{} files already up to date.".format(downloader.skipped))
+
+        self.stop()
+
+    def _copy(self, bucket, output):
+        """
+        Copy from another bucket or prefix, server-side.
+
+        :param bucket: A :class:`s3peat.S3Bucket` instance to copy to
+        :param output: Stream for progress output (optional)
+
+        """
+        a = self.args  # Shorthand
+        name, _, source_prefix = a.copy_from.partition("/")
+        source = s3peat.S3Bucket(name, a.key, a.secret)
+        copier = s3peat.S3Copier(
+            source,
+            source_prefix,
+            a.prefix,
+            bucket,
+            include=a.include,
+            exclude=a.exclude,
+            concurrency=a.concurrency,
+            output=output,
+        )
+
+        keys = copier.copy()
+        if keys:
+            # If any keys were returned, that means they failed to copy
+            print("Error copying keys:", file=sys.stderr)
+            print("\n".join(keys), file=sys.stderr)
+            sys.exit(1)
+
+        if a.verbose and copier.skipped:
+            print("{} keys already up to date.".format(copier.skipped))
+
+        self.stop()
+
+    def _fan_out(self, bucket, output):
+        """
+        Upload the directory to `bucket` and each of the --fan-out buckets.
+
+        :param bucket: A :class:`s3peat.S3Bucket` instance to upload to
+        :param output: Stream for progress output (optional)
+
+        """
+        a = self.args  # Shorthand
+        buckets = [bucket] + [
+            s3peat.S3Bucket(name, a.key, a.secret, not a.private) for name in a.fan_out
+        ]
+        uploader = s3peat.S3FanOut(
+            directory=a.directory,
+            prefix=a.prefix,
+            buckets=buckets,
+            include=a.include,
+            exclude=a.exclude,
+            concurrency=a.concurrency,
+            output=output,
+            files_from=a.files_from,
+            checksum=a.checksum,
+            max_in_flight=a.max_in_flight and a.max_in_flight * 1024 * 1024,
+            part_size=a.part_size * 1024 * 1024,
+            key_template=a.key_template,
+            timeout=a.timeout,
+            hedge=a.hedge,
+            drain_timeout=a.drain_timeout,
+            checkpoint=a.checkpoint,
+            snapshot=a.snapshot,
+        )
+
+        try:
+            failures = uploader.upload()
+        except (IOError, ValueError) as exc:
+            print(str(exc), file=sys.stderr)
+            sys.exit(1)
+
+        if failures and any(failures.values()):
+            for name, filenames in failures.items():
+                if filenames:
+                    print("Error uploading files to {}:".format(name), file=sys.stderr)
+                    print("\n".join(filenames), file=sys.stderr)
+            sys.exit(1)
+
+        self.stop()
+
+    def _archive(self, bucket, output):
+        """
+        Upload the members of the archive given as the directory.
+
+        :param bucket: A :class:`s3peat.S3Bucket` instance to upload to
+        :param output: Stream for progress output (optional)
+
+        """
+        a = self.args  # Shorthand
+        uploader = s3peat.S3ArchiveUploader(
+            archive=a.directory,
+            prefix=a.prefix,
+            bucket=bucket,
+            include=a.include,
+            exclude=a.exclude,
+            concurrency=a.concurrency,
+            output=output,
+            checksum=a.checksum,
+            part_size=a.part_size * 1024 * 1024,
+            timeout=a.timeout,
+            hedge=a.hedge,
         )
-        filenames = uploader.get_filenames()
+
+        try:
+            names = uploader.upload()
+        except (IOError, tarfile.TarError, zipfile.BadZipFile) as exc:
+            print(str(exc), file=sys.stderr)
+            sys.exit(1)
+
+        if uploader.links:
+            print(
+                "Skipped {} links in the archive:".format(len(uploader.links)),
+                file=sys.stderr,
+            )
+            print("\n".join(uploader.links), file=sys.stderr)
+
+        if names:
+            # If any names were returned, that means they failed to upload
+            print("Error uploading archive members:", file=sys.stderr)
+            print("\n".join(names), file=sys.stderr)
+            sys.exit(1)
+
+        self.stop()
+
+    def _stream(self, bucket, output):
+        """
+        Upload stdin to the --stream key.
+
+        :param bucket: A :class:`s3peat.S3Bucket` instance to upload to
+        :param output: Stream for progress output (optional)
+
+        """
+        a = self.args  # Shorthand
+        uploader = s3peat.S3StreamUploader(
+            stream=sys.stdin.buffer,
+            key=a.stream,
+            prefix=a.prefix,
+            bucket=bucket,
+            concurrency=a.concurrency,
+            output=output,
+            checksum=a.checksum,
+            part_size=a.part_size * 1024 * 1024,
+            timeout=a.timeout,
+            hedge=a.hedge,
+        )
+
+        try:
+            keys = uploader.upload()
+        except (IOError, ValueError) as exc:
+            print(str(exc), file=sys.stderr)
+            sys.exit(1)
+
+        if keys:
+            print("Error uploading {}".format(keys[0]), file=sys.stderr)
+            sys.exit(1)
+
+        self.stop()
+
+    def _daemon(self, bucket):
+        """
+        Serve upload jobs for `bucket` on the --daemon address until stopped.
+
+        :param bucket: A :class:`s3peat.S3Bucket` instance to upload to
+
+        """
+        from s3peat.daemon import serve
+
+        a = self.args  # Shorthand
+        daemon = s3peat.S3Daemon(
+            bucket,
+            concurrency=a.concurrency,
+            checksum=a.checksum,
+            part_size=a.part_size * 1024 * 1024,
+            timeout=a.timeout,
+            hedge=a.hedge,
+        )
+
+        try:
+            daemon.start()
+        except Exception as exc:
+            print("Can't access bucket: {}".format(exc), file=sys.stderr)
+            sys.exit(1)
+
+        # Stop cleanly when killed, as well as on Ctrl+C
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            serve(daemon, _address(a.daemon), a.listen_any)
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as exc:
+            print(str(exc), file=sys.stderr)
+            sys.exit(1)
+
+        self.stop()
+
+    def _check_deleter(self, deleter):
+        """Report any problems deleting keys, exiting if there were some."""
+        if deleter.error:
+            print(deleter.error, file=sys.stderr)
+            sys.exit(1)
+
+        if deleter.failed:
+            print("Error deleting keys:", file=sys.stderr)
+            print("\n".join(deleter.failed), file=sys.stderr)
+            sys.exit(1)
+
+        if self.args.verbose:
+            print("{} keys deleted.".format(deleter.deleted))
+
+    def _dry_run(self):
+        """
+        Do a dry run, just printing a list of filenames to upload, or with
+        --download, the files which would be downloaded.
+
+        """
+        a = self.args  # Shorthand
+        if a.download:
+            if a.verbose > 1:
+                print("Listing {}/{} ...".format(a.bucket, a.prefix or ""))
+                print()
+            # What would be downloaded comes from listing the bucket
+            uploader = s3peat.S3Downloader(
+                a.directory,
+                a.prefix,
+                s3peat.S3Bucket(a.bucket, a.key, a.secret),
+                include=a.include,
+                exclude=a.exclude,
+                concurrency=a.concurrency,
+            )
+            try:
+                filenames = uploader.get_filenames()
+            except Exception as exc:
+                self._connection_error(a.bucket, exc)
+        else:
+            if a.verbose > 1:
+                print("Finding files in {} ...".format(os.path.realpath(a.directory)))
+                print()
+
+            # Use a dummy bucket and uploader to get the file names
+            bucket = None
+            uploader = s3peat.S3Uploader(
+                a.directory,
+                a.prefix,
+                bucket,
+                include=a.include,
+                exclude=a.exclude,
+                files_from=a.files_from,
+                snapshot=a.snapshot,
+            )
+            filenames = uploader.get_filenames()
 
         if a.verbose > 1:
             print("\n".join(filenames))
@@ -168,30 +875,45 @@ class Main(Command):
         if a.verbose > 1:
             print()
 
-        # Test the connection to S3
-        bucket = s3peat.S3Bucket(a.bucket, a.key, a.secret)
-        try:
-            bucket.get_new()
-        except Exception as exc:
-            print(
-                "Error connecting to S3 bucket {!r}.".format(a.bucket), file=sys.stderr
-            )
-
-            if a.verbose > 1:
-                print("   ", "\n    ".join(repr(exc).split("\n")), file=sys.stderr)
-            elif a.verbose:
-                print("   ", repr(exc).split("\n")[0], file=sys.stderr)
-
-            sys.exit(1)
-        else:
+        # Test the connection to S3, and every bucket we'd fan out to
+        for name in [a.bucket] + (a.fan_out or []):
+            bucket = s3peat.S3Bucket(name, a.key, a.secret)
+            try:
+                bucket.get_new()
+            except Exception as exc:
+                self._connection_error(name, exc)
             if a.verbose:
-                print("Connected to S3 bucket {!r} OK.".format(a.bucket))
+                print("Connected to S3 bucket {!r} OK.".format(name))
 
         self.stop()
 
+    def _connection_error(self, name, exc):
+        """Report the exception `exc` connecting to the bucket `name`, and exit."""
+        a = self.args  # Shorthand
+        print("Error connecting to S3 bucket {!r}.".format(name), file=sys.stderr)
+
+        if a.verbose > 1:
+            print("   ", "\n    ".join(repr(exc).split("\n")), file=sys.stderr)
+        elif a.verbose:
+            print("   ", repr(exc).split("\n")[0], file=sys.stderr)
+
+        sys.exit(1)
+
     def regex(self, value):
         """Helper for regex types on the command line."""
         try:
             return re.compile(value)
         except Exception:
             raise ValueError
+
+
+def _address(address):
+    """
+    Return a ``(host, port)`` tuple for a ``HOST:PORT`` or ``:PORT``
+    `address`, or the `address` as it is if it's the path of a Unix socket.
+
+    """
+    host, sep, port = address.rpartition(":")
+    if not sep or not port.isdigit() or os.sep in address:
+        return address
+    return host or "127.0.0.1", int(port)
@@ -0,0 +1,174 @@
+"""
+Walk huge, mostly unchanging trees quickly, using a snapshot of the last walk.
+
+A directory's modification time changes whenever a file is added to, removed
+from or renamed in it. :class:`TreeSnapshot` saves the modification time and
+the entries of every directory it walks, and next time reuses the entries of
+any directory whose modification time is the same, rather than listing it
+again. A tree where only a few directories are ever added to can then be
+walked with one ``stat`` per directory.
+
+Files whose contents change don't change their directory, but since the
+snapshot is only used to find filenames, that doesn't matter.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.snapshot import TreeSnapshot
+
+    snapshot = TreeSnapshot('.s3peat-snapshot')
+    snapshot.load()
+    for filename in snapshot.walk('my/directory'):
+        print(filename)
+    snapshot.save()
+
+"""
+
+import json
+import os
+import time
+
+# Bumped whenever the saved format changes, so old snapshots are ignored
+VERSION = 1
+
+# Directories changed this close to when they were last listed may have
+# changed again without their modification time moving, so are listed again
+MARGIN_NS = 2 * 10**9
+
+# Separates names in a saved listing, since it can't appear in a filename
+SEP = "\0"
+
+
+class TreeSnapshot(object):
+    """
+    The modification times and entries of the directories in a tree, saved
+    to `filename` between runs.
+
+    After :meth:`walk`, :attr:`scanned` is the number of directories that
+    were listed, and :attr:`reused` the number whose saved entries were used.
+
+    :param filename: File to load the snapshot from and save it to
+    :type filename: str
+
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.root = None
+        # When the walk that made this snapshot started, in nanoseconds
+        self.started = 0
+        # Directories relative to root, mapped to [mtime_ns, files, subdirs]
+        # with the names joined by SEP
+        self.dirs = {}
+        self.scanned = 0
+        self.reused = 0
+
+    def load(self):
+        """
+        Load the saved snapshot, returning ``False`` if there isn't a usable
+        one.
+
+        """
+        try:
+            with open(self.filename) as f:
+                saved = json.load(f)
+            if saved.get("version") != VERSION:
+                return False
+            self.root = saved["root"]
+            self.started = saved["started"]
+            self.dirs = saved["dirs"]
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        return True
+
+    def save(self):
+        """Save the snapshot, replacing the old one in one go."""
+        temp = self.filename + ".tmp"
+        with open(temp, "w") as f:
+            json.dump(
+                {
+                    "version": VERSION,
+                    "root": self.root,
+                    "started": self.started,
+                    "dirs": self.dirs,
+                },
+                f,
+                separators=(",", ":"),
+            )
+        os.replace(temp, self.filename)
+
+    def walk(self, directory):
+        """
+        Yield every filename under `directory`, like :func:`os.walk` would,
+        and update the snapshot to match once they've all been yielded.
+
+        :param directory: Directory to walk
+        :type directory: str
+
+        """
+        started = time.time_ns()
+        root = os.path.abspath(directory)
+        old = self.dirs if root == self.root else {}
+        # Listings made after this time may have missed a change
+        trusted = self.started - MARGIN_NS
+        dirs = {}
+        self.scanned = 0
+        self.reused = 0
+
+        # Directories left to walk, relative to the root, last one first
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            path = os.path.join(directory, rel) if rel else directory
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+
+            cached = old.get(rel)
+            if cached and cached[0] == mtime and mtime < trusted:
+                entry = cached
+                self.reused += 1
+            else:
+                try:
+                    files, subdirs = _scan(path)
+                except OSError:
+                    # os.walk skips directories it can't list too
+                    continue
+                entry = [mtime, SEP.join(files), SEP.join(subdirs)]
+                self.scanned += 1
+            dirs[rel] = entry
+
+            if entry[1]:
+                for name in entry[1].split(SEP):
+                    yield os.path.join(path, name)
+            if entry[2]:
+                subdirs = entry[2].split(SEP)
+                stack.extend(os.path.join(rel, name) for name in reversed(subdirs))
+
+        self.root = root
+        self.started = started
+        self.dirs = dirs
+
+
+def _scan(path):
+    """
+    Return lists of the files and the subdirectories to walk in `path`,
+    split the way :func:`os.walk` splits them.
+
+    """
+    files = []
+    subdirs = []
+    with os.scandir(path) as entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                files.append(entry.name)
+            elif not entry.is_symlink():
+                # Linked directories aren't followed, or listed as files
+                subdirs.append(entry.name)
+    return files, subdirs
@@ -0,0 +1,351 @@
+"""
+Upload a stream of unknown length, such as stdin, as a single object.
+
+Rather than landing the output of a pipeline on disk to upload it, the stream
+is read in parts which are uploaded as a multipart upload while the rest is
+still being read, several parts at a time. Past the multipart threshold only a
+few parts are held in memory at once, so the stream can be much bigger than
+memory. Streams no bigger than the multipart threshold are uploaded in a
+single request.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    import subprocess
+
+    from s3peat import S3Bucket, upload_stream
+
+    bucket = S3Bucket('my-bucket', AWS_KEY, AWS_SECRET)
+
+    dump = subprocess.Popen(['pg_dump', 'mydb'], stdout=subprocess.PIPE)
+    # The key will be returned in a list if the upload failed
+    failures = upload_stream(dump.stdout, 'backups/mydb.sql', bucket,
+        concurrency=8)
+
+"""
+
+import os
+
+from s3peat import MAX_PARTS, MULTIPART_THRESHOLD, PART_SIZE, S3Queue, S3Uploader
+from s3peat.objects import S3ObjectQueue
+
+
+class S3PartQueue(S3Queue):
+    """
+    Take a stream of ``(key, upload_id, number, part)`` tuples and upload
+    each bytes-like `part` as part `number` of the multipart upload
+    `upload_id` to `key`.
+
+    This works just like :class:`~s3peat.S3Queue`, except the
+    :attr:`~S3Queue.failed` list holds part numbers, and the entries for
+    completing the upload, and the checksum digests of the parts if a
+    `checksum` is used, are kept by part number in :attr:`parts`.
+
+    """
+
+    def __init__(self, prefix, filenames, bucket, strip_path=None, **kwargs):
+        super(S3PartQueue, self).__init__(
+            prefix, filenames, bucket, strip_path, **kwargs
+        )
+        self.parts = {}
+
+    def _transfer(self, item, bucket):
+        key, upload_id, number, part = item
+        try:
+            self.parts[number] = self._put_part(bucket, key, upload_id, number, part)
+        except Exception:
+            self.log.debug("Failed part %d of %r", number, key, exc_info=True)
+            self.failed.append(number)
+            if self.counter:
+                self.counter(False)
+        else:
+            self.log.debug("Uploaded part %d of %r", number, key)
+            if self.counter:
+                self.counter()
+
+    def _item_filename(self, item):
+        return item[2]
+
+
+class S3StreamUploader(S3Uploader):
+    """
+    Uploads a binary stream of unknown length as the object `key`.
+
+    :param stream: Binary file object to read, such as ``sys.stdin.buffer``
+    :param key: Key to upload to, under `prefix`
+    :param prefix: S3 key prefix
+    :param bucket: A :class:`~s3peat.S3Bucket` instance
+    :param concurrency: Number of parts to upload at once (default: 1)
+    :param output: File or stream to output progress to (optional)
+    :param checksum: Checksum to send with each part for S3 to verify, one
+                     of :data:`~s3peat.CHECKSUMS` (optional)
+    :param multipart_threshold: Streams larger than this are uploaded in
+                                parts (default: 64 MiB)
+    :param part_size: Size of uploaded parts, in bytes (default: 16 MiB)
+    :param timeout: Seconds to wait connecting, or for each read or write on
+                    a connection, before giving up on a request (optional)
+    :param hedge: Percentile of request times after which a slow request is
+                  sent again on a fresh connection (optional)
+    :type stream: file
+    :type key: str
+    :type prefix: str
+    :type bucket: :class:`~s3peat.S3Bucket`
+    :type concurrency: int
+    :type output: file
+
+    Until more than `multipart_threshold` bytes have been read, we can't tell
+    whether a multipart upload is needed, so up to `multipart_threshold` plus
+    `part_size` bytes are read into memory first. Once the multipart upload is
+    started, parts are put on a stream shared by `concurrency`
+    :class:`S3PartQueue` threads, with at most `concurrency` parts waiting, so
+    after those first parts have been handed off no more than
+    ``2 * concurrency + 1`` parts are held in memory. Since the size isn't
+    known ahead of time, the stream can't be bigger than `part_size` times
+    :data:`~s3peat.MAX_PARTS`.
+
+    If any part fails, once the parts in progress are done the upload is
+    aborted, so its parts aren't left behind, and :meth:`upload` returns a
+    list holding `key`. It's also aborted when stopped.
+
+    """
+
+    def __init__(
+        self,
+        stream,
+        key,
+        prefix,
+        bucket,
+        concurrency=1,
+        output=None,
+        handle_signals=True,
+        checksum=None,
+        multipart_threshold=MULTIPART_THRESHOLD,
+        part_size=PART_SIZE,
+        timeout=None,
+        hedge=None,
+    ):
+        super(S3StreamUploader, self).__init__(
+            None,
+            prefix,
+            bucket,
+            concurrency=concurrency,
+            output=output,
+            handle_signals=handle_signals,
+            checksum=checksum,
+            multipart_threshold=multipart_threshold,
+            part_size=part_size,
+            timeout=timeout,
+            hedge=hedge,
+        )
+        self.stream = stream
+        self.key = key
+        # Bytes read from the stream so far
+        self.size = 0
+        # The multipart upload in progress, and its key, see stop
+        self._upload_id = None
+        self._upload_key = None
+        self._client = None
+
+    def upload(self):
+        """
+        Starts the uploading and returns a list holding the key if it failed.
+
+        """
+        if not self._prepare():
+            return
+
+        self.total = 0
+        self.size = 0
+        # Never run, this makes the requests that aren't for parts
+        leader = self._new_queue([], S3ObjectQueue)
+        self.queues.append(leader)
+        bucket = leader._connect()
+
+        # Read just enough to know if this needs a multipart upload
+        parts = []
+        while self.size <= self.multipart_threshold:
+            part = self._read()
+            if not part:
+                break
+            parts.append(part)
+
+        if self.size <= self.multipart_threshold:
+            self.total = 1
+            leader._upload_object((self.key, b"".join(parts)), bucket)
+            return self._finish()
+
+        key = leader._object_key(self.key)
+        self._client = bucket.meta.client
+        kwargs = {}
+        if self.checksum == "crc32c":
+            kwargs["ChecksumAlgorithm"] = "CRC32C"
+        try:
+            upload = self._client.create_multipart_upload(
+                Key=key, **leader._params, **kwargs
+            )
+        except Exception:
+            self.log.debug("Failed starting %r", key, exc_info=True)
+            self._finish()
+            return [self.key]
+        self._upload_id = upload["UploadId"]
+        self._upload_key = key
+
+        # Parts in progress and waiting are what bounds the memory we use
+        stream = self._start_stream(self.concurrency)
+        failed = False
+        try:
+            for number, part in enumerate(self._parts(parts), 1):
+                if number > MAX_PARTS:
+                    raise ValueError(
+                        "Stream is bigger than {} parts of {} bytes.".format(
+                            MAX_PARTS, self.part_size
+                        )
+                    )
+                if any(queue.failed for queue in self.queues):
+                    # No point reading any more
+                    failed = True
+                    break
+                self.total += 1
+                self._output()
+                stream.put((key, self._upload_id, number, part))
+        except Exception:
+            self._stop_stream(stream)
+            self._abort()
+            raise
+        self._stop_stream(stream)
+
+        failures = self._finish()
+        if failed or failures:
+            self._abort()
+            return [self.key]
+
+        entries = {}
+        for queue in self.queues:
+            entries.update(getattr(queue, "parts", {}))
+        entries = [entries[number] for number in sorted(entries)]
+        try:
+            self._client.complete_multipart_upload(
+                Bucket=self.bucket.name,
+                Key=key,
+                UploadId=self._upload_id,
+                MultipartUpload={"Parts": [entry for entry, digest in entries]},
+            )
+        except Exception:
+            self.log.debug("Failed completing %r", key, exc_info=True)
+            self._abort()
+            return [self.key]
+        self._upload_id = None
+
+        if self.checksum:
+            self.checksums[self.key] = leader._combined_checksum(
+                [digest for entry, digest in entries]
+            )
+        return []
+
+    def _parts(self, first):
+        """
+        Yield the parts in the list `first`, letting go of each as it's
+        taken, and then the rest of :attr:`stream`.
+
+        """
+        while first:
+            yield first.pop(0)
+        yield from iter(self._read, b"")
+
+    def _read(self):
+        """
+        Return the next part read from :attr:`stream`, or ``b""`` at the end.
+
+        Pipes may return less than asked for, so this keeps reading until it
+        has a whole part.
+
+        """
+        part = bytearray()
+        while len(part) < self.part_size:
+            chunk = self.stream.read(self.part_size - len(part))
+            if not chunk:
+                break
+            part += chunk
+        self.size += len(part)
+        return part
+
+    def _abort(self):
+        """Abort the multipart upload in progress, if there is one."""
+        if self._upload_id is None:
+            return
+        key = self._upload_key
+        try:
+            self._client.abort_multipart_upload(
+                Bucket=self.bucket.name, Key=key, UploadId=self._upload_id
+            )
+        except Exception:
+            self.log.debug("Failed aborting %r", key, exc_info=True)
+        self._upload_id = None
+
+    def stop(self, *args):
+        """
+        Stop uploading and exit, aborting the multipart upload in progress so
+        its parts aren't left behind.
+
+        """
+        try:
+            super(S3StreamUploader, self).stop(*args)
+        finally:
+            self._abort()
+
+    def _new_queue(self, filenames, queue_class=None, bucket=None):
+        return super(S3StreamUploader, self)._new_queue(
+            filenames, queue_class or S3PartQueue, bucket
+        )
+
+    def _output(self):
+        """
+        Print the current progress.
+
+        """
+        if not self.output:
+            return
+
+        line = "{}/{} parts uploaded, {:.1f} MiB read".format(
+            self.count, self.total, self.size / (1024 * 1024)
+        )
+        line += " " * (int(os.environ.get("COLUMNS", 80)) - len(line) - 1)
+        self.output.write("\r" + line)
+        if hasattr(self.output, "flush"):
+            self.output.flush()
+
+
+def upload_stream(
+    stream,
+    key,
+    bucket,
+    prefix=None,
+    concurrency=1,
+    output=None,
+    handle_signals=True,
+    checksum=None,
+    multipart_threshold=MULTIPART_THRESHOLD,
+    part_size=PART_SIZE,
+    timeout=None,
+    hedge=None,
+):
+    """
+    This is a convenience wrapper around :class:`S3StreamUploader`.
+
+    """
+    uploader = S3StreamUploader(
+        stream,
+        key,
+        prefix,
+        bucket,
+        concurrency=concurrency,
+        output=output,
+        handle_signals=handle_signals,
+        checksum=checksum,
+        multipart_threshold=multipart_threshold,
+        part_size=part_size,
+        timeout=timeout,
+        hedge=hedge,
+    )
+    return uploader.upload()
@@ -0,0 +1,337 @@
+"""
+Watch a directory for new and modified files.
+
+These watchers are used by :meth:`s3peat.S3Uploader.watch` to upload files as
+they're written, rather than walking the whole directory over and over.
+
+On Linux, :class:`InotifyWatcher` is used, which asks the kernel to tell us
+about changes. Anywhere else, or if inotify can't be set up,
+:class:`PollingWatcher` is used instead, which compares periodic scans of the
+directory.
+
+Files are only reported once they've *settled*, that is they've had no
+changes for `settle` seconds, so that partially written files aren't
+uploaded.
+
+.. rubric:: Example usage
+
+.. code-block:: python
+
+    from s3peat.watch import get_watcher
+
+    watcher = get_watcher('my/directory', settle=2)
+    for filename in watcher:
+        print("Changed:", filename)
+
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+
+# inotify event masks, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+
+# The events we want to hear about for each watched directory
+WATCH_MASK = (
+    IN_MODIFY
+    | IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+
+# struct inotify_event header: int wd, uint32 mask, uint32 cookie, uint32 len
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Watcher(object):
+    """
+    Base class for directory watchers, which handles settling changed files.
+
+    Subclasses implement :meth:`_wait`, which should call :meth:`_touch` for
+    each changed file it sees.
+
+    Iterating over a watcher yields settled filenames until :meth:`close` is
+    called.
+
+    :param directory: Directory to watch
+    :param settle: Seconds a file must go unchanged before it's reported
+    :type directory: str
+    :type settle: float
+
+    """
+
+    def __init__(self, directory, settle=1.0):
+        self.directory = directory
+        self.settle = settle
+        self.closed = False
+        self.log = logging.getLogger(type(self).__name__)
+        # Pending filenames mapped to the time they'll have settled
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        while not self.closed:
+            for filename in self.poll():
+                yield filename
+
+    def poll(self, timeout=None):
+        """
+        Wait up to `timeout` seconds for changes and return a list of the
+        filenames which have settled.
+
+        If `timeout` isn't given, this waits until the next pending file will
+        have settled, or one second if nothing is pending.
+
+        """
+        if timeout is None:
+            timeout = 1.0
+            with self._lock:
+                if self._pending:
+                    timeout = min(self._pending.values()) - time.time()
+            timeout = max(timeout, 0.0)
+
+        self._wait(timeout)
+        return self._ready()
+
+    def close(self):
+        """Stop watching."""
+        self.closed = True
+
+    def _wait(self, timeout):
+        """Wait up to `timeout` seconds, noting any changed files."""
+        raise NotImplementedError
+
+    def _touch(self, filename):
+        """Note that `filename` changed, restarting its settle time."""
+        with self._lock:
+            self._pending[filename] = time.time() + self.settle
+
+    def _touch_tree(self, directory):
+        """Note every file under `directory` as changed."""
+        for path, dirs, files in os.walk(directory):
+            for filename in files:
+                self._touch(os.path.join(path, filename))
+
+    def _ready(self):
+        """Return and forget the pending filenames which have settled."""
+        now = time.time()
+        ready = []
+        with self._lock:
+            for filename, deadline in list(self._pending.items()):
+                if deadline <= now:
+                    del self._pending[filename]
+                    ready.append(filename)
+
+        # Files may have been removed or replaced with something else while
+        # they were settling
+        return sorted(f for f in ready if os.path.isfile(f))
+
+
+class PollingWatcher(Watcher):
+    """
+    Watch a directory by scanning it every `interval` seconds.
+
+    This works anywhere, but has to walk the whole directory each interval.
+
+    :param directory: Directory to watch
+    :param settle: Seconds a file must go unchanged before it's reported
+    :param interval: Seconds between scans of the directory
+    :type directory: str
+    :type settle: float
+    :type interval: float
+
+    """
+
+    def __init__(self, directory, settle=1.0, interval=2.0):
+        super(PollingWatcher, self).__init__(directory, settle)
+        self.interval = interval
+        self._last_scan = 0
+        # Start from what's already there, so only changes are reported
+        self._snapshot = self._scan()
+
+    def _scan(self):
+        """Return a mapping of filenames to their size and modified time."""
+        snapshot = {}
+        for path, dirs, files in os.walk(self.directory):
+            for filename in files:
+                filename = os.path.join(path, filename)
+                try:
+                    stat = os.stat(filename)
+                except OSError:
+                    continue
+                snapshot[filename] = (stat.st_size, stat.st_mtime_ns)
+        self._last_scan = time.time()
+        return snapshot
+
+    def _wait(self, timeout):
+        delay = self._last_scan + self.interval - time.time()
+        if delay > timeout:
+            time.sleep(timeout)
+            return
+        if delay > 0:
+            time.sleep(delay)
+
+        snapshot = self._scan()
+        for filename, stat in snapshot.items():
+            if self._snapshot.get(filename) != stat:
+                self._touch(filename)
+        self._snapshot = snapshot
+
+
+class InotifyWatcher(Watcher):
+    """
+    Watch a directory using Linux inotify.
+
+    Every directory in the tree gets a watch, and directories created or moved
+    into the tree are watched as they appear.
+
+    :param directory: Directory to watch
+    :param settle: Seconds a file must go unchanged before it's reported
+    :type directory: str
+    :type settle: float
+
+    Raises :class:`OSError` if inotify isn't available.
+
+    """
+
+    def __init__(self, directory, settle=1.0):
+        super(InotifyWatcher, self).__init__(directory, settle)
+        self._libc = _libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+        # Watch descriptors mapped to the directory they watch
+        self._watches = {}
+        for path, dirs, files in os.walk(directory):
+            self._add_watch(path)
+
+    def close(self):
+        super(InotifyWatcher, self).close()
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, path):
+        """Watch the directory `path`."""
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            # The directory may have gone away already
+            if err not in (errno.ENOENT, errno.ENOTDIR):
+                self.log.warning("Can't watch %r: %s", path, os.strerror(err))
+            return
+        self._watches[wd] = path
+
+    def _wait(self, timeout):
+        if self._fd < 0:
+            return
+        try:
+            readable, _, _ = select.select([self._fd], [], [], timeout)
+        except (OSError, ValueError):
+            # Closed while we were waiting
+            return
+        if not readable:
+            return
+
+        try:
+            data = os.read(self._fd, 65536)
+        except BlockingIOError:
+            return
+
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset : offset + length].rstrip(b"\0")
+            offset += length
+            self._event(wd, mask, os.fsdecode(name))
+
+    def _event(self, wd, mask, name):
+        """Handle a single inotify event."""
+        if mask & IN_Q_OVERFLOW:
+            # We've missed events, so everything has to be checked again
+            self.log.warning("inotify queue overflowed, rescanning")
+            self._touch_tree(self.directory)
+            return
+
+        if mask & IN_IGNORED:
+            self._watches.pop(wd, None)
+            return
+
+        path = self._watches.get(wd)
+        if path is None or not name:
+            return
+        filename = os.path.join(path, name)
+
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                # Files can be written before our watch is in place, so pick up
+                # whatever is already in there too
+                for subpath, dirs, files in os.walk(filename):
+                    self._add_watch(subpath)
+                self._touch_tree(filename)
+            return
+
+        self._touch(filename)
+
+
+def _libc():
+    """Return libc with the inotify functions, or ``None``."""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [
+            ctypes.c_int,
+            ctypes.c_char_p,
+            ctypes.c_uint32,
+        ]
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+
+def get_watcher(directory, settle=1.0, interval=2.0):
+    """
+    Return the best available watcher for `directory`.
+
+    This is an :class:`InotifyWatcher` if possible, otherwise a
+    :class:`PollingWatcher` scanning every `interval` seconds.
+
+    """
+    try:
+        return InotifyWatcher(directory, settle)
+    except OSError as exc:
+        logging.getLogger("s3peat.watch").info(
+            "Falling back to polling, inotify failed: %s", exc
+        )
+        return PollingWatcher(directory, settle, interval)
@@ -0,0 +1,190 @@
+"""
+Tests for uploading the members of tar and zip archives with S3ArchiveUploader.
+"""
+
+import io
+import os
+import re
+import stat
+import tarfile
+import zipfile
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import S3ArchiveUploader, S3Bucket, upload_archive
+from s3peat.archive import S3ArchiveQueue, _member_name
+
+MiB = 1024 * 1024
+
+MEMBERS = {
+    "a.txt": b"alpha",
+    "sub/b.txt": b"bravo",
+    "sub/skip.log": b"log",
+}
+
+
+def _body(client, key):
+    return client.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+
+
+def _keys(client):
+    listing = client.list_objects_v2(Bucket="test-bucket")
+    return sorted(o["Key"] for o in listing.get("Contents", []))
+
+
+def _tar(path, members, mode="w:gz"):
+    with tarfile.open(path, mode) as tar:
+        directory = tarfile.TarInfo("./sub")
+        directory.type = tarfile.DIRTYPE
+        tar.addfile(directory)
+        for name, data in members.items():
+            info = tarfile.TarInfo("./" + name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("./link.txt")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "a.txt"
+        tar.addfile(link)
+        hard = tarfile.TarInfo("./hard.txt")
+        hard.type = tarfile.LNKTYPE
+        hard.linkname = "./a.txt"
+        tar.addfile(hard)
+    return str(path)
+
+
+def _zip(path, members):
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("sub/", b"")
+        for name, data in members.items():
+            archive.writestr(name, data)
+        link = zipfile.ZipInfo("link.txt")
+        link.external_attr = (stat.S_IFLNK | 0o777) << 16
+        archive.writestr(link, "a.txt")
+    return str(path)
+
+
+def test_member_name():
+    """Test leading ./ and / are dropped from member names."""
+    assert _member_name("./a/b") == "a/b"
+    assert _member_name("/a/b") == "a/b"
+    assert _member_name("a/./b") == "a/./b"
+
+
+@pytest.mark.parametrize("kind", ["tar", "tar.gz", "zip"])
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_archive(mock_sleep, kind, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test regular files are uploaded under the prefix, filtered by name."""
+    bucket = S3Bucket(**s3_bucket_config)
+    path = tmp_path / ("build." + kind)
+    if kind == "zip":
+        archive = _zip(path, MEMBERS)
+    else:
+        archive = _tar(path, MEMBERS, "w:gz" if kind == "tar.gz" else "w")
+
+    result = upload_archive(
+        archive,
+        "builds/42",
+        bucket,
+        exclude=[re.compile(r"\.log$")],
+        concurrency=2,
+        handle_signals=False,
+    )
+
+    assert result == []
+    assert _keys(mock_aws_s3) == ["builds/42/a.txt", "builds/42/sub/b.txt"]
+    assert _body(mock_aws_s3, "builds/42/sub/b.txt") == b"bravo"
+
+
+@pytest.mark.parametrize("kind", ["tar", "zip"])
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_archive_links(
+    mock_sleep, kind, mock_aws_s3, s3_bucket_config, tmp_path, caplog
+):
+    """Test links are skipped, and hard links are warned about."""
+    bucket = S3Bucket(**s3_bucket_config)
+    path = tmp_path / ("build." + kind)
+    archive = _zip(path, MEMBERS) if kind == "zip" else _tar(path, MEMBERS, "w")
+    uploader = S3ArchiveUploader(archive, "prefix", bucket, handle_signals=False)
+
+    assert uploader.upload() == []
+
+    if kind == "zip":
+        assert uploader.links == ["link.txt"]
+        assert "hard link" not in caplog.text
+    else:
+        assert uploader.links == ["link.txt", "hard.txt"]
+        assert "Skipping hard link 'hard.txt'" in caplog.text
+    assert "prefix/hard.txt" not in _keys(mock_aws_s3)
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_archive_stdin(mock_sleep, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test a tar archive can be read from stdin."""
+    bucket = S3Bucket(**s3_bucket_config)
+    data = open(_tar(tmp_path / "build.tar.gz", MEMBERS), "rb").read()
+
+    with patch("sys.stdin", io.TextIOWrapper(io.BytesIO(data))):
+        result = upload_archive(
+            "-", "", bucket, include=[re.compile("^sub/")], handle_signals=False
+        )
+
+    assert result == []
+    assert _keys(mock_aws_s3) == ["sub/b.txt", "sub/skip.log"]
+
+
+@pytest.mark.parametrize("kind", ["tar", "zip"])
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_archive_large(
+    mock_sleep, kind, mock_aws_s3, s3_bucket_config, tmp_path
+):
+    """Test large members are streamed in parts, along with small ones."""
+    bucket = S3Bucket(**s3_bucket_config)
+    members = {"big.bin": os.urandom(11 * MiB), "small.txt": b"small"}
+    path = tmp_path / ("build." + kind)
+    archive = _zip(path, members) if kind == "zip" else _tar(path, members, "w")
+    uploader = S3ArchiveUploader(
+        archive,
+        "prefix",
+        bucket,
+        concurrency=2,
+        handle_signals=False,
+        multipart_threshold=8 * MiB,
+        part_size=5 * MiB,
+    )
+
+    with patch("s3peat.archive.READ_SIZE", MiB), patch.object(
+        S3ArchiveQueue,
+        "_put_parts",
+        autospec=True,
+        side_effect=S3ArchiveQueue._put_parts,
+    ) as put_parts:
+        result = uploader.upload()
+
+    assert result == []
+    put_parts.assert_called_once()
+    assert _body(mock_aws_s3, "prefix/big.bin") == members["big.bin"]
+    assert _body(mock_aws_s3, "prefix/small.txt") == b"small"
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_archive_failure(mock_sleep, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test a large tar member failing doesn't hold up the rest."""
+    bucket = S3Bucket(**s3_bucket_config)
+    members = {"big.bin": b"x" * (2 * MiB), "small.txt": b"small"}
+    archive = _tar(tmp_path / "build.tar", members, "w")
+    put = S3ArchiveQueue._put_chunks
+
+    def fail_big(queue, bucket, key, name, chunks):
+        if name == "big.bin":
+            next(chunks)
+            raise IOError("Upload failed")
+        return put(queue, bucket, key, name, chunks)
+
+    with patch("s3peat.archive.READ_SIZE", MiB), patch.object(
+        S3ArchiveQueue, "_put_chunks", fail_big
+    ):
+        result = upload_archive(archive, "prefix", bucket, handle_signals=False)
+
+    assert result == ["big.bin"]
+    assert _keys(mock_aws_s3) == ["prefix/small.txt"]
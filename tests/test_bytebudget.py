@@ -0,0 +1,116 @@
+"""
+Tests for the ByteBudget class and reading ahead with a budget.
+"""
+
+import os
+import threading
+from unittest.mock import patch
+
+from s3peat import ByteBudget, S3Bucket, S3Queue, S3Uploader
+
+
+def test_bytebudget_acquire_release():
+    """Test taking and returning bytes."""
+    budget = ByteBudget(100)
+
+    budget.acquire(60)
+    budget.acquire(40)
+    assert budget.used == 100
+
+    budget.release(60)
+    assert budget.used == 40
+
+
+def test_bytebudget_blocks_when_full():
+    """Test acquiring waits until enough is released."""
+    budget = ByteBudget(100)
+    budget.acquire(80)
+    acquired = threading.Event()
+
+    def take():
+        budget.acquire(40)
+        acquired.set()
+
+    thread = threading.Thread(target=take)
+    thread.start()
+    assert not acquired.wait(0.1)
+
+    budget.release(80)
+    assert acquired.wait(1)
+    thread.join()
+    assert budget.used == 40
+
+
+def test_bytebudget_oversized_when_empty():
+    """Test a request bigger than the limit is allowed when nothing's held."""
+    budget = ByteBudget(10)
+
+    budget.acquire(50)
+
+    assert budget.used == 50
+
+
+def test_bytebudget_resize():
+    """Test resizing doesn't wait, even over the limit."""
+    budget = ByteBudget(10)
+    budget.acquire(10)
+
+    budget.resize(10, 15)
+
+    assert budget.used == 15
+
+
+def test_s3queue_releases_budget(s3_bucket_config, temp_directory):
+    """Test read ahead data is released after uploading, even on failure."""
+    bucket = S3Bucket(**s3_bucket_config)
+    budget = ByteBudget(1000)
+    budget.acquire(5)
+    test_file = os.path.join(temp_directory, "file1.txt")
+
+    with patch("boto3.resource") as mock_resource:
+        mock_bucket = mock_resource.return_value.Bucket.return_value
+        mock_bucket.meta.client.put_object.side_effect = Exception("Upload failed")
+        queue = S3Queue("prefix", [(test_file, b"hello")], bucket, budget=budget)
+        queue.run()
+
+    assert queue.failed == [test_file]
+    assert budget.used == 0
+
+
+def test_read_ahead(s3_bucket_config, temp_directory):
+    """Test small files are read into memory and large files aren't."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory, "prefix", bucket, max_in_flight=1000, read_ahead_size=10
+    )
+    big_file = os.path.join(temp_directory, "file1.txt")
+    small_file = os.path.join(temp_directory, "small.txt")
+    with open(small_file, "wb") as f:
+        f.write(b"small")
+
+    assert uploader._read_ahead(big_file) == big_file
+    assert uploader._read_ahead(small_file) == (small_file, b"small")
+    assert uploader.budget.used == 5
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_max_in_flight(mock_sleep, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test uploading with a budget smaller than the files."""
+    bucket = S3Bucket(**s3_bucket_config)
+    for i in range(10):
+        (tmp_path / "file{}.txt".format(i)).write_bytes(b"x" * 100)
+
+    uploader = S3Uploader(
+        str(tmp_path),
+        "prefix",
+        bucket,
+        concurrency=3,
+        handle_signals=False,
+        max_in_flight=250,
+    )
+    result = uploader.upload()
+
+    assert result == []
+    assert uploader.count == 10
+    assert uploader.budget.used == 0
+    assert len(mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"]) == 10
@@ -0,0 +1,87 @@
+"""
+Tests for upload checksums.
+"""
+
+import hashlib
+import os
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import MemoryBody, S3Bucket, S3Queue, S3Uploader, compute_checksum
+
+
+def test_compute_checksum_md5():
+    """Test MD5 checksums."""
+    assert compute_checksum("md5", b"hello") == hashlib.md5(b"hello").digest()
+
+
+def test_compute_checksum_crc32c():
+    """Test CRC32C checksums, using the standard check value."""
+    pytest.importorskip("crc32c")
+
+    assert compute_checksum("crc32c", b"123456789").hex() == "e3069283"
+
+
+def test_compute_checksum_unknown():
+    """Test unknown checksums are refused."""
+    with pytest.raises(ValueError):
+        compute_checksum("sha1", b"hello")
+
+
+def test_s3queue_checksum_unavailable(s3_bucket_config):
+    """Test a queue fails early without the crc32c package."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    with patch.dict("sys.modules", {"crc32c": None}):
+        with pytest.raises(ValueError) as exc_info:
+            S3Queue("prefix", [], bucket, checksum="crc32c")
+
+    assert "crc32c package" in str(exc_info.value)
+
+
+def test_s3queue_upload_md5(mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test uploading with an MD5 checksum matches the ETag."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+
+    queue = S3Queue(
+        "prefix", [test_file], bucket, strip_path=temp_directory, checksum="md5"
+    )
+    queue.run()
+
+    assert queue.failed == []
+    head = mock_aws_s3.head_object(Bucket="test-bucket", Key="prefix/file1.txt")
+    assert head["ETag"].strip('"') == queue.checksums[test_file]
+
+
+def test_s3queue_upload_sends_checksum(s3_bucket_config, temp_directory):
+    """Test the checksum is sent with the upload."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+
+    with patch("boto3.resource") as mock_resource:
+        mock_bucket = mock_resource.return_value.Bucket.return_value
+        queue = S3Queue("prefix", [test_file], bucket, checksum="md5")
+        queue.run()
+
+    kwargs = mock_bucket.meta.client.put_object.call_args[1]
+    assert kwargs["ContentMD5"]
+    assert isinstance(kwargs["Body"], MemoryBody)
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_checksums(mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test checksums are collected from all the queues."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        concurrency=2,
+        handle_signals=False,
+        checksum="md5",
+    )
+
+    assert uploader.upload() == []
+    assert len(uploader.checksums) == 4
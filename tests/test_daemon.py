@@ -0,0 +1,166 @@
+"""
+Tests for uploading jobs with a warm pool of threads using S3Daemon.
+"""
+
+import http.client
+import json
+import os
+import re
+import socket
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import S3Bucket, S3Daemon
+from s3peat.daemon import make_server
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path):
+        super(UnixHTTPConnection, self).__init__("localhost")
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+
+def _keys(client):
+    listing = client.list_objects_v2(Bucket="test-bucket")
+    return sorted(o["Key"] for o in listing.get("Contents", []))
+
+
+def _request(connection, method, path, body=None):
+    connection.request(method, path, body=body and json.dumps(body))
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+@pytest.fixture
+def daemon(mock_aws_s3, s3_bucket_config):
+    daemon = S3Daemon(S3Bucket(**s3_bucket_config), concurrency=2, checksum="md5")
+    daemon.start()
+    yield daemon
+    daemon.stop()
+
+
+@pytest.fixture
+def server(daemon, tmp_path):
+    """Serve the daemon's API on a Unix socket, yielding a connection."""
+    path = str(tmp_path / "s3peat.sock")
+    server = make_server(daemon, path)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield UnixHTTPConnection(path)
+    server.shutdown()
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_daemon_jobs(mock_sleep, daemon, mock_aws_s3, temp_directory):
+    """Test jobs are uploaded by the same threads, with their own keys."""
+    first = daemon.submit(temp_directory, "first")
+    second = daemon.submit(
+        temp_directory,
+        "second",
+        files=["file1.txt", "subdir/file3.txt", "missing.txt"],
+        exclude=[re.compile("file3")],
+    )
+
+    assert first.wait(10) and second.wait(10)
+    result = first.result()
+    assert result["done"]
+    assert result["total"] == 4
+    assert result["uploaded"] == 4
+    assert result["failed"] == []
+    assert len(result["checksums"]) == 4
+    assert second.result()["failed"] == [os.path.join(temp_directory, "missing.txt")]
+    assert _keys(mock_aws_s3) == [
+        "first/file1.txt",
+        "first/file2.txt",
+        "first/subdir/file3.txt",
+        "first/subdir/nested/file4.txt",
+        "second/file1.txt",
+    ]
+    assert all(queue.is_alive() for queue in daemon.queues)
+
+
+@pytest.mark.parametrize("filename", ["/etc/passwd", "../secret", "a/../../b", ".."])
+def test_daemon_files_outside_directory(daemon, temp_directory, filename):
+    """Test files must be inside the job's directory."""
+    with pytest.raises(ValueError, match="isn't inside"):
+        daemon.submit(temp_directory, "prefix", files=["file1.txt", filename])
+
+
+def test_daemon_loopback_only(daemon):
+    """Test the API only listens on loopback addresses unless told to."""
+    with pytest.raises(ValueError, match="loopback"):
+        make_server(daemon, ("0.0.0.0", 0))
+
+    server = make_server(daemon, ("127.0.0.1", 0))
+    server.server_close()
+    server = make_server(daemon, ("0.0.0.0", 0), listen_any=True)
+    server.server_close()
+
+
+def test_daemon_missing_directory(daemon, tmp_path):
+    """Test a job for a missing directory is done, with an error."""
+    job = daemon.submit(str(tmp_path / "missing"), "prefix")
+
+    assert job.wait(10)
+    assert "does not exist" in job.result()["error"]
+
+
+def test_daemon_keep_jobs(daemon, tmp_path):
+    """Test only the newest finished jobs are kept."""
+    daemon.keep_jobs = 2
+    jobs = [daemon.submit(str(tmp_path), "prefix") for i in range(2)]
+    for job in jobs:
+        job.wait(10)
+
+    last = daemon.submit(str(tmp_path), "prefix")
+
+    assert list(daemon.jobs) == [jobs[1].id, last.id]
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_daemon_http(mock_sleep, server, mock_aws_s3, temp_directory):
+    """Test jobs can be submitted and looked up over HTTP."""
+    status, result = _request(
+        server,
+        "POST",
+        "/jobs",
+        {
+            "directory": temp_directory,
+            "prefix": "http",
+            "include": [r"\.txt$"],
+            "wait": True,
+        },
+    )
+
+    assert status == 201
+    assert result["done"] and result["uploaded"] == 4
+    assert len(_keys(mock_aws_s3)) == 4
+
+    status, looked_up = _request(server, "GET", "/jobs/{}?wait=1".format(result["id"]))
+    assert status == 200
+    assert looked_up["id"] == result["id"]
+    status, results = _request(server, "GET", "/jobs")
+    assert [r["id"] for r in results] == [result["id"]]
+
+
+def test_daemon_http_errors(server):
+    """Test bad jobs and unknown jobs are refused."""
+    assert _request(server, "POST", "/jobs", {"prefix": "p"})[0] == 400
+    assert (
+        _request(server, "POST", "/jobs", {"directory": "d", "include": ["("]})[0]
+        == 400
+    )
+    assert (
+        _request(server, "POST", "/jobs", {"directory": "d", "files": ["/etc"]})[0]
+        == 400
+    )
+    assert _request(server, "GET", "/jobs/nope")[0] == 404
+    assert _request(server, "GET", "/other")[0] == 404
@@ -0,0 +1,113 @@
+"""
+Tests for finding duplicates and uploading them with S3DuplicateQueue.
+"""
+
+import os
+from unittest.mock import patch
+
+from s3peat import S3Bucket, S3Uploader
+from s3peat.dedup import S3DuplicateQueue, find_duplicates
+from s3peat.filelist import FileList, PairList
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+    return path
+
+
+def test_find_duplicates_by_content(tmp_path):
+    """Test files with the same content are duplicates."""
+    a = _write(str(tmp_path / "a.txt"), "same")
+    b = _write(str(tmp_path / "sub" / "b.txt"), "same")
+    c = _write(str(tmp_path / "c.txt"), "diff")
+    d = _write(str(tmp_path / "d.txt"), "longer")
+
+    originals, duplicates = find_duplicates([a, b, c, d], concurrency=2)
+
+    assert isinstance(originals, FileList)
+    assert isinstance(duplicates, PairList)
+    assert list(originals) == [a, c, d]
+    assert list(duplicates) == [(a, b)]
+
+
+def test_find_duplicates_only_hashes_size_collisions(tmp_path):
+    """Test files with unique sizes are never hashed."""
+    a = _write(str(tmp_path / "a.txt"), "a")
+    b = _write(str(tmp_path / "b.txt"), "bb")
+
+    with patch("s3peat.dedup._hash") as mock_hash:
+        originals, duplicates = find_duplicates([a, b])
+
+    mock_hash.assert_not_called()
+    assert list(originals) == [a, b]
+    assert list(duplicates) == []
+
+
+def test_find_duplicates_hard_links(tmp_path):
+    """Test hard links are found without hashing."""
+    a = _write(str(tmp_path / "a.txt"), "linked")
+    b = str(tmp_path / "b.txt")
+    os.link(a, b)
+
+    with patch("s3peat.dedup._hash") as mock_hash:
+        originals, duplicates = find_duplicates([a, b])
+
+    mock_hash.assert_not_called()
+    assert list(originals) == [a]
+    assert list(duplicates) == [(a, b)]
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_dedup(mock_sleep, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test duplicates are copied server-side."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _write(str(tmp_path / "en" / "logo.svg"), "<svg/>")
+    _write(str(tmp_path / "fr" / "logo.svg"), "<svg/>")
+    _write(str(tmp_path / "readme.txt"), "hello")
+
+    uploader = S3Uploader(
+        str(tmp_path),
+        "prefix",
+        bucket,
+        concurrency=2,
+        handle_signals=False,
+        dedup=True,
+    )
+    with patch.object(
+        S3DuplicateQueue,
+        "_transfer",
+        autospec=True,
+        side_effect=S3DuplicateQueue._transfer,
+    ) as transfer:
+        result = uploader.upload()
+
+    assert transfer.call_count == 1
+
+    assert result == []
+    assert uploader.count == 3
+    for key in ("prefix/en/logo.svg", "prefix/fr/logo.svg"):
+        body = mock_aws_s3.get_object(Bucket="test-bucket", Key=key)["Body"]
+        assert body.read() == b"<svg/>"
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_dedup_checksums(mock_sleep, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test copies are given the checksums of their originals."""
+    bucket = S3Bucket(**s3_bucket_config)
+    en = _write(str(tmp_path / "en" / "logo.svg"), "<svg/>")
+    fr = _write(str(tmp_path / "fr" / "logo.svg"), "<svg/>")
+
+    uploader = S3Uploader(
+        str(tmp_path),
+        "prefix",
+        bucket,
+        handle_signals=False,
+        dedup=True,
+        checksum="md5",
+    )
+    assert uploader.upload() == []
+
+    assert uploader.checksums[fr] == uploader.checksums[en]
+    assert len(uploader.checksums) == 2
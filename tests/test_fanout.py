@@ -0,0 +1,158 @@
+"""
+Tests for uploading the same files to several buckets with S3FanOut.
+"""
+
+import os
+from unittest.mock import Mock, patch
+
+import pytest
+
+from s3peat import ByteBudget, S3Bucket, S3FanOut, sync_to_many
+from s3peat.fanout import SharedFile
+
+
+def _buckets(client, s3_bucket_config, names=("test-bucket", "other-bucket")):
+    buckets = []
+    for name in names:
+        if name != "test-bucket":
+            client.create_bucket(Bucket=name)
+        buckets.append(S3Bucket(name, "test-key", "test-secret"))
+    return buckets
+
+
+def _keys(client, name):
+    return sorted(o["Key"] for o in client.list_objects_v2(Bucket=name)["Contents"])
+
+
+def test_shared_file_read(tmp_path):
+    """Test small files are read and large ones mapped, until released."""
+    small = tmp_path / "small.bin"
+    small.write_bytes(b"x" * 10)
+    large = tmp_path / "large.bin"
+    large.write_bytes(b"y" * 100)
+    budget = ByteBudget(1000)
+
+    shared = SharedFile(str(small), 2, 50, budget)
+    assert shared.data == b"x" * 10
+    mapped = SharedFile(str(large), 2, 50, budget)
+    assert isinstance(mapped.data, memoryview)
+    assert bytes(mapped.data) == b"y" * 100
+    assert budget.used == 110
+
+    for item in (shared, mapped):
+        item.release()
+        assert item.data is not None
+        item.release()
+        assert item.data is None
+    assert budget.used == 0
+
+
+def test_shared_file_missing(tmp_path):
+    """Test a file that can't be read is left for the uploads to fail on."""
+    shared = SharedFile(str(tmp_path / "missing"), 1, 50, ByteBudget(10))
+
+    assert shared.data is None
+    shared.release()
+    assert shared._budget.used == 0
+
+
+def test_fan_out_concurrency(s3_bucket_config):
+    """Test concurrency is given for each bucket."""
+    buckets = [S3Bucket(**s3_bucket_config), S3Bucket(**s3_bucket_config)]
+
+    assert S3FanOut("d", "p", buckets, concurrency=3).concurrencies == [3, 3]
+    with pytest.raises(ValueError):
+        S3FanOut("d", "p", buckets, concurrency=[3])
+    with pytest.raises(ValueError):
+        S3FanOut("d", "p", [])
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_sync_to_many(mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test every file is uploaded to every bucket, reading it once."""
+    buckets = _buckets(mock_aws_s3, s3_bucket_config)
+
+    with patch("s3peat.fanout.SharedFile._read", autospec=True) as read:
+        read.side_effect = lambda self, size: setattr(self, "data", b"shared")
+        failures = sync_to_many(
+            temp_directory,
+            "prefix",
+            buckets,
+            concurrency=[2, 1],
+            handle_signals=False,
+        )
+
+    assert failures == {"test-bucket": [], "other-bucket": []}
+    assert read.call_count == 4
+    expected = [
+        "prefix/file1.txt",
+        "prefix/file2.txt",
+        "prefix/subdir/file3.txt",
+        "prefix/subdir/nested/file4.txt",
+    ]
+    for name in ("test-bucket", "other-bucket"):
+        assert _keys(mock_aws_s3, name) == expected
+        body = mock_aws_s3.get_object(Bucket=name, Key="prefix/file1.txt")["Body"]
+        assert body.read() == b"shared"
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_fan_out_failures(mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test failures are kept for each bucket."""
+    buckets = _buckets(mock_aws_s3, s3_bucket_config)
+    broken = os.path.join(temp_directory, "file2.txt")
+    uploader = S3FanOut(
+        temp_directory,
+        "prefix",
+        buckets,
+        concurrency=2,
+        handle_signals=False,
+        max_in_flight=1024,
+    )
+
+    upload = uploader._new_queue([])._upload.__func__
+
+    def fail_other(queue, filename, bucket, data=None):
+        if queue.bucket.name == "other-bucket" and filename == broken:
+            data = None
+            filename = filename + ".missing"
+        return upload(queue, filename, bucket, data)
+
+    with patch("s3peat.fanout.S3FanOutQueue._upload", fail_other):
+        failures = uploader.upload()
+
+    assert failures == {"test-bucket": [], "other-bucket": [broken + ".missing"]}
+    assert uploader.count == 8
+    assert uploader.total == 8
+    assert uploader.budget.used == 0
+    assert len(_keys(mock_aws_s3, "test-bucket")) == 4
+    assert len(_keys(mock_aws_s3, "other-bucket")) == 3
+
+
+def test_fan_out_stop_aborts_in_each_bucket(s3_bucket_config, tmp_path):
+    """Test stopping aborts each queue's multipart uploads in its own bucket."""
+    buckets = [
+        S3Bucket("test-bucket", "test-key", "test-secret"),
+        S3Bucket("other-bucket", "test-key", "test-secret"),
+    ]
+    uploader = S3FanOut(
+        str(tmp_path), "prefix", buckets, handle_signals=False, drain_timeout=0
+    )
+    clients = {}
+    for bucket in buckets:
+        queue = uploader._new_queue([], bucket=bucket)
+        queue.current = "file"
+        queue.is_alive = lambda: True
+        queue.uploads["{}-upload".format(bucket.name)] = "prefix/file"
+        uploader.queues.append(queue)
+        clients[bucket.name] = Mock()
+        bucket.get_new = Mock()
+        bucket.get_new.return_value.meta.client = clients[bucket.name]
+
+    with pytest.raises(SystemExit):
+        uploader.stop()
+
+    for name, client in clients.items():
+        client.abort_multipart_upload.assert_called_once_with(
+            Bucket=name, Key="prefix/file", UploadId="{}-upload".format(name)
+        )
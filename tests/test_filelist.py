@@ -0,0 +1,103 @@
+"""
+Tests for the compact FileList.
+"""
+
+import os
+
+import pytest
+
+from s3peat.filelist import FileList, PairList, _find_nth
+
+FILENAMES = [
+    os.path.join("root", "a.txt"),
+    os.path.join("root", "b.txt"),
+    os.path.join("root", "sub", "c.txt"),
+    os.path.join("root", "a.txt.bak"),
+    "top.txt",
+    os.path.sep + "abs.txt",
+]
+
+
+def test_filelist_iter():
+    """Test filenames come back exactly as they went in, in order."""
+    filenames = FileList(FILENAMES)
+
+    assert len(filenames) == len(FILENAMES)
+    assert list(filenames) == FILENAMES
+    assert bool(filenames)
+    assert not FileList()
+
+
+def test_filelist_pop():
+    """Test taking filenames from the end, the way S3Queue does."""
+    filenames = FileList(FILENAMES)
+    popped = []
+    while filenames:
+        last = filenames[-1]
+        assert filenames.pop() == last
+        popped.append(last)
+
+    assert popped == FILENAMES[::-1]
+    assert len(filenames) == 0
+    with pytest.raises(IndexError):
+        filenames.pop()
+
+
+def test_filelist_getitem():
+    """Test indexing anywhere in the list."""
+    filenames = FileList(FILENAMES)
+
+    for i, filename in enumerate(FILENAMES):
+        assert filenames[i] == filename
+        assert filenames[i - len(FILENAMES)] == filename
+
+    with pytest.raises(IndexError):
+        filenames[len(FILENAMES)]
+    with pytest.raises(TypeError):
+        filenames[0:2]
+
+
+def test_filelist_chunks(monkeypatch):
+    """Test large directories are split into chunks sharing a directory."""
+    monkeypatch.setattr("s3peat.filelist.CHUNK_NAMES", 3)
+    names = [os.path.join("dir", "f{}".format(i)) for i in range(10)]
+    filenames = FileList(names)
+
+    assert list(filenames) == names
+    assert len(filenames._chunks) == 4
+    assert len({id(chunk[0]) for chunk in filenames._chunks}) == 1
+
+
+@pytest.mark.parametrize("count", [1, 2, 3, 4, 7, 10])
+def test_filelist_split(count):
+    """Test splitting into contiguous, balanced groups."""
+    filenames = FileList(FILENAMES)
+
+    groups = filenames.split(count)
+
+    assert len(groups) == count
+    assert [f for group in groups for f in group] == FILENAMES
+    sizes = [len(group) for group in groups]
+    assert max(sizes) - min(sizes) <= 1
+
+
+def test_pairlist():
+    """Test pairs are kept, popped and split together."""
+    pairs = PairList(zip(FILENAMES, reversed(FILENAMES)))
+
+    assert len(pairs) == len(FILENAMES)
+    assert list(pairs) == list(zip(FILENAMES, reversed(FILENAMES)))
+    assert pairs[-1] == (FILENAMES[-1], FILENAMES[0])
+
+    groups = pairs.split(4)
+    assert [pair for group in groups for pair in group] == list(pairs)
+    assert pairs.pop() == (FILENAMES[-1], FILENAMES[0])
+    assert len(pairs) == len(FILENAMES) - 1
+
+
+def test_find_nth():
+    """Test finding separators."""
+    assert _find_nth("a\0b\0c", "\0", 1, 0, 5) == 1
+    assert _find_nth("a\0b\0c", "\0", 2, 0, 5) == 3
+    assert _find_nth("a\0b\0c", "\0", 3, 0, 5) == 5
+    assert _find_nth("a\0b\0c", "\0", 1, 2, 5) == 3
@@ -0,0 +1,167 @@
+"""
+Tests for hedged requests and request timeouts.
+"""
+
+import os
+import threading
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+
+from s3peat import S3Bucket, S3Queue
+from s3peat.hedge import LatencyTracker, run_hedged
+
+
+def test_latency_tracker_threshold():
+    """Test percentiles, scaled by request size."""
+    latencies = LatencyTracker()
+    assert latencies.threshold(95) is None
+
+    for i in range(100):
+        latencies.record(i / 100.0)
+
+    assert len(latencies) == 100
+    assert latencies.threshold(50) == 0.5
+    assert latencies.threshold(95) == 0.95
+    assert latencies.threshold(100) == 0.99
+    # Bigger requests get longer
+    assert latencies.threshold(50, size=4 * 1024 * 1024) == 2.0
+
+
+def test_latency_tracker_per_mib():
+    """Test latencies are kept per MiB."""
+    latencies = LatencyTracker(window=20)
+    for i in range(20):
+        latencies.record(8.0, size=8 * 1024 * 1024)
+
+    assert latencies.threshold(50) == 1.0
+
+
+def test_run_hedged_no_delay():
+    """Test requests aren't hedged without a delay."""
+    backup = Mock()
+
+    assert run_hedged(lambda: "primary", backup, None) == ("primary", False)
+    backup.assert_not_called()
+
+
+def test_run_hedged_fast():
+    """Test fast requests aren't hedged."""
+    backup = Mock()
+
+    assert run_hedged(lambda: "primary", backup, 5) == ("primary", False)
+    backup.assert_not_called()
+
+
+def test_run_hedged_slow():
+    """Test slow requests are hedged, and the backup wins."""
+    stuck = threading.Event()
+
+    def primary():
+        stuck.wait(5)
+        return "primary"
+
+    try:
+        assert run_hedged(primary, lambda: "backup", 0.01) == ("backup", True)
+    finally:
+        stuck.set()
+
+
+def test_run_hedged_backup_fails():
+    """Test a failed backup still lets the slow primary win."""
+
+    def primary():
+        time.sleep(0.1)
+        return "primary"
+
+    def backup():
+        raise IOError("backup failed")
+
+    assert run_hedged(primary, backup, 0.01) == ("primary", True)
+
+
+def test_run_hedged_both_fail():
+    """Test the error is raised when every attempt fails."""
+
+    def primary():
+        time.sleep(0.05)
+        raise IOError("primary failed")
+
+    def backup():
+        raise IOError("backup failed")
+
+    with pytest.raises(IOError):
+        run_hedged(primary, backup, 0.01)
+
+
+def test_s3queue_hedges_slow_upload(s3_bucket_config, temp_directory):
+    """Test a stalled upload is sent again on a fresh connection."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+    latencies = LatencyTracker()
+    for i in range(20):
+        latencies.record(0.01)
+
+    stuck = threading.Event()
+    slow_bucket = Mock()
+    slow_bucket.meta.client.put_object.side_effect = lambda **kwargs: stuck.wait(5)
+    fresh_bucket = Mock()
+
+    try:
+        with patch.object(bucket, "get_new", return_value=fresh_bucket):
+            queue = S3Queue("prefix", [], bucket, hedge=95, latencies=latencies)
+            queue._upload(test_file, slow_bucket)
+    finally:
+        stuck.set()
+
+    assert queue.failed == []
+    assert queue.hedged == 1
+    fresh_bucket.meta.client.put_object.assert_called_once()
+    # The duplicate gets its own body
+    body = fresh_bucket.meta.client.put_object.call_args[1]["Body"]
+    assert body is not slow_bucket.meta.client.put_object.call_args[1]["Body"]
+    assert len(latencies) == 21
+
+
+def test_s3queue_hedge_spare(s3_bucket_config):
+    """Test hedged requests use a spare connection, replaced once it's used."""
+    bucket = S3Bucket(**s3_bucket_config)
+    latencies = LatencyTracker()
+    for i in range(20):
+        latencies.record(0.5)
+
+    stuck = threading.Event()
+    primary, spares = Mock(), [Mock(), Mock()]
+
+    def stall(b):
+        if b is primary:
+            stuck.wait(5)
+        return b
+
+    try:
+        with patch.object(bucket, "get_new", side_effect=spares) as get_new:
+            queue = S3Queue("prefix", [], bucket, hedge=95, latencies=latencies)
+            assert queue._request(primary, lambda b: b) is primary
+            assert queue._request(primary, lambda b: b) is primary
+            assert get_new.call_count == 1
+
+            assert queue._request(primary, stall) is spares[0]
+    finally:
+        stuck.set()
+
+    assert get_new.call_count == 2
+    assert queue._spare is spares[1]
+    assert queue.hedged == 1
+
+
+def test_s3queue_timeout(s3_bucket_config):
+    """Test timeouts are passed on to botocore."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    with patch.object(bucket, "get_new") as mock_get_new:
+        S3Queue("prefix", [], bucket, timeout=7.5)._connect()
+
+    config = mock_get_new.call_args[0][0]
+    assert config.connect_timeout == 7.5
+    assert config.read_timeout == 7.5
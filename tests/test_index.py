@@ -0,0 +1,74 @@
+"""
+Tests for the RemoteIndex class.
+"""
+
+import io
+
+import pytest
+
+from s3peat.index import RemoteIndex
+
+
+def test_index_add_get():
+    """Test keys map to their size and modified time."""
+    index = RemoteIndex()
+    index.add("a/b.txt", 10, 1700000000)
+    index.add("a/c.txt", 0, 1600000000)
+
+    assert index.get("a/b.txt") == (10, 1700000000)
+    assert index.get("a/c.txt") == (0, 1600000000)
+    assert index.get("a/d.txt") is None
+    assert "a/b.txt" in index
+    assert len(index) == 2
+
+
+def test_index_update():
+    """Test adding a key again replaces it."""
+    index = RemoteIndex()
+    index.add("key", 10, 1)
+    index.add("key", 20, 2)
+
+    assert index.get("key") == (20, 2)
+    assert len(index) == 1
+
+
+def test_index_grows():
+    """Test the table grows to fit more keys than it started with."""
+    index = RemoteIndex()
+    for i in range(5000):
+        index.add("key/{}".format(i), i, i * 2)
+
+    assert len(index) == 5000
+    assert all(index.get("key/{}".format(i)) == (i, i * 2) for i in range(5000))
+    assert "<RemoteIndex of 5000 keys in 8192 slots>" == repr(index)
+
+
+def test_index_capacity():
+    """Test making room up front."""
+    assert repr(RemoteIndex(10000)) == "<RemoteIndex of 0 keys in 16384 slots>"
+
+
+def test_index_write_read():
+    """Test an index written out reads back the same."""
+    index = RemoteIndex()
+    for i in range(100):
+        index.add("key/{}".format(i), i, 1700000000 + i)
+    f = io.BytesIO()
+    index.write(f)
+    f.write(b"trailing")
+    f.seek(0)
+
+    copy = RemoteIndex.read(f)
+
+    assert len(copy) == 100
+    assert copy.get("key/42") == (42, 1700000042)
+    assert copy.get("key/100") is None
+    assert f.read() == b"trailing"
+
+
+def test_index_read_invalid():
+    """Test reading something that isn't an index fails."""
+    with pytest.raises(ValueError):
+        RemoteIndex.read(io.BytesIO(b"\x03" + bytes(15)))
+    with pytest.raises(EOFError):
+        RemoteIndex.read(io.BytesIO(b"\x08" + bytes(15)))
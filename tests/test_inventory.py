@@ -0,0 +1,170 @@
+"""
+Tests for reading S3 Inventory reports, and skipping files they list.
+"""
+
+import gzip
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import S3Bucket, S3Uploader
+from s3peat.index import RemoteIndex
+from s3peat.inventory import _count_csv, _timestamp, load_inventory
+
+SCHEMA = "Bucket, Key, Size, LastModifiedDate, ETag"
+
+
+def _write_inventory(tmp_path, rows, schema=SCHEMA, file_format="CSV"):
+    """Write an inventory laid out the way S3 does, returning the manifest."""
+    manifest_dir = tmp_path / "inventory" / "2024-01-01T01-00Z"
+    data_dir = tmp_path / "inventory" / "data"
+    manifest_dir.mkdir(parents=True)
+    data_dir.mkdir()
+
+    with gzip.open(str(data_dir / "report.csv.gz"), "wt") as f:
+        for row in rows:
+            f.write(",".join('"{}"'.format(value) for value in row) + "\n")
+
+    manifest = manifest_dir / "manifest.json"
+    manifest.write_text(
+        json.dumps(
+            {
+                "sourceBucket": "test-bucket",
+                "fileFormat": file_format,
+                "fileSchema": schema,
+                "files": [{"key": "inventory/test-bucket/config/data/report.csv.gz"}],
+            }
+        )
+    )
+    return str(manifest)
+
+
+def test_timestamp():
+    """Test parsing inventory dates."""
+    assert _timestamp("2024-01-01T12:00:00.000Z") == 1704110400
+
+
+def test_load_inventory(tmp_path):
+    """Test keys under the prefix are indexed, with their size and time."""
+    manifest = _write_inventory(
+        tmp_path,
+        [
+            ("test-bucket", "prefix/a.txt", 5, "2024-01-01T12:00:00.000Z", "e"),
+            (
+                "test-bucket",
+                "prefix/with+space.txt",
+                7,
+                "2024-01-01T12:00:00.000Z",
+                "e",
+            ),
+            ("test-bucket", "other/b.txt", 3, "2024-01-01T12:00:00.000Z", "e"),
+        ],
+    )
+
+    index = load_inventory(manifest, "prefix/", "test-bucket")
+
+    assert len(index) == 2
+    assert index.get("prefix/a.txt") == (5, 1704110400)
+    # Keys are URL encoded
+    assert index.get("prefix/with space.txt") == (7, 1704110400)
+
+
+def test_load_inventory_presized(tmp_path):
+    """Test the index is made big enough up front, so it never grows."""
+    rows = [
+        ("test-bucket", "prefix/{}.txt".format(i), i, "2024-01-01T12:00:00.000Z", "e")
+        for i in range(100)
+    ]
+    rows.append(
+        ("test-bucket", "prefix%2Fencoded.txt", 1, "2024-01-01T12:00:00.000Z", "e")
+    )
+    rows.append(("test-bucket", "other/b.txt", 3, "2024-01-01T12:00:00.000Z", "e"))
+    manifest = _write_inventory(tmp_path, rows)
+    report = str(tmp_path / "inventory" / "data" / "report.csv.gz")
+    fields = ["Bucket", "Key", "Size", "LastModifiedDate", "ETag"]
+
+    assert _count_csv(report, fields) == 102
+    # Prefixes match with or without their slashes encoded
+    assert _count_csv(report, fields, "CSV", "prefix/") == 101
+
+    with patch.object(RemoteIndex, "_grow") as grow:
+        index = load_inventory(manifest, "prefix/")
+
+    grow.assert_not_called()
+    assert len(index) == 101
+
+
+def test_load_inventory_skips_old_versions(tmp_path):
+    """Test only the latest versions which aren't delete markers are indexed."""
+    manifest = _write_inventory(
+        tmp_path,
+        [
+            ("test-bucket", "a", "", "true", "true", 0, "2024-01-01T12:00:00.000Z"),
+            ("test-bucket", "b", "", "false", "false", 1, "2024-01-01T12:00:00.000Z"),
+            ("test-bucket", "c", "", "true", "false", 2, "2024-01-01T12:00:00.000Z"),
+        ],
+        schema="Bucket, Key, VersionId, IsLatest, IsDeleteMarker, Size, "
+        "LastModifiedDate",
+    )
+
+    index = load_inventory(manifest)
+
+    assert "a" not in index
+    assert "b" not in index
+    assert "c" in index
+
+
+def test_load_inventory_errors(tmp_path):
+    """Test inventories we can't use are refused."""
+    manifest = _write_inventory(tmp_path, [], schema="Bucket, Key, Size")
+
+    with pytest.raises(ValueError, match="LastModifiedDate"):
+        load_inventory(manifest)
+
+    manifest = _write_inventory(tmp_path / "other", [])
+    with pytest.raises(ValueError, match="not 'another-bucket'"):
+        load_inventory(manifest, bucket="another-bucket")
+
+    manifest = _write_inventory(
+        tmp_path / "parquet",
+        [],
+        schema="message s3.inventory { required binary bucket (STRING); "
+        "required binary key (STRING); optional int64 size; "
+        "optional int64 last_modified_date (TIMESTAMP(MILLIS,true)); }",
+        file_format="Parquet",
+    )
+    with patch.dict("sys.modules", {"pyarrow": None}):
+        with pytest.raises(ValueError, match="pyarrow"):
+            load_inventory(manifest)
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_skips_inventoried_files(
+    mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory, tmp_path
+):
+    """Test files already uploaded according to the inventory are skipped."""
+    path = os.path.join(temp_directory, "file1.txt")
+    size = os.path.getsize(path)
+    uploaded = "2099-01-01T00:00:00.000Z"
+    manifest = _write_inventory(
+        tmp_path,
+        [
+            ("test-bucket", "prefix/file1.txt", size, uploaded, "e"),
+            # A different size means it's changed
+            ("test-bucket", "prefix/file2.txt", size + 1, uploaded, "e"),
+        ],
+    )
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory, "prefix", bucket, handle_signals=False, inventory=manifest
+    )
+
+    assert uploader.upload() == []
+
+    assert uploader.skipped == 1
+    assert uploader.total == 3
+    keys = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"]
+    assert "prefix/file1.txt" not in [o["Key"] for o in keys]
+    assert len(keys) == 3
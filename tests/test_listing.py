@@ -0,0 +1,145 @@
+"""
+Tests for the cached listing of S3, and skipping files it lists.
+"""
+
+import os
+import time
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import S3Bucket, S3Uploader
+from s3peat.listing import ListingCache
+
+
+def _cache(tmp_path, client, prefix="prefix/", ttl=60):
+    return ListingCache(str(tmp_path / "listing"), client, "test-bucket", prefix, ttl)
+
+
+def test_listing_lists_directories(mock_aws_s3, tmp_path):
+    """Test each directory is listed once, when it's first asked about."""
+    for key in ("prefix/a.txt", "prefix/sub/b.txt", "prefix/other/c.txt"):
+        mock_aws_s3.put_object(Bucket="test-bucket", Key=key, Body=b"12345")
+    listing = _cache(tmp_path, mock_aws_s3)
+
+    assert listing.get("prefix/a.txt")[0] == 5
+    # The top level listing doesn't include the directories
+    assert len(listing) == 1
+    assert listing.get("prefix/sub/b.txt")[0] == 5
+    assert listing.get("prefix/sub/missing.txt") is None
+    assert listing.get("elsewhere/a.txt") is None
+
+    assert listing.listed == 2
+    assert sorted(listing.listings) == ["", "sub"]
+
+
+def test_listing_save_load(mock_aws_s3, tmp_path):
+    """Test a saved listing is used until it's older than the TTL."""
+    mock_aws_s3.put_object(Bucket="test-bucket", Key="prefix/sub/b.txt", Body=b"1")
+    listing = _cache(tmp_path, mock_aws_s3)
+    assert "prefix/sub/b.txt" in listing
+    listing.add("prefix/sub/new.txt", 3, 1700000000)
+    listing.add("prefix/unlisted/c.txt", 4, 1700000000)
+    listing.save()
+
+    # Changes in S3 aren't seen while the listing is fresh
+    mock_aws_s3.delete_object(Bucket="test-bucket", Key="prefix/sub/b.txt")
+    listing = _cache(tmp_path, mock_aws_s3)
+    assert listing.load()
+    assert listing.get("prefix/sub/new.txt") == (3, 1700000000)
+    assert "prefix/sub/b.txt" in listing
+    assert listing.listed == 0
+    assert listing.reused == 1
+
+    # Directories we only added to are listed when needed
+    assert "prefix/unlisted/c.txt" not in listing
+    assert listing.listed == 1
+
+    # Once it's too old, it's listed again
+    listing = _cache(tmp_path, mock_aws_s3, ttl=0)
+    assert listing.load()
+    assert "prefix/sub/b.txt" not in listing
+    assert listing.listed == 1
+
+
+def test_listing_save_in_use(mock_aws_s3, tmp_path):
+    """Test saving gives up if the cache is held, as by an interrupted get."""
+    listing = _cache(tmp_path, mock_aws_s3)
+
+    with listing._lock:
+        assert listing.save(timeout=0.01) is False
+
+    assert not os.path.exists(listing.filename)
+    assert listing.save(timeout=0.01) is True
+
+
+def test_listing_load_mismatch(mock_aws_s3, tmp_path):
+    """Test a listing saved for another prefix isn't used."""
+    listing = _cache(tmp_path, mock_aws_s3)
+    listing.add("prefix/a.txt", 1, 1700000000)
+    listing.save()
+
+    assert not _cache(tmp_path, mock_aws_s3, prefix="other/").load()
+    assert not _cache(tmp_path / "missing", mock_aws_s3).load()
+
+    (tmp_path / "listing").write_bytes(b"garbage\n")
+    assert not _cache(tmp_path, mock_aws_s3).load()
+
+
+def test_listing_expire(mock_aws_s3, tmp_path):
+    """Test expiring the listing has every directory listed again."""
+    listing = _cache(tmp_path, mock_aws_s3)
+    assert listing.get("prefix/sub/a.txt") is None
+    listing.add("prefix/sub/a.txt", 1, 1700000000)
+
+    listing.expire()
+
+    assert listing.get("prefix/sub/a.txt") is None
+    assert listing.listed == 2
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_with_listing_cache(
+    mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory, tmp_path
+):
+    """Test a second run skips what the first uploaded, without listing."""
+    past = time.time() - 3600
+    for root, dirs, files in os.walk(temp_directory):
+        for name in files:
+            os.utime(os.path.join(root, name), (past, past))
+    cache = str(tmp_path / "listing")
+    bucket = S3Bucket(**s3_bucket_config)
+
+    uploader = S3Uploader(
+        temp_directory, "prefix", bucket, handle_signals=False, listing_cache=cache
+    )
+    assert uploader.upload() == []
+    assert uploader.skipped == 0
+    assert uploader.listing.listed == 2
+
+    with open(os.path.join(temp_directory, "file2.txt"), "a") as f:
+        f.write("changed")
+    uploader = S3Uploader(
+        temp_directory, "prefix", bucket, handle_signals=False, listing_cache=cache
+    )
+    assert uploader.upload() == []
+
+    assert uploader.skipped == 3
+    assert uploader.total == 1
+    assert uploader.listing.listed == 0
+    assert uploader.listing.reused == 2
+
+
+def test_upload_listing_cache_with_inventory(s3_bucket_config, temp_directory):
+    """Test an inventory and a listing cache can't be used together."""
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        S3Bucket(**s3_bucket_config),
+        handle_signals=False,
+        inventory="manifest.json",
+        listing_cache="listing",
+    )
+
+    with pytest.raises(ValueError, match="listing cache"):
+        uploader.upload()
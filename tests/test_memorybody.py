@@ -0,0 +1,130 @@
+"""
+Tests for memory mapped upload bodies and multipart uploads.
+"""
+
+import hashlib
+import mmap
+import os
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import MemoryBody, S3Bucket, S3Queue, _mapped
+
+MiB = 1024 * 1024
+
+
+def test_memorybody_read():
+    """Test reads return views without copying."""
+    body = MemoryBody(b"hello world")
+
+    chunk = body.read(5)
+    assert isinstance(chunk, memoryview)
+    assert bytes(chunk) == b"hello"
+    assert bytes(body.read()) == b" world"
+    assert bytes(body.read(5)) == b""
+    assert len(body) == 11
+
+
+def test_memorybody_seek():
+    """Test seeking back, as botocore does to retry."""
+    body = MemoryBody(b"hello world")
+    body.read()
+
+    assert body.tell() == 11
+    assert body.seek(0) == 0
+    assert bytes(body.read(5)) == b"hello"
+    assert body.seek(-5, os.SEEK_END) == 6
+    assert body.seek(1, os.SEEK_CUR) == 7
+    assert bytes(body.read()) == b"orld"
+
+    with pytest.raises(ValueError):
+        body.seek(-1)
+
+
+def test_mapped(temp_directory):
+    """Test files are mapped, and empty files still work."""
+    test_file = os.path.join(temp_directory, "file1.txt")
+    empty_file = os.path.join(temp_directory, "empty.txt")
+    open(empty_file, "wb").close()
+
+    with _mapped(test_file) as view:
+        assert isinstance(view.obj, mmap.mmap)
+        assert bytes(view) == b"Test content for file1.txt"
+
+    with _mapped(empty_file) as view:
+        assert bytes(view) == b""
+
+
+def test_s3queue_upload_body(s3_bucket_config, temp_directory):
+    """Test small files are read, not mapped, and sent as a single body."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+
+    with patch("boto3.resource") as mock_resource, patch("mmap.mmap") as mock_mmap:
+        mock_bucket = mock_resource.return_value.Bucket.return_value
+        queue = S3Queue("prefix", [test_file], bucket)
+        queue.run()
+
+    mock_mmap.assert_not_called()
+    body = mock_bucket.meta.client.put_object.call_args[1]["Body"]
+    assert isinstance(body, MemoryBody)
+    assert len(body) == len(b"Test content for file1.txt")
+
+
+@pytest.mark.parametrize("map_files", [True, False])
+def test_s3queue_upload_parts(map_files, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test large files are uploaded in parts, with a matching checksum."""
+    bucket = S3Bucket(**s3_bucket_config)
+    data = os.urandom(11 * MiB)
+    test_file = tmp_path / "large.bin"
+    test_file.write_bytes(data)
+
+    queue = S3Queue(
+        "prefix",
+        [str(test_file)],
+        bucket,
+        strip_path=str(tmp_path),
+        checksum="md5",
+        multipart_threshold=8 * MiB,
+        part_size=5 * MiB,
+        map_files=map_files,
+    )
+    with patch("mmap.mmap", side_effect=mmap.mmap) as mock_mmap:
+        queue.run()
+
+    assert mock_mmap.called == map_files
+    assert queue.failed == []
+    obj = mock_aws_s3.get_object(Bucket="test-bucket", Key="prefix/large.bin")
+    assert obj["Body"].read() == data
+
+    # S3 reports multipart ETags as the MD5 of the part MD5s
+    checksum = queue.checksums[str(test_file)]
+    assert checksum.endswith("-3")
+    assert obj["ETag"].strip('"') == checksum
+    parts = [data[i : i + 5 * MiB] for i in range(0, len(data), 5 * MiB)]
+    combined = hashlib.md5(b"".join(hashlib.md5(p).digest() for p in parts))
+    assert checksum == combined.hexdigest() + "-3"
+
+
+def test_s3queue_upload_parts_abort(s3_bucket_config, tmp_path):
+    """Test failed multipart uploads are aborted."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = tmp_path / "large.bin"
+    test_file.write_bytes(b"x" * 300)
+
+    with patch("boto3.resource") as mock_resource:
+        client = mock_resource.return_value.Bucket.return_value.meta.client
+        client.create_multipart_upload.return_value = {"UploadId": "upload"}
+        client.upload_part.side_effect = Exception("Upload failed")
+        queue = S3Queue(
+            "prefix", [str(test_file)], bucket, multipart_threshold=100, part_size=100
+        )
+        queue.run()
+
+    assert queue.failed == [str(test_file)]
+    client.abort_multipart_upload.assert_called_once_with(
+        Bucket="test-bucket",
+        Key="prefix/" + str(test_file).lstrip(os.sep),
+        UploadId="upload",
+    )
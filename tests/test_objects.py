@@ -0,0 +1,119 @@
+"""
+Tests for uploading objects from memory with S3ObjectUploader.
+"""
+
+import hashlib
+import io
+import os
+from unittest.mock import patch
+
+from s3peat import S3Bucket, S3ObjectQueue, S3ObjectUploader, upload_objects
+from s3peat.objects import _parts
+
+MiB = 1024 * 1024
+
+
+def _body(client, key):
+    return client.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+
+
+def test_object_queue_key(s3_bucket_config):
+    """Test object keys go under the prefix."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    assert S3ObjectQueue("prefix/", [], bucket)._object_key("a/b") == "prefix/a/b"
+    assert S3ObjectQueue("", [], bucket)._object_key("/a/b") == "a/b"
+
+
+def test_parts():
+    """Test chunks are regrouped into parts of the right size."""
+    parts = list(_parts(b"abc", iter([b"de", b"fghij", b"k"]), 4))
+
+    assert parts == [b"abcd", b"efgh", b"ijk"]
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_objects(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test uploading bytes, file objects and generators."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    def chunks():
+        yield b"gen"
+        yield b"erated"
+
+    objects = [
+        ("a.txt", b"bytes"),
+        ("sub/b.txt", io.BytesIO(b"file object")),
+        ("c.txt", chunks()),
+    ]
+
+    result = upload_objects(
+        iter(objects), "prefix", bucket, concurrency=2, handle_signals=False
+    )
+
+    assert result == []
+    assert _body(mock_aws_s3, "prefix/a.txt") == b"bytes"
+    assert _body(mock_aws_s3, "prefix/sub/b.txt") == b"file object"
+    assert _body(mock_aws_s3, "prefix/c.txt") == b"generated"
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_objects_multipart(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test large generated objects are streamed as multipart uploads."""
+    bucket = S3Bucket(**s3_bucket_config)
+    data = os.urandom(11 * MiB)
+
+    def chunks():
+        for i in range(0, len(data), MiB):
+            yield data[i : i + MiB]
+
+    uploader = S3ObjectUploader(
+        [("big.bin", chunks())],
+        "prefix",
+        bucket,
+        handle_signals=False,
+        checksum="md5",
+        multipart_threshold=8 * MiB,
+        part_size=5 * MiB,
+    )
+    with patch.object(
+        S3ObjectQueue, "_put_parts", autospec=True, side_effect=S3ObjectQueue._put_parts
+    ) as put_parts:
+        result = uploader.upload()
+
+    assert result == []
+    put_parts.assert_called_once()
+    assert _body(mock_aws_s3, "prefix/big.bin") == data
+    assert uploader.checksums["big.bin"].endswith("-3")
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_objects_checksum(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test checksums are kept by object key."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3ObjectUploader(
+        [("a.txt", b"bytes")], "prefix", bucket, handle_signals=False, checksum="md5"
+    )
+
+    assert uploader.upload() == []
+    assert uploader.checksums == {"a.txt": hashlib.md5(b"bytes").hexdigest()}
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_objects_failure(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test objects whose body fails are returned."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    def broken():
+        yield b"partial"
+        raise IOError("Render failed")
+
+    result = upload_objects(
+        [("good.txt", b"good"), ("bad.txt", broken())],
+        "prefix",
+        bucket,
+        handle_signals=False,
+    )
+
+    assert result == ["bad.txt"]
+    assert _body(mock_aws_s3, "prefix/good.txt") == b"good"
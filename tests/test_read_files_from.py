@@ -0,0 +1,35 @@
+"""
+Tests for the read_files_from helper.
+"""
+
+import io
+
+from s3peat import read_files_from
+
+
+def test_read_files_from_newlines():
+    """Test reading newline separated paths."""
+    stream = io.BytesIO(b"a.txt\r\nb/c.txt\n\nd.txt")
+
+    assert list(read_files_from(stream)) == ["a.txt", "b/c.txt", "d.txt"]
+
+
+def test_read_files_from_nul():
+    """Test reading NUL separated paths, which may contain newlines."""
+    stream = io.BytesIO(b"a.txt\0odd\nname.txt\0")
+
+    assert list(read_files_from(stream)) == ["a.txt", "odd\nname.txt"]
+
+
+def test_read_files_from_small_chunks():
+    """Test paths split across chunk boundaries."""
+    stream = io.BytesIO(b"first.txt\nsecond.txt\nthird.txt\n")
+
+    result = list(read_files_from(stream, chunk_size=4))
+
+    assert result == ["first.txt", "second.txt", "third.txt"]
+
+
+def test_read_files_from_empty():
+    """Test reading an empty list."""
+    assert list(read_files_from(io.BytesIO(b""))) == []
@@ -2,6 +2,7 @@
 Tests for the S3Bucket class.
 """
 
+import botocore.config
 import botocore.exceptions
 import pytest
 
@@ -74,3 +75,14 @@ def test_get_new_no_credentials(mocker, s3_bucket_config, capsys):
     captured = capsys.readouterr()
     assert "AWS credentials not properly configured" in captured.err
     assert "--key and --secret arguments" in captured.err
+
+
+def test_get_new_with_config(mocker, s3_bucket_config):
+    """Test client configuration is passed to boto3."""
+    mock_resource = mocker.patch("boto3.resource")
+    bucket = S3Bucket(**s3_bucket_config)
+    config = botocore.config.Config(read_timeout=5)
+
+    bucket.get_new(config)
+
+    assert mock_resource.call_args[1]["config"] is config
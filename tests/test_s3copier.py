@@ -0,0 +1,123 @@
+"""
+Tests for the S3Copier and S3CopyQueue classes.
+"""
+
+import os
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+
+from s3peat import S3Bucket, S3Copier, S3CopyQueue, copy_s3_to_s3
+from s3peat.copy import _is_copied
+
+
+def _put(client, bucket, **objects):
+    for key, body in objects.items():
+        client.put_object(Bucket=bucket, Key=key, Body=body)
+
+
+def _keys(client, bucket):
+    objects = client.list_objects_v2(Bucket=bucket)
+    return sorted(o["Key"] for o in objects.get("Contents", []))
+
+
+def test_copy_queue_key(s3_bucket_config):
+    """Test mapping source keys to destination keys."""
+    bucket = S3Bucket(**s3_bucket_config)
+    queue = S3CopyQueue(bucket, "builds/1/", "current", [], bucket)
+
+    assert queue._key("builds/1/app.js") == "current/app.js"
+    assert queue._key("builds/1/css/app.css") == "current/css/app.css"
+
+
+def test_copy_queue_multipart(mock_aws_s3, s3_bucket_config):
+    """Test large objects are copied in parts."""
+    bucket = S3Bucket(**s3_bucket_config)
+    body = os.urandom(6 * 1024 * 1024)
+    mock_aws_s3.put_object(
+        Bucket="test-bucket",
+        Key="src/big.bin",
+        Body=body,
+        ContentType="application/x-tar",
+        ContentEncoding="gzip",
+        Metadata={"build": "42"},
+        Tagging="team=web",
+    )
+    obj = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"][0]
+
+    queue = S3CopyQueue(bucket, "src", "dst", [obj], bucket, part_size=5 * 1024 * 1024)
+    with patch.object(queue, "_copy_parts", wraps=queue._copy_parts) as copy_parts:
+        queue.run()
+
+    assert queue.failed == []
+    copy_parts.assert_called_once()
+    copied = mock_aws_s3.get_object(Bucket="test-bucket", Key="dst/big.bin")
+    assert copied["Body"].read() == body
+    # Everything CopyObject would have kept
+    assert copied["ContentType"] == "application/x-tar"
+    assert copied["ContentEncoding"] == "gzip"
+    assert copied["Metadata"] == {"build": "42"}
+    tags = mock_aws_s3.get_object_tagging(Bucket="test-bucket", Key="dst/big.bin")
+    assert tags["TagSet"] == [{"Key": "team", "Value": "web"}]
+
+
+def test_copy_queue_max_parts(s3_bucket_config):
+    """Test parts grow to fit the part limit, and the upload can be aborted."""
+    bucket = S3Bucket(**s3_bucket_config)
+    queue = S3CopyQueue(bucket, "src", "dst", [], bucket, part_size=5 * 1024 * 1024)
+    uploads = []
+
+    def copy_part(**kwargs):
+        uploads.append(dict(queue.uploads))
+        return {"CopyPartResult": {"ETag": "etag"}}
+
+    client = Mock()
+    client.head_object.return_value = {}
+    client.get_object_tagging.return_value = {"TagSet": []}
+    client.create_multipart_upload.return_value = {"UploadId": "id"}
+    client.upload_part_copy.side_effect = copy_part
+    with patch("s3peat.copy.MAX_PARTS", 2):
+        queue._copy_parts(client, {}, "dst/big.bin", 12 * 1024 * 1024)
+
+    ranges = [c[1]["CopySourceRange"] for c in client.upload_part_copy.call_args_list]
+    assert sorted(ranges) == ["bytes=0-6291455", "bytes=6291456-12582911"]
+    assert uploads == [{"id": "dst/big.bin"}] * 2
+    assert queue.uploads == {}
+
+
+def test_is_copied():
+    """Test copies in parts are only taken as done if they're newer."""
+    then = datetime(2026, 1, 1)
+    plain = {"Size": 5, "ETag": '"abc"', "LastModified": then}
+    parts = {"Size": 5, "ETag": '"abc-2"', "LastModified": then}
+
+    assert _is_copied(plain, (5, '"abc"', then))
+    assert not _is_copied(plain, (5, '"def"', then))
+    assert not _is_copied(plain, (6, '"abc"', then))
+    assert not _is_copied(plain, None)
+    assert _is_copied(parts, (5, '"def-1"', then + timedelta(seconds=1)))
+    assert not _is_copied(parts, (5, '"def-1"', then - timedelta(seconds=1)))
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_copy_between_buckets(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test copying a prefix, and skipping copied objects on a second run."""
+    mock_aws_s3.create_bucket(Bucket="source-bucket")
+    _put(
+        mock_aws_s3,
+        "source-bucket",
+        **{"builds/1/a.txt": b"a", "builds/1/sub/b.txt": b"b", "other.txt": b"c"},
+    )
+    source = S3Bucket("source-bucket", "key", "secret")
+    bucket = S3Bucket(**s3_bucket_config)
+
+    result = copy_s3_to_s3(
+        source, "builds/1", bucket, "current", concurrency=2, handle_signals=False
+    )
+
+    assert result == []
+    assert _keys(mock_aws_s3, "test-bucket") == ["current/a.txt", "current/sub/b.txt"]
+
+    copier = S3Copier(source, "builds/1", "current", bucket, handle_signals=False)
+    assert copier.copy() == []
+    assert copier.skipped == 2
+    assert copier.total == 0
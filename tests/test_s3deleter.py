@@ -0,0 +1,145 @@
+"""
+Tests for the S3Deleter class and mirroring with S3Uploader.
+"""
+
+import re
+from unittest.mock import patch
+
+import pytest
+
+from s3peat import S3Bucket, S3Deleter, S3Uploader
+
+
+def _put(client, *keys):
+    for key in keys:
+        client.put_object(Bucket="test-bucket", Key=key, Body=b"x")
+
+
+def _keys(client):
+    objects = client.list_objects_v2(Bucket="test-bucket")
+    return sorted(o["Key"] for o in objects.get("Contents", []))
+
+
+def test_s3deleter_deletes_stale_keys(mock_aws_s3, s3_bucket_config):
+    """Test only keys under the prefix and not kept are deleted."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, "prefix/keep.txt", "prefix/stale.txt", "other/stale.txt")
+
+    deleter = S3Deleter("prefix/", {"prefix/keep.txt"}, bucket)
+    deleter.run()
+
+    assert deleter.error is None
+    assert deleter.failed == []
+    assert deleter.deleted == 1
+    assert _keys(mock_aws_s3) == ["other/stale.txt", "prefix/keep.txt"]
+
+
+def test_s3deleter_batches(mock_aws_s3, s3_bucket_config):
+    """Test deletes are sent in batches."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, *["prefix/{}.txt".format(i) for i in range(5)])
+
+    deleter = S3Deleter("prefix/", set(), bucket, batch_size=2)
+    with patch.object(deleter, "_delete_batch", wraps=deleter._delete_batch) as delete:
+        deleter.run()
+
+    assert delete.call_count == 3
+    assert deleter.deleted == 5
+    assert _keys(mock_aws_s3) == []
+
+
+def test_s3deleter_max_delete(mock_aws_s3, s3_bucket_config):
+    """Test nothing is deleted when over the limit."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, "prefix/a.txt", "prefix/b.txt")
+
+    deleter = S3Deleter("prefix/", set(), bucket, max_delete=1)
+    deleter.run()
+
+    assert "Refusing to delete 2 keys" in deleter.error
+    assert deleter.deleted == 0
+    assert len(_keys(mock_aws_s3)) == 2
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_delete(mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test uploading with delete mirrors the directory."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, "prefix/file1.txt", "prefix/gone.txt", "prefix/sub/gone.txt")
+
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        concurrency=2,
+        handle_signals=False,
+        delete=True,
+    )
+    result = uploader.upload()
+
+    assert result == []
+    assert uploader.deleter.deleted == 2
+    assert _keys(mock_aws_s3) == [
+        "prefix/file1.txt",
+        "prefix/file2.txt",
+        "prefix/subdir/file3.txt",
+        "prefix/subdir/nested/file4.txt",
+    ]
+
+
+def test_upload_delete_files_from(s3_bucket_config, temp_directory):
+    """Test delete can't be used with a file list."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(temp_directory, "prefix", bucket, files_from="-", delete=True)
+
+    with pytest.raises(ValueError):
+        uploader.upload()
+
+
+def test_upload_delete_key_template(s3_bucket_config, temp_directory):
+    """Test delete can't be used with a key template."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory, "prefix", bucket, delete=True, key_template="{hash}/{path}"
+    )
+
+    with pytest.raises(ValueError):
+        uploader.upload()
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_delete_excluded(
+    mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory
+):
+    """Test keys for excluded paths are left alone, even with no file."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(
+        mock_aws_s3, "prefix/subdir/file3.txt", "prefix/subdir/gone.txt", "prefix/gone"
+    )
+
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        exclude=[re.compile("subdir")],
+        handle_signals=False,
+        delete=True,
+    )
+    assert uploader.upload() == []
+
+    assert uploader.deleter.deleted == 1
+    assert _keys(mock_aws_s3) == [
+        "prefix/file1.txt",
+        "prefix/file2.txt",
+        "prefix/subdir/file3.txt",
+        "prefix/subdir/gone.txt",
+    ]
+
+
+def test_watch_delete(s3_bucket_config, temp_directory):
+    """Test delete can't be used while watching."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(temp_directory, "prefix", bucket, delete=True)
+
+    with pytest.raises(ValueError):
+        uploader.watch()
@@ -0,0 +1,127 @@
+"""
+Tests for the S3Downloader and S3DownloadQueue classes.
+"""
+
+import os
+from unittest.mock import patch
+
+from s3peat import S3Bucket, S3Downloader, S3DownloadQueue, sync_from_s3
+from s3peat.download import list_prefix
+
+
+def _put(client, **objects):
+    for key, body in objects.items():
+        client.put_object(Bucket="test-bucket", Key=key, Body=body)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_list_prefix_parallel(mock_aws_s3):
+    """Test listing a prefix in parallel finds everything."""
+    _put(
+        mock_aws_s3,
+        **{"p/a": b"1", "p/b/c": b"2", "p/b/d/e": b"3", "p/f/g": b"4", "q/h": b"5"},
+    )
+
+    serial = list_prefix(mock_aws_s3, "test-bucket", "p/")
+    parallel = list_prefix(mock_aws_s3, "test-bucket", "p/", concurrency=4)
+
+    expected = ["p/a", "p/b/c", "p/b/d/e", "p/f/g"]
+    assert sorted(o["Key"] for o in serial) == expected
+    assert sorted(o["Key"] for o in parallel) == expected
+
+
+def test_download_queue_filename(s3_bucket_config):
+    """Test mapping keys back to filenames."""
+    bucket = S3Bucket(**s3_bucket_config)
+    queue = S3DownloadQueue("my-prefix", [], bucket, "/base")
+
+    assert queue._filename("my-prefix/file.txt") == "/base/file.txt"
+    assert queue._filename("my-prefix/dir/file.txt") == "/base/dir/file.txt"
+
+
+def test_download_queue_ranged(mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test large objects are downloaded in ranged parts."""
+    bucket = S3Bucket(**s3_bucket_config)
+    body = os.urandom(10000)
+    _put(mock_aws_s3, **{"prefix/big.bin": body})
+    obj = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"][0]
+
+    queue = S3DownloadQueue(
+        "prefix", [obj], bucket, str(tmp_path), part_size=1024, part_concurrency=3
+    )
+    with patch.object(queue, "_get_range", wraps=queue._get_range) as get_range:
+        queue.run()
+
+    assert queue.failed == []
+    assert get_range.call_count == 10
+    assert _read(tmp_path / "big.bin") == body
+
+
+def test_download_queue_replaced(mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test an object replaced after listing fails, leaving no file."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, **{"prefix/big.bin": os.urandom(10000)})
+    obj = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"][0]
+    _put(mock_aws_s3, **{"prefix/big.bin": os.urandom(10000)})
+
+    queue = S3DownloadQueue("prefix", [obj], bucket, str(tmp_path), part_size=1024)
+    queue.run()
+
+    assert queue.failed == ["prefix/big.bin"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_queue_short(mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test getting fewer bytes than listed fails, leaving no file."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, **{"prefix/small.bin": b"12345"})
+    obj = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"][0]
+    obj = dict(obj, Size=10)
+    del obj["ETag"]
+
+    queue = S3DownloadQueue("prefix", [obj], bucket, str(tmp_path))
+    queue.run()
+
+    assert queue.failed == ["prefix/small.bin"]
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_queue_outside_directory(mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test keys can't be written outside the directory."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(mock_aws_s3, **{"prefix/../../evil.txt": b"evil"})
+    obj = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"][0]
+
+    queue = S3DownloadQueue("prefix", [obj], bucket, str(tmp_path / "a" / "b"))
+    queue.run()
+
+    assert queue.failed == ["prefix/../../evil.txt"]
+    assert not (tmp_path / "evil.txt").exists()
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_download(mock_sleep, mock_aws_s3, s3_bucket_config, tmp_path):
+    """Test downloading a prefix, and skipping files on a second run."""
+    bucket = S3Bucket(**s3_bucket_config)
+    _put(
+        mock_aws_s3,
+        **{"prefix/a.txt": b"a", "prefix/sub/b.txt": b"b", "other/c.txt": b"c"},
+    )
+
+    result = sync_from_s3(
+        str(tmp_path), "prefix", bucket, concurrency=2, handle_signals=False
+    )
+
+    assert result == []
+    assert _read(tmp_path / "a.txt") == b"a"
+    assert _read(tmp_path / "sub" / "b.txt") == b"b"
+    assert not (tmp_path / "c.txt").exists()
+
+    downloader = S3Downloader(str(tmp_path), "prefix", bucket, handle_signals=False)
+    assert downloader.download() == []
+    assert downloader.skipped == 2
+    assert downloader.total == 0
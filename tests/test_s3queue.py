@@ -2,7 +2,11 @@
 Tests for the S3Queue class.
 """
 
+import hashlib
 import os
+from unittest.mock import patch
+
+import pytest
 
 from s3peat import S3Bucket, S3Queue
 
@@ -96,6 +100,66 @@ def test_s3queue_key_generation_windows_paths(s3_bucket_config):
     assert queue._key("dir\\file.txt") == "my-prefix/dir\\file.txt"
 
 
+def test_s3queue_key_cached_per_directory(s3_bucket_config):
+    """Test only the last directory's key prefix is kept."""
+    bucket = S3Bucket(**s3_bucket_config)
+    queue = S3Queue(
+        prefix="my-prefix", filenames=[], bucket=bucket, strip_path="/base/path"
+    )
+
+    assert queue._key("/base/path/dir/a.txt") == "my-prefix/dir/a.txt"
+    with patch.object(queue, "_relative") as relative:
+        assert queue._key("/base/path/dir/b.txt") == "my-prefix/dir/b.txt"
+    relative.assert_not_called()
+
+    assert queue._key("/base/path/c.txt") == "my-prefix/c.txt"
+    assert queue._key_prefix == ("/base/path/", "my-prefix/")
+    assert queue._key("/base/path/dir/d.txt") == "my-prefix/dir/d.txt"
+
+
+def test_s3queue_key_strip_path_into_basename(s3_bucket_config):
+    """Test a strip_path ending partway through a basename still works."""
+    bucket = S3Bucket(**s3_bucket_config)
+    queue = S3Queue(
+        prefix="my-prefix", filenames=[], bucket=bucket, strip_path="/base/pa"
+    )
+
+    assert queue._key("/base/path.txt") == "my-prefix/th.txt"
+    assert queue._key("/base/other.txt") == "my-prefix/base/other.txt"
+
+
+def test_s3queue_key_template(s3_bucket_config, tmp_path):
+    """Test composing keys from a template."""
+    bucket = S3Bucket(**s3_bucket_config)
+    filename = tmp_path / "dir" / "file.txt"
+    filename.parent.mkdir()
+    filename.write_text("content")
+    # 2024-03-05 12:00:00 UTC
+    os.utime(filename, (1709640000, 1709640000))
+
+    queue = S3Queue(
+        prefix="my-prefix",
+        filenames=[],
+        bucket=bucket,
+        strip_path=str(tmp_path),
+        key_template="{prefix}/{hash:.4}/{mtime:%Y/%m/%d}/{dirname}/{basename}",
+    )
+
+    digest = hashlib.md5(b"dir/file.txt").hexdigest()[:4]
+    expected = "my-prefix/{}/2024/03/05/dir/file.txt".format(digest)
+    assert queue._key(str(filename)) == expected
+
+
+def test_s3queue_key_template_unknown_field(s3_bucket_config):
+    """Test templates with unknown fields are refused."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    with pytest.raises(ValueError) as exc_info:
+        S3Queue("prefix", [], bucket, key_template="{prefix}/{date}/{path}")
+
+    assert "'date'" in str(exc_info.value)
+
+
 def test_s3queue_successful_upload(
     mock_aws_s3, s3_bucket_config, temp_directory, mock_counter
 ):
@@ -166,6 +230,26 @@ def test_s3queue_successful_upload_private_bucket(
     assert len(objects["Contents"]) == 1
 
 
+def test_s3queue_upload_single_request(s3_bucket_config, temp_directory):
+    """Test a small file is uploaded with its ACL in one client request."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+
+    with patch("boto3.resource") as mock_resource:
+        mock_bucket = mock_resource.return_value.Bucket.return_value
+        queue = S3Queue("prefix", [test_file], bucket)
+        queue.run()
+
+    client = mock_bucket.meta.client
+    client.put_object.assert_called_once()
+    kwargs = client.put_object.call_args[1]
+    assert kwargs["Bucket"] == "test-bucket"
+    assert kwargs["Key"].endswith("/file1.txt")
+    assert kwargs["ACL"] == "public-read"
+    mock_bucket.put_object.assert_not_called()
+    mock_bucket.Object.assert_not_called()
+
+
 def test_s3queue_upload_failure(
     mock_aws_s3, s3_bucket_config, temp_directory, mock_counter
 ):
@@ -184,7 +268,7 @@ def test_s3queue_upload_failure(
         mock_resource.return_value = mock_s3_resource
         mock_s3_resource.Bucket.return_value = mock_bucket
         mock_s3_resource.meta.client.head_bucket.return_value = None
-        mock_bucket.put_object.side_effect = Exception("Upload failed")
+        mock_bucket.meta.client.put_object.side_effect = Exception("Upload failed")
 
         queue = S3Queue(
             prefix="test-prefix",
@@ -278,7 +362,7 @@ def test_s3queue_mixed_success_failure(
             if "file2.txt" in key:
                 raise Exception("Upload failed")
 
-        mock_bucket.put_object.side_effect = side_effect
+        mock_bucket.meta.client.put_object.side_effect = side_effect
 
         queue = S3Queue(
             prefix="test-prefix",
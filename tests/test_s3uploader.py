@@ -2,6 +2,8 @@
 Tests for the S3Uploader class.
 """
 
+import io
+import os
 import re
 import signal
 import sys
@@ -10,6 +12,7 @@ from unittest.mock import Mock, patch
 import pytest
 
 from s3peat import S3Bucket, S3Uploader
+from s3peat.filelist import FileList
 
 
 def test_s3uploader_initialization(s3_bucket_config, temp_directory):
@@ -133,8 +136,8 @@ def test_get_filenames_split(temp_directory, s3_bucket_config):
 
     assert len(filename_groups) == 2  # Should split into 2 groups
 
-    # All groups should be lists
-    assert all(isinstance(group, list) for group in filename_groups)
+    # All groups should be compact file lists
+    assert all(isinstance(group, FileList) for group in filename_groups)
 
     # Total files should be distributed across groups
     total_files = sum(len(group) for group in filename_groups)
@@ -270,9 +273,9 @@ def test_stop_method(s3_bucket_config, temp_directory, capsys):
     uploader = S3Uploader(temp_directory, "prefix", bucket)
 
     # Create mock queues with filenames
-    mock_queue1 = Mock()
+    mock_queue1 = Mock(current=None, failed=[])
     mock_queue1.filenames = ["file1.txt", "file2.txt"]
-    mock_queue2 = Mock()
+    mock_queue2 = Mock(current=None, failed=[])
     mock_queue2.filenames = ["file3.txt"]
 
     uploader.queues = [mock_queue1, mock_queue2]
@@ -323,5 +326,121 @@ def test_upload_with_signal_handling(mock_aws_s3, s3_bucket_config, temp_directo
     ):  # Mock sleep to speed up test
         uploader.upload()
 
-        # Should set up signal handler
-        mock_signal.assert_called_once_with(signal.SIGINT, uploader.stop)
+        # Should set up signal handlers for Ctrl+C and kill
+        mock_signal.assert_any_call(signal.SIGINT, uploader.stop)
+        mock_signal.assert_any_call(signal.SIGTERM, uploader.stop)
+
+
+def test_get_filenames_files_from(temp_directory, s3_bucket_config, tmp_path):
+    """Test getting filenames from a manifest instead of walking."""
+    bucket = S3Bucket(**s3_bucket_config)
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("file1.txt\nsubdir/file3.txt\n\n")
+
+    uploader = S3Uploader(temp_directory, "prefix", bucket, files_from=str(manifest))
+
+    filenames = uploader.get_filenames()
+
+    assert uploader.total == 2
+    assert list(filenames) == [
+        os.path.join(temp_directory, "file1.txt"),
+        os.path.join(temp_directory, "subdir/file3.txt"),
+    ]
+
+
+def test_get_filenames_files_from_filtered(temp_directory, s3_bucket_config):
+    """Test include and exclude still apply to a manifest."""
+    bucket = S3Bucket(**s3_bucket_config)
+    manifest = io.BytesIO(b"file1.txt\0file2.txt\0subdir/file3.txt\0")
+
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        exclude=[re.compile(r"file2")],
+        files_from=manifest,
+    )
+
+    filenames = uploader.get_filenames()
+
+    assert uploader.total == 2
+    assert all("file2" not in f for f in filenames)
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_files_from(mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test streaming uploads from a manifest."""
+    bucket = S3Bucket(**s3_bucket_config)
+    manifest = io.BytesIO(b"file1.txt\nsubdir/nested/file4.txt\n")
+
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        concurrency=3,
+        handle_signals=False,
+        files_from=manifest,
+    )
+
+    result = uploader.upload()
+
+    assert result == []
+    assert uploader.total == 2
+    assert uploader.count == 2
+    assert len(uploader.queues) == 3
+
+    objects = mock_aws_s3.list_objects_v2(Bucket="test-bucket")
+    keys = sorted(o["Key"] for o in objects["Contents"])
+    assert keys == ["prefix/file1.txt", "prefix/subdir/nested/file4.txt"]
+
+
+def test_lanes(s3_bucket_config, temp_directory):
+    """Test large files are split between the queues of their own lane."""
+    big = os.path.join(temp_directory, "big.bin")
+    with open(big, "wb") as f:
+        f.write(b"x" * 100)
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        concurrency=3,
+        large_concurrency=2,
+        large_file_size=50,
+    )
+
+    groups = uploader._lanes(uploader.get_filenames())
+
+    assert len(groups) == 5
+    assert sorted(len(group) for group in groups[:3]) == [1, 1, 2]
+    assert [f for group in groups[3:] for f in group] == [big]
+    assert uploader._new_queue([]).read_size == 50
+
+
+@pytest.mark.parametrize("spread_prefixes", [False, True])
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_lanes(
+    mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory, spread_prefixes
+):
+    """Test uploading with a lane for large files."""
+    with open(os.path.join(temp_directory, "big.bin"), "wb") as f:
+        f.write(b"x" * 100)
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        concurrency=2,
+        handle_signals=False,
+        spread_prefixes=spread_prefixes,
+        large_concurrency=1,
+        large_file_size=50,
+    )
+
+    assert uploader.upload() == []
+
+    assert uploader.count == 5
+    assert len(uploader.queues) == 3
+    assert uploader.queues[0].read_size == 50
+    body = mock_aws_s3.get_object(Bucket="test-bucket", Key="prefix/big.bin")["Body"]
+    assert body.read() == b"x" * 100
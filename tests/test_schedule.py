@@ -0,0 +1,187 @@
+"""
+Tests for prefix-aware scheduling.
+"""
+
+import os
+from queue import Full, Queue
+from unittest.mock import Mock, patch
+
+import botocore.exceptions
+import pytest
+
+from s3peat import S3Bucket, S3Queue, S3Uploader
+from s3peat.schedule import PrefixQueue, is_throttle, top_prefix
+
+
+def _slow_down():
+    return botocore.exceptions.ClientError(
+        {"Error": {"Code": "SlowDown"}, "ResponseMetadata": {"HTTPStatusCode": 503}},
+        "PutObject",
+    )
+
+
+def _prefix(item):
+    return item.split("/")[0]
+
+
+def test_prefix_queue_round_robin():
+    """Test items are taken alternating between prefixes."""
+    stream = PrefixQueue(_prefix)
+    for item in ["a/1", "a/2", "a/3", "b/1", "c/1", "c/2"]:
+        stream.put(item)
+
+    taken = [stream.get() for i in range(6)]
+
+    assert taken == ["a/1", "b/1", "c/1", "a/2", "c/2", "a/3"]
+    assert stream.empty()
+
+
+def test_prefix_queue_sentinels_last():
+    """Test None is only handed out once everything else is gone."""
+    stream = PrefixQueue(_prefix)
+    stream.put("a/1")
+    stream.put(None)
+    stream.put("b/1")
+
+    assert [stream.get() for i in range(3)] == ["a/1", "b/1", None]
+
+
+def test_prefix_queue_throttled():
+    """Test a throttled prefix is skipped while it backs off."""
+    stream = PrefixQueue(_prefix)
+    for item in ["a/1", "a/2", "b/1", "b/2"]:
+        stream.put(item)
+
+    item = stream.get()
+    assert item == "a/1"
+    assert stream.throttled(item)
+    assert stream.delay("a/2") > 0
+
+    # Everything in "b" comes first, then "a" once nothing else is left
+    assert [stream.get() for i in range(4)] == ["b/1", "b/2", "a/2", "a/1"]
+
+
+def test_prefix_queue_maxsize():
+    """Test puts block when full across prefixes, but throttled items don't."""
+    stream = PrefixQueue(_prefix, maxsize=2)
+    stream.put("a/1")
+    stream.put("b/1")
+
+    with pytest.raises(Full):
+        stream.put("c/1", timeout=0.01)
+
+    item = stream.get()
+    stream.put("c/1")
+    assert stream.throttled(item)
+    assert stream.qsize() == 3
+    assert stream.unfinished_tasks == 4
+
+
+def test_prefix_queue_max_retries():
+    """Test items are given up on after being throttled too often."""
+    stream = PrefixQueue(_prefix, max_retries=2)
+
+    assert stream.throttled("a/1")
+    assert stream.throttled("a/1")
+    assert not stream.throttled("a/1")
+    assert stream.qsize() == 2
+
+
+def test_prefix_queue_succeeded():
+    """Test successes ease the backoff until it's gone."""
+    stream = PrefixQueue(_prefix)
+    stream.throttled("a/1")
+    stream.throttled("a/1")
+    assert stream._backoff["a"][0] == 1.0
+
+    stream.succeeded("a/1")
+    assert stream._backoff["a"][0] == 0.5
+    stream.succeeded("a/1")
+    assert "a" not in stream._backoff
+
+
+def test_prefix_queue_shared_backoff():
+    """Test queues sharing a backoff dict back off the same prefixes."""
+    backoff = {}
+    small = PrefixQueue(_prefix, backoff=backoff)
+    large = PrefixQueue(_prefix, backoff=backoff)
+
+    small.throttled("a/1")
+
+    assert large.delay("a/2") > 0
+    large.succeeded("a/2")
+    assert "a" not in backoff
+
+
+def test_top_prefix():
+    """Test finding the top level directory of a key."""
+    assert top_prefix("prefix/dir/file.txt", "prefix") == "dir"
+    assert top_prefix("prefix/file.txt", "prefix") == ""
+    assert top_prefix("ab12/prefix/file.txt", "prefix") == "ab12"
+    assert top_prefix("dir/sub/file.txt") == "dir"
+
+
+def test_is_throttle():
+    """Test recognizing throttling errors."""
+    assert is_throttle(_slow_down())
+    assert not is_throttle(
+        botocore.exceptions.ClientError(
+            {"Error": {"Code": "AccessDenied"}}, "PutObject"
+        )
+    )
+    assert not is_throttle(ValueError())
+
+
+def test_s3queue_requeues_throttled(s3_bucket_config, temp_directory):
+    """Test throttled uploads are put back on a PrefixQueue."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+    stream = PrefixQueue(_prefix)
+
+    with patch("boto3.resource") as mock_resource:
+        mock_bucket = mock_resource.return_value.Bucket.return_value
+        mock_bucket.meta.client.put_object.side_effect = [_slow_down(), Mock()]
+        queue = S3Queue("prefix", stream, bucket, counter=Mock())
+        # Don't wait out the backoff
+        with patch("s3peat.schedule.MIN_BACKOFF", 0):
+            queue._upload(test_file, mock_bucket)
+            assert stream.qsize() == 1
+            queue._upload(stream.get(), mock_bucket)
+
+    assert queue.failed == []
+    queue.counter.assert_called_once_with()
+
+
+def test_s3queue_throttled_without_scheduler(s3_bucket_config, temp_directory):
+    """Test throttled uploads fail as usual on a plain stream."""
+    bucket = S3Bucket(**s3_bucket_config)
+    test_file = os.path.join(temp_directory, "file1.txt")
+
+    with patch("boto3.resource") as mock_resource:
+        mock_bucket = mock_resource.return_value.Bucket.return_value
+        mock_bucket.meta.client.put_object.side_effect = _slow_down()
+        queue = S3Queue("prefix", Queue(), bucket)
+        queue._upload(test_file, mock_bucket)
+
+    assert queue.failed == [test_file]
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_spread_prefixes(
+    mock_sleep, mock_aws_s3, s3_bucket_config, temp_directory
+):
+    """Test uploading with prefix scheduling."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3Uploader(
+        temp_directory,
+        "prefix",
+        bucket,
+        concurrency=2,
+        handle_signals=False,
+        spread_prefixes=True,
+    )
+
+    assert uploader.upload() == []
+    assert uploader.count == 4
+    objects = mock_aws_s3.list_objects_v2(Bucket="test-bucket")["Contents"]
+    assert len(objects) == 4
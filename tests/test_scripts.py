@@ -2,11 +2,12 @@
 Tests for the CLI script (Main class).
 """
 
+import os
 from unittest.mock import Mock, patch
 
 import pytest
 
-from s3peat.scripts import Main
+from s3peat.scripts import Main, _address
 
 
 def test_main_help():
@@ -249,6 +250,57 @@ def test_main_dry_run_connection_error(temp_directory, mocker, capsys):
     assert "Error connecting to S3 bucket" in captured.err
 
 
+def test_main_dry_run_download(mock_aws_s3, tmp_path, capsys):
+    """Test a dry run with --download lists the keys to download."""
+    for key in ("backups/a.txt", "backups/sub/b.txt", "other.txt"):
+        mock_aws_s3.put_object(Bucket="test-bucket", Key=key, Body=b"data")
+    argv = [
+        "--bucket",
+        "test-bucket",
+        "--prefix",
+        "backups",
+        "--download",
+        "--dry-run",
+        "-vv",
+        str(tmp_path),
+    ]
+
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(argv)
+    assert exc_info.value.code == 0
+
+    out = capsys.readouterr().out
+    assert os.path.join(str(tmp_path), "sub", "b.txt") in out
+    assert "2 files found" in out
+
+
+def test_main_dry_run_fan_out(temp_directory, mock_aws_s3, capsys):
+    """Test a dry run with --fan-out checks every bucket."""
+    argv = [
+        "--bucket",
+        "test-bucket",
+        "--fan-out",
+        "missing-bucket",
+        "--dry-run",
+        temp_directory,
+    ]
+
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(argv)
+    assert exc_info.value.code == 1
+
+    assert "Error connecting to S3 bucket 'missing-bucket'" in capsys.readouterr().err
+
+
+def test_main_download_with_checksum(capsys):
+    """Test --download can't be combined with --checksum."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "b", "--download", "--checksum", "md5", "d"])
+
+    assert exc_info.value.code == 1
+    assert "--download can't be used" in capsys.readouterr().err
+
+
 def test_main_with_include_exclude(temp_directory, mock_aws_s3):
     """Test CLI with include and exclude filters."""
     argv = [
@@ -412,3 +464,175 @@ def test_main_dry_run_verbose_with_connection(temp_directory, mock_aws_s3, capsy
 
     captured = capsys.readouterr()
     assert "Connected to S3 bucket 'test-bucket' OK" in captured.out
+
+
+def test_main_dry_run_files_from(temp_directory, mock_aws_s3, tmp_path, capsys):
+    """Test dry run with a list of files."""
+    manifest = tmp_path / "manifest.txt"
+    manifest.write_text("file1.txt\nfile2.txt\n")
+
+    argv = [
+        "--bucket",
+        "test-bucket",
+        "--files-from",
+        str(manifest),
+        "--dry-run",
+        temp_directory,
+    ]
+
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(argv)
+    assert exc_info.value.code == 0
+
+    captured = capsys.readouterr()
+    assert "2 files found" in captured.out
+
+
+@patch("s3peat.scripts.s3peat.S3Downloader")
+@patch("s3peat.scripts.s3peat.S3Bucket")
+def test_main_download(mock_bucket_class, mock_downloader_class, tmp_path):
+    """Test downloading through CLI."""
+    mock_downloader = Mock()
+    mock_downloader.download.return_value = []
+    mock_downloader_class.return_value = mock_downloader
+
+    argv = ["--bucket", "test-bucket", "--download", str(tmp_path)]
+
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(argv)
+    assert exc_info.value.code == 0
+
+    mock_downloader.download.assert_called_once()
+
+
+@patch("s3peat.scripts.s3peat.S3Copier")
+@patch("s3peat.scripts.s3peat.S3Bucket")
+def test_main_copy_from(mock_bucket_class, mock_copier_class):
+    """Test copying between buckets through CLI."""
+    mock_copier = Mock()
+    mock_copier.copy.return_value = []
+    mock_copier_class.return_value = mock_copier
+
+    argv = ["--bucket", "test-bucket", "--copy-from", "source-bucket/builds/1"]
+
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(argv)
+    assert exc_info.value.code == 0
+
+    mock_bucket_class.assert_any_call("source-bucket", None, None)
+    assert mock_copier_class.call_args[0][1] == "builds/1"
+    mock_copier.copy.assert_called_once()
+
+
+def test_main_missing_directory(capsys):
+    """Test CLI without a directory when not copying."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket"])
+
+    assert exc_info.value.code == 1
+    assert "directory is required" in capsys.readouterr().err
+
+
+def test_main_key_template_with_delete(capsys):
+    """Test --key-template can't be combined with --delete."""
+    argv = ["--bucket", "test-bucket", "--key-template", "{path}", "--delete", "dir"]
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(argv)
+
+    assert exc_info.value.code == 1
+    assert "--key-template can't be used" in capsys.readouterr().err
+
+
+def test_main_invalid_hedge(capsys):
+    """Test --hedge must be a percentile."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket", "--hedge", "150", "dir"])
+
+    assert exc_info.value.code == 1
+    assert "--hedge must be a percentile" in capsys.readouterr().err
+
+
+def test_main_checkpoint_with_download(capsys):
+    """Test --checkpoint can't be combined with --download."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(
+            ["--bucket", "test-bucket", "--checkpoint", "left.txt", "--download", "d"]
+        )
+
+    assert exc_info.value.code == 1
+    assert "--checkpoint can't be used" in capsys.readouterr().err
+
+
+def test_main_snapshot_with_files_from(capsys):
+    """Test --snapshot can't be combined with --files-from."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(
+            ["--bucket", "test-bucket", "--snapshot", "snap", "--files-from", "-", "d"]
+        )
+
+    assert exc_info.value.code == 1
+    assert "--snapshot can't be used" in capsys.readouterr().err
+
+
+def test_main_listing_cache_with_inventory(capsys):
+    """Test --listing-cache can't be combined with --inventory."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(
+            ["--bucket", "test-bucket", "--listing-cache", "c", "--inventory", "m", "d"]
+        )
+
+    assert exc_info.value.code == 1
+    assert "--listing-cache can't be used" in capsys.readouterr().err
+
+
+def test_main_fan_out_with_delete(capsys):
+    """Test --fan-out can't be combined with --delete."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket", "--fan-out", "other", "--delete", "d"])
+
+    assert exc_info.value.code == 1
+    assert "--fan-out can't be used" in capsys.readouterr().err
+
+
+def test_main_archive_with_watch(capsys):
+    """Test --archive can't be combined with --watch."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket", "--archive", "--watch", "a.tar"])
+
+    assert exc_info.value.code == 1
+    assert "--archive can't be used" in capsys.readouterr().err
+
+
+def test_main_stream_with_directory(capsys):
+    """Test --stream can't be combined with a directory."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket", "--stream", "dump.sql", "d"])
+
+    assert exc_info.value.code == 1
+    assert "--stream can't be used" in capsys.readouterr().err
+
+
+def test_main_daemon_with_directory(capsys):
+    """Test --daemon can't be combined with a directory."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket", "--daemon", ":8935", "d"])
+
+    assert exc_info.value.code == 1
+    assert "--daemon can't be used" in capsys.readouterr().err
+
+
+def test_main_listen_any_without_daemon(capsys):
+    """Test --listen-any needs --daemon."""
+    with pytest.raises(SystemExit) as exc_info:
+        Main().start(["--bucket", "test-bucket", "--listen-any", "d"])
+
+    assert exc_info.value.code == 1
+    assert "--listen-any can only be used" in capsys.readouterr().err
+
+
+def test_daemon_address():
+    """Test --daemon takes a host and port, or a Unix socket path."""
+    assert _address("0.0.0.0:8935") == ("0.0.0.0", 8935)
+    assert _address(":8935") == ("127.0.0.1", 8935)
+    assert _address("/run/s3peat.sock") == "/run/s3peat.sock"
+    assert _address("s3peat.sock") == "s3peat.sock"
@@ -0,0 +1,102 @@
+"""
+Tests for walking directories with a TreeSnapshot.
+"""
+
+import os
+import time
+
+from s3peat import S3Uploader
+from s3peat.snapshot import TreeSnapshot
+
+
+def _make_tree(root, files):
+    for name in files:
+        path = os.path.join(root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(name)
+
+
+def _age(root, seconds=60):
+    """Set every directory's modified time `seconds` into the past."""
+    past = time.time() - seconds
+    for path, dirs, files in os.walk(root):
+        os.utime(path, (past, past))
+
+
+def _os_walk(root):
+    return [os.path.join(p, f) for p, dirs, files in os.walk(root) for f in files]
+
+
+def test_walk_matches_os_walk(tmp_path):
+    """Test walking finds the same files in the same order as os.walk."""
+    root = str(tmp_path / "data")
+    _make_tree(root, ["a.txt", "sub/b.txt", "sub/deep/c.txt", "other/d.txt"])
+    os.symlink(os.path.join(root, "sub"), os.path.join(root, "link"))
+
+    snapshot = TreeSnapshot(str(tmp_path / "snapshot"))
+
+    assert list(snapshot.walk(root)) == _os_walk(root)
+    assert snapshot.scanned == 4
+    assert snapshot.reused == 0
+
+
+def test_walk_reuses_unchanged_directories(tmp_path):
+    """Test a saved snapshot skips listing directories that haven't changed."""
+    root = str(tmp_path / "data")
+    filename = str(tmp_path / "snapshot")
+    _make_tree(root, ["a.txt", "sub/b.txt", "other/c.txt"])
+    _age(root)
+
+    snapshot = TreeSnapshot(filename)
+    first = list(snapshot.walk(root))
+    snapshot.save()
+
+    # New files change only their own directory
+    _make_tree(root, ["other/new.txt"])
+    snapshot = TreeSnapshot(filename)
+    assert snapshot.load()
+    second = list(snapshot.walk(root))
+
+    assert sorted(second) == sorted(first + [os.path.join(root, "other", "new.txt")])
+    assert snapshot.scanned == 1
+    assert snapshot.reused == 2
+
+
+def test_walk_lists_recently_changed_directories(tmp_path):
+    """Test directories changed just before the last walk are listed again."""
+    root = str(tmp_path / "data")
+    filename = str(tmp_path / "snapshot")
+    _make_tree(root, ["a.txt"])
+
+    snapshot = TreeSnapshot(filename)
+    list(snapshot.walk(root))
+    snapshot.save()
+
+    snapshot = TreeSnapshot(filename)
+    snapshot.load()
+    list(snapshot.walk(root))
+
+    assert snapshot.scanned == 1
+    assert snapshot.reused == 0
+
+
+def test_load_ignores_bad_snapshots(tmp_path):
+    """Test missing or corrupt snapshots aren't used."""
+    filename = tmp_path / "snapshot"
+    assert not TreeSnapshot(str(filename)).load()
+
+    filename.write_text("{not json")
+    assert not TreeSnapshot(str(filename)).load()
+
+
+def test_uploader_walks_with_snapshot(tmp_path, s3_bucket_config):
+    """Test the uploader saves a snapshot as it finds files."""
+    root = str(tmp_path / "data")
+    filename = str(tmp_path / "snapshot")
+    _make_tree(root, ["a.txt", "sub/b.txt"])
+
+    uploader = S3Uploader(root, "prefix", None, snapshot=filename)
+
+    assert sorted(uploader.get_filenames()) == sorted(_os_walk(root))
+    assert TreeSnapshot(filename).load()
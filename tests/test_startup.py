@@ -0,0 +1,68 @@
+"""
+Tests that the command line starts quickly, without importing boto.
+"""
+
+import os
+import subprocess
+import sys
+import time
+
+# Most seconds `s3peat --version` may take over starting Python itself
+STARTUP_BUDGET = 0.15
+
+# Packages too slow to import until we need a connection
+HEAVY = ("boto3", "botocore", "s3transfer", "urllib3")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _python(code):
+    """Run `code` in a new interpreter, returning its stdout and wall time."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True
+    )
+    elapsed = time.perf_counter() - start
+    assert result.returncode == 0, result.stderr
+    return result.stdout, elapsed
+
+
+def _main(*args):
+    """Return code running the s3peat command with `args`."""
+    return (
+        "import sys\n"
+        "sys.argv = ['s3peat'] + {!r}\n"
+        "from s3peat.scripts import Main\n"
+        "try:\n"
+        "    Main.console_script()\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in {!r}))\n"
+    ).format(list(args), HEAVY)
+
+
+def test_import_skips_boto():
+    """Test importing s3peat doesn't import boto."""
+    out = _python(
+        "import sys, s3peat, s3peat.scripts\n"
+        "s3peat.S3Copier, s3peat.sync_from_s3, s3peat.upload_objects\n"
+        "print(sorted(m for m in sys.modules if m.split('.')[0] in {!r}))".format(HEAVY)
+    )[0]
+
+    assert out.strip() == "[]"
+
+
+def test_version_and_help_skip_boto():
+    """Test --version and --help don't import boto."""
+    for arg in ("--version", "--help"):
+        out = _python(_main(arg))[0]
+        assert out.strip().splitlines()[-1] == "[]", arg
+
+
+def test_version_startup_budget():
+    """Test --version stays within the startup budget."""
+    # Take the best of a few runs, so a busy machine doesn't fail this
+    baseline = min(_python("pass")[1] for i in range(3))
+    elapsed = min(_python(_main("--version"))[1] for i in range(3))
+
+    assert elapsed - baseline < STARTUP_BUDGET
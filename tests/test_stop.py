@@ -0,0 +1,218 @@
+"""
+Tests for stopping an upload part way, and writing a checkpoint.
+"""
+
+import os
+import threading
+from queue import Queue
+from unittest.mock import Mock, patch
+
+import pytest
+
+from s3peat import S3Bucket, S3Uploader
+from s3peat.schedule import PrefixQueue
+
+
+def make_uploader(s3_bucket_config, directory, **kwargs):
+    bucket = S3Bucket(**s3_bucket_config)
+    return S3Uploader(directory, "prefix", bucket, handle_signals=False, **kwargs)
+
+
+def read_checkpoint(filename):
+    with open(filename) as f:
+        return f.read().splitlines()
+
+
+def test_stop_writes_checkpoint(s3_bucket_config, tmp_path):
+    """Test files not uploaded or failed are written relative to directory."""
+    directory = str(tmp_path / "data")
+    checkpoint = str(tmp_path / "left.txt")
+    uploader = make_uploader(s3_bucket_config, directory, checkpoint=checkpoint)
+
+    queue = uploader._new_queue([os.path.join(directory, n) for n in "abc"])
+    queue.failed.append(os.path.join(directory, "sub", "x"))
+    uploader.queues = [queue]
+
+    with pytest.raises(SystemExit) as exc_info:
+        uploader.stop()
+
+    assert exc_info.value.code == 1
+    assert queue.filenames == []
+    assert read_checkpoint(checkpoint) == ["a", "b", "c", os.path.join("sub", "x")]
+
+
+def test_stop_waits_for_uploads_in_progress(s3_bucket_config, tmp_path):
+    """Test the file being uploaded finishes, and nothing more is started."""
+    uploader = make_uploader(s3_bucket_config, str(tmp_path))
+    started = threading.Event()
+    finish = threading.Event()
+    transferred = []
+
+    def transfer(filename, bucket):
+        started.set()
+        finish.wait(5)
+        transferred.append(filename)
+
+    queue = uploader._new_queue(["a", "b", "c"])
+    queue._connect = Mock()
+    queue._transfer = transfer
+    uploader.queues = [queue]
+    queue.start()
+    assert started.wait(1)
+
+    threading.Timer(0.2, finish.set).start()
+    with pytest.raises(SystemExit):
+        uploader.stop()
+
+    assert transferred == ["c"]
+    assert uploader.remaining == ["a", "b"]
+    queue.join(1)
+    assert not queue.is_alive()
+
+
+def test_stop_aborts_multipart_after_timeout(s3_bucket_config, tmp_path):
+    """Test multipart uploads still going at the deadline are aborted."""
+    uploader = make_uploader(s3_bucket_config, str(tmp_path), drain_timeout=0.1)
+    started = threading.Event()
+    stuck = threading.Event()
+
+    def transfer(filename, bucket):
+        queue.uploads["upload-id"] = "prefix/c"
+        started.set()
+        stuck.wait(5)
+
+    queue = uploader._new_queue(["a", "b", "c"])
+    queue._connect = Mock()
+    queue._transfer = transfer
+    uploader.queues = [queue]
+    queue.start()
+    assert started.wait(1)
+
+    client = Mock()
+    with patch.object(uploader.bucket, "get_new") as get_new:
+        get_new.return_value.meta.client = client
+        with pytest.raises(SystemExit):
+            uploader.stop()
+    stuck.set()
+
+    client.abort_multipart_upload.assert_called_once_with(
+        Bucket="test-bucket", Key="prefix/c", UploadId="upload-id"
+    )
+    # The file in progress didn't finish, so it's left to do
+    assert uploader.remaining == ["a", "b", "c"]
+
+
+def test_stop_lists_stream_and_unqueued_files(s3_bucket_config, tmp_path):
+    """Test files on a stream, or not yet put on it, are remaining."""
+    uploader = make_uploader(s3_bucket_config, str(tmp_path))
+    stream = Queue()
+    stream.put("a")
+    stream.put(("b", b"data"))
+    stream.put(None)
+    queue = uploader._new_queue(stream)
+    uploader.queues = [queue]
+    uploader._pending = [iter(["c", "d"])]
+
+    with pytest.raises(SystemExit):
+        uploader.stop()
+
+    assert uploader.remaining == ["a", "b", "c", "d"]
+
+
+def test_stop_while_stream_full(s3_bucket_config, tmp_path):
+    """Test the file waiting to go on a full stream is in the checkpoint."""
+    directory = str(tmp_path)
+    checkpoint = str(tmp_path / "left.txt")
+    uploader = make_uploader(s3_bucket_config, directory, checkpoint=checkpoint)
+    filenames = [os.path.join(directory, "f{:02}".format(i)) for i in range(10)]
+
+    class FullQueue(Queue):
+        def put(self, item, block=True, timeout=None):
+            if self.full():
+                # As the signal handler would, while we're waiting
+                uploader.stop()
+            super(FullQueue, self).put(item, block, timeout)
+
+    stream = FullQueue(maxsize=1)
+    uploader.queues = [uploader._new_queue(stream)]
+    uploader._start_lanes = lambda: [stream]
+
+    with pytest.raises(SystemExit):
+        uploader._upload_stream(filenames)
+
+    assert read_checkpoint(checkpoint) == [os.path.basename(f) for f in filenames]
+
+
+def test_stop_while_walking(mock_aws_s3, s3_bucket_config, temp_directory, tmp_path):
+    """Test stopping before any files are queued leaves them all to do."""
+    checkpoint = str(tmp_path / "left.txt")
+    uploader = make_uploader(s3_bucket_config, temp_directory, checkpoint=checkpoint)
+
+    with patch.object(uploader, "get_filenames", side_effect=uploader.stop):
+        with pytest.raises(SystemExit):
+            uploader.upload()
+
+    assert sorted(read_checkpoint(checkpoint)) == [
+        "file1.txt",
+        "file2.txt",
+        os.path.join("subdir", "file3.txt"),
+        os.path.join("subdir", "nested", "file4.txt"),
+    ]
+
+
+def test_stop_inside_generator(s3_bucket_config, tmp_path, capsys):
+    """Test no checkpoint is written if the files left can't all be listed."""
+    checkpoint = str(tmp_path / "left.txt")
+    uploader = make_uploader(s3_bucket_config, str(tmp_path), checkpoint=checkpoint)
+
+    def filenames():
+        yield "a"
+        # As the signal handler would, while we're finding the next file
+        uploader.stop()
+        yield "b"
+
+    pending = filenames()
+    uploader._pending = [pending]
+    with pytest.raises(SystemExit):
+        next(pending)
+        next(pending)
+
+    assert not os.path.exists(checkpoint)
+    assert "no checkpoint was written" in capsys.readouterr().err
+
+
+def test_stop_lists_prefix_queue(s3_bucket_config, tmp_path):
+    """Test files spread across prefixes are remaining."""
+    uploader = make_uploader(s3_bucket_config, str(tmp_path))
+    stream = PrefixQueue(lambda item: item.split("/")[0])
+    for filename in ["x/1", "x/2", "y/1"]:
+        stream.put(filename)
+    uploader.queues = [uploader._new_queue(stream)]
+
+    with pytest.raises(SystemExit):
+        uploader.stop()
+
+    assert uploader.remaining == ["x/1", "y/1", "x/2"]
+
+
+def test_stop_twice_exits_at_once(s3_bucket_config, tmp_path):
+    """Test stopping while already stopping doesn't wait again."""
+    uploader = make_uploader(s3_bucket_config, str(tmp_path))
+    uploader._stopping = True
+
+    with patch.object(uploader, "_drain") as drain:
+        with pytest.raises(SystemExit):
+            uploader.stop()
+
+    drain.assert_not_called()
+
+
+def test_checkpoint_uses_nul_for_newlines(s3_bucket_config, tmp_path):
+    """Test filenames containing newlines are NUL separated."""
+    checkpoint = str(tmp_path / "left.txt")
+    uploader = make_uploader(s3_bucket_config, None, checkpoint=checkpoint)
+
+    uploader._write_checkpoint(["a\nb", "c"])
+
+    with open(checkpoint, "rb") as f:
+        assert f.read() == b"a\nb\0c\0"
@@ -0,0 +1,116 @@
+"""
+Tests for uploading a stream of unknown length with S3StreamUploader.
+"""
+
+import io
+import os
+from unittest.mock import patch
+
+from s3peat import S3Bucket, S3PartQueue, S3StreamUploader, upload_stream
+
+MiB = 1024 * 1024
+
+
+class Pipe(io.RawIOBase):
+    """A stream which returns at most `size` bytes from each read."""
+
+    def __init__(self, data, size):
+        self._data = io.BytesIO(data)
+        self._size = size
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        return self._data.read(min(size, self._size))
+
+
+def _body(client, key):
+    return client.get_object(Bucket="test-bucket", Key=key)["Body"].read()
+
+
+def test_read_short_reads(s3_bucket_config):
+    """Test whole parts are read from a stream giving short reads."""
+    bucket = S3Bucket(**s3_bucket_config)
+    uploader = S3StreamUploader(Pipe(b"abcdefg", 2), "key", "", bucket, part_size=3)
+
+    assert list(uploader._parts([])) == [b"abc", b"def", b"g"]
+    assert uploader.size == 7
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_stream_small(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test a small stream is uploaded in one request."""
+    bucket = S3Bucket(**s3_bucket_config)
+
+    with patch.object(S3PartQueue, "_put_part") as put_part:
+        result = upload_stream(
+            io.BytesIO(b"small"),
+            "dump.sql",
+            bucket,
+            prefix="backups",
+            concurrency=4,
+            handle_signals=False,
+        )
+
+    assert result == []
+    put_part.assert_not_called()
+    assert _body(mock_aws_s3, "backups/dump.sql") == b"small"
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_stream_multipart(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test a large stream is uploaded in parts, several at once."""
+    bucket = S3Bucket(**s3_bucket_config)
+    data = os.urandom(17 * MiB)
+    uploader = S3StreamUploader(
+        Pipe(data, MiB),
+        "dump.sql",
+        "backups",
+        bucket,
+        concurrency=3,
+        handle_signals=False,
+        checksum="md5",
+        multipart_threshold=8 * MiB,
+        part_size=5 * MiB,
+    )
+
+    result = uploader.upload()
+
+    assert result == []
+    assert uploader.total == 4
+    assert uploader.count == 4
+    assert uploader.size == len(data)
+    assert _body(mock_aws_s3, "backups/dump.sql") == data
+    assert uploader.checksums["dump.sql"].endswith("-4")
+    parts = [q for q in uploader.queues if isinstance(q, S3PartQueue)]
+    assert len(parts) == 3
+    assert sum(len(q.parts) for q in parts) == 4
+
+
+@patch("time.sleep")  # Mock sleep to speed up test
+def test_upload_stream_failure(mock_sleep, mock_aws_s3, s3_bucket_config):
+    """Test the upload is aborted when a part fails."""
+    bucket = S3Bucket(**s3_bucket_config)
+    put_part = S3PartQueue._put_part
+
+    def fail_second(queue, bucket, key, upload_id, number, part):
+        if number == 2:
+            raise IOError("Upload failed")
+        return put_part(queue, bucket, key, upload_id, number, part)
+
+    with patch.object(S3PartQueue, "_put_part", fail_second):
+        result = upload_stream(
+            io.BytesIO(os.urandom(12 * MiB)),
+            "dump.sql",
+            bucket,
+            concurrency=2,
+            handle_signals=False,
+            multipart_threshold=8 * MiB,
+            part_size=5 * MiB,
+        )
+
+    assert result == ["dump.sql"]
+    uploads = mock_aws_s3.list_multipart_uploads(Bucket="test-bucket")
+    assert not uploads.get("Uploads")
+    assert "Contents" not in mock_aws_s3.list_objects_v2(Bucket="test-bucket")
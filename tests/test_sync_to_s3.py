@@ -62,7 +62,7 @@ def test_sync_to_s3_with_failures(
         mock_resource.return_value = mock_s3_resource
         mock_s3_resource.Bucket.return_value = mock_bucket
         mock_s3_resource.meta.client.head_bucket.return_value = None
-        mock_bucket.put_object.side_effect = Exception("Upload failed")
+        mock_bucket.meta.client.put_object.side_effect = Exception("Upload failed")
 
         with patch("time.sleep"):  # Mock sleep to speed up test
             result = sync_to_s3(
@@ -0,0 +1,136 @@
+"""
+Tests for the directory watchers and S3Uploader.watch.
+"""
+
+import os
+import time
+
+import pytest
+
+from s3peat import S3Bucket, S3Uploader
+from s3peat.watch import InotifyWatcher, PollingWatcher, Watcher, get_watcher
+
+
+def _write(path, content="content"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def _poll_until(watcher, count, timeout=5.0):
+    """Poll `watcher` until `count` filenames have settled."""
+    found = []
+    deadline = time.time() + timeout
+    while len(found) < count and time.time() < deadline:
+        found.extend(watcher.poll(0.05))
+    return found
+
+
+class ListWatcher(Watcher):
+    """Watcher which reports a fixed list of filenames, then closes."""
+
+    def __init__(self, filenames):
+        super(ListWatcher, self).__init__(None, settle=0)
+        self.filenames = filenames
+
+    def _wait(self, timeout):
+        for filename in self.filenames:
+            self._touch(filename)
+        self.filenames = []
+
+    def _ready(self):
+        ready = super(ListWatcher, self)._ready()
+        if not ready:
+            self.close()
+        return ready
+
+
+def test_polling_watcher_ignores_existing(temp_directory):
+    """Test polling only reports files changed after it starts."""
+    watcher = PollingWatcher(temp_directory, settle=0, interval=0)
+
+    assert watcher.poll(0) == []
+
+
+def test_polling_watcher_new_and_modified(temp_directory):
+    """Test polling reports new and modified files."""
+    watcher = PollingWatcher(temp_directory, settle=0, interval=0)
+
+    new_file = os.path.join(temp_directory, "new", "file5.txt")
+    _write(new_file)
+    _write(os.path.join(temp_directory, "file1.txt"), "changed content")
+
+    found = _poll_until(watcher, 2)
+
+    assert sorted(found) == sorted(
+        [new_file, os.path.join(temp_directory, "file1.txt")]
+    )
+
+
+def test_watcher_settles_files(temp_directory):
+    """Test files aren't reported until they stop changing."""
+    watcher = PollingWatcher(temp_directory, settle=60, interval=0)
+    _write(os.path.join(temp_directory, "file5.txt"))
+
+    assert watcher.poll(0) == []
+    assert len(watcher._pending) == 1
+
+
+def test_watcher_skips_removed_files(temp_directory):
+    """Test files removed while settling aren't reported."""
+    watcher = PollingWatcher(temp_directory, settle=0, interval=0)
+    watcher._touch(os.path.join(temp_directory, "missing.txt"))
+
+    assert watcher.poll(0) == []
+
+
+def test_inotify_watcher(temp_directory):
+    """Test inotify reports files, including in new directories."""
+    try:
+        watcher = InotifyWatcher(temp_directory, settle=0)
+    except OSError:
+        pytest.skip("inotify is not available")
+
+    try:
+        new_file = os.path.join(temp_directory, "subdir", "file5.txt")
+        nested_file = os.path.join(temp_directory, "newdir", "deeper", "file6.txt")
+        _write(new_file)
+        _write(nested_file)
+
+        found = _poll_until(watcher, 2)
+    finally:
+        watcher.close()
+
+    assert sorted(set(found)) == sorted([new_file, nested_file])
+
+
+def test_get_watcher(temp_directory):
+    """Test getting a watcher for a directory."""
+    watcher = get_watcher(temp_directory)
+    try:
+        assert isinstance(watcher, (InotifyWatcher, PollingWatcher))
+    finally:
+        watcher.close()
+
+
+def test_upload_watch(mock_aws_s3, s3_bucket_config, temp_directory):
+    """Test watching uploads existing and changed files."""
+    bucket = S3Bucket(**s3_bucket_config)
+    new_file = os.path.join(temp_directory, "file5.txt")
+    _write(new_file)
+
+    uploader = S3Uploader(
+        temp_directory, "prefix", bucket, concurrency=2, handle_signals=False
+    )
+    result = uploader.watch(watcher=ListWatcher([new_file]))
+
+    assert result == []
+    assert uploader.total == 6
+    assert uploader.count == 6
+    # Files being watched may still be written to, so they're never mapped
+    assert not any(queue.map_files for queue in uploader.queues)
+
+    objects = mock_aws_s3.list_objects_v2(Bucket="test-bucket")
+    keys = [o["Key"] for o in objects["Contents"]]
+    assert "prefix/file5.txt" in keys
+    assert len(keys) == 5